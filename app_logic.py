@@ -1,41 +1,422 @@
+import math
+import os
+import re
+
 import numpy as np
-import rasterio
 
+import geodesy
+import timing
+
+# Размер файла .hgt в байтах -> число отсчётов по стороне тайла
+# (1201 - SRTM3, 3 угловые секунды; 3601 - SRTM1, 1 угловая секунда)
+HGT_SIZES = {1201 * 1201 * 2: 1201, 3601 * 3601 * 2: 3601}
+HGT_VOID = -32768
+MAPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "maps")
+
+# Предел числа точек профиля при адаптивной выборке (num_points=None)
+MAX_PROFILE_POINTS = 20000
+
+_HGT_NAME_RE = re.compile(r"^([NS])(\d{2})([EW])(\d{3})", re.IGNORECASE)
+
+
+def parse_hgt_name(path):
+    """Возвращает (lat, lon) юго-западного угла тайла по имени вида N40E018.hgt."""
+    match = _HGT_NAME_RE.match(os.path.basename(path))
+    if match is None:
+        raise ValueError(f"Имя файла не похоже на тайл SRTM: {path}")
+    ns, lat, ew, lon = match.groups()
+    lat = int(lat) if ns.upper() == "N" else -int(lat)
+    lon = int(lon) if ew.upper() == "E" else -int(lon)
+    return lat, lon
+
+
+def sample_elevations(matrix, transform, lats, lons, method="nearest"):
+    """
+    Выборка высот из уже загруженной матрицы для массивов координат одним
+    векторным обращением. transform - аффинное преобразование (a, b, c, d, e, f)
+    в порядке rasterio (без поворота). method: "nearest" или "bilinear".
+    """
+    a, _, left, _, e, top = tuple(transform)[:6]
+    n_rows, n_cols = matrix.shape
+    x = (np.asarray(lons, dtype=float) - left) / a
+    y = (np.asarray(lats, dtype=float) - top) / e
+
+    if method == "nearest":
+        cols = np.clip(np.floor(x).astype(np.intp), 0, n_cols - 1)
+        rows = np.clip(np.floor(y).astype(np.intp), 0, n_rows - 1)
+        return matrix[rows, cols].astype(float)
+    if method != "bilinear":
+        raise ValueError(f"Неизвестный метод интерполяции: {method}")
+
+    # Координаты относительно центров пикселей
+    x -= 0.5
+    y -= 0.5
+    col0 = np.clip(np.floor(x).astype(np.intp), 0, max(n_cols - 2, 0))
+    row0 = np.clip(np.floor(y).astype(np.intp), 0, max(n_rows - 2, 0))
+    col1 = np.minimum(col0 + 1, n_cols - 1)
+    row1 = np.minimum(row0 + 1, n_rows - 1)
+    fx = np.clip(x - col0, 0.0, 1.0)
+    fy = np.clip(y - row0, 0.0, 1.0)
+
+    top_row = matrix[row0, col0] * (1 - fx) + matrix[row0, col1] * fx
+    bottom_row = matrix[row1, col0] * (1 - fx) + matrix[row1, col1] * fx
+    return top_row * (1 - fy) + bottom_row * fy
+
+
+class Raster:
+    """Растр высот в памяти: матрица и её аффинное преобразование."""
+    __slots__ = ("matrix", "transform")
+
+    def __init__(self, matrix, transform):
+        self.matrix = matrix
+        self.transform = tuple(transform)[:6]
+
+    @classmethod
+    def from_extent(cls, matrix, extent):
+        """Растр по матрице и границам (Left, Right, Bottom, Top), например из TileIndex.mosaic."""
+        left, right, bottom, top = extent
+        n_rows, n_cols = matrix.shape
+        return cls(matrix, ((right - left) / n_cols, 0.0, left, 0.0, -(top - bottom) / n_rows, top))
+
+    @property
+    def extent(self):
+        """Границы (Left, Right, Bottom, Top) для matplotlib."""
+        a, _, left, _, e, top = self.transform
+        n_rows, n_cols = self.matrix.shape
+        return [left, left + a * n_cols, top + e * n_rows, top]
+
+    @property
+    def grid(self):
+        """
+        Сетка центров пикселей: ((lat0, dlat), (lon0, dlon)), центры лежат
+        в точках lat0 + i * dlat, lon0 + j * dlon.
+        """
+        a, _, left, _, e, top = self.transform
+        return (top + e / 2, e), (left + a / 2, a)
+
+    def sample(self, lats, lons, method="nearest"):
+        return sample_elevations(self.matrix, self.transform, lats, lons, method)
+
+
+class HGTTile(Raster):
+    """
+    Тайл SRTM, отображённый в память через np.memmap.
+    Файл .hgt - это сетка big-endian int16 без заголовка, поэтому открытие
+    не читает данные: страницы подгружаются ОС только при обращении к ним.
+    """
+    __slots__ = ("path", "lat", "lon", "size")
+
+    def __init__(self, path):
+        self.path = path
+        self.lat, self.lon = parse_hgt_name(path)
+        file_size = os.path.getsize(path)
+        if file_size not in HGT_SIZES:
+            raise ValueError(f"Неизвестный размер файла .hgt ({file_size} байт): {path}")
+        self.size = HGT_SIZES[file_size]
+        # Центры крайних пикселей лежат точно на целых градусах
+        half = self.step / 2
+        super().__init__(
+            np.memmap(path, dtype=">i2", mode="r", shape=(self.size, self.size)),
+            (self.step, 0.0, self.lon - half, 0.0, -self.step, self.lat + 1 + half),
+        )
+
+    @property
+    def step(self):
+        """Шаг сетки в градусах."""
+        return 1.0 / (self.size - 1)
+
+
+def open_hgt(path):
+    """Открывает тайл .hgt без чтения его содержимого в память."""
+    return HGTTile(path)
+
+
+def open_raster(path):
+    """Открывает тайл .hgt через memmap, а прочие растры читает через rasterio."""
+    try:
+        return open_hgt(path)
+    except ValueError:
+        # Файл с нестандартным именем или размером
+        pass
+    # rasterio (GDAL) загружается только для растров, отличных от .hgt: это заметно ускоряет запуск
+    import rasterio
 
-def load_hgt_matrix(path):
-    """Читает файл и возвращает матрицу высот и границы (extent) для отрисовки."""
     with rasterio.open(path) as src:
         # Читаем первый канал (высоты)
-        matrix = src.read(1)
-        # Определяем границы (Left, Right, Bottom, Top) для matplotlib
-        bounds = src.bounds
-        extent = [bounds.left, bounds.right, bounds.bottom, bounds.top]
+        return Raster(src.read(1), src.transform)
+
+
+def file_identity(path):
+    """Идентичность файла для кэшей: абсолютный путь, размер и время изменения."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def sidecar_path(path, suffix):
+    """Путь вспомогательного файла рядом с тайлом, например N40E018.hgt.pyramid.npz."""
+    return path + suffix
+
+
+def tile_name(lat, lon):
+    """Имя тайла SRTM по целочисленным координатам юго-западного угла."""
+    ns = "N" if lat >= 0 else "S"
+    ew = "E" if lon >= 0 else "W"
+    return f"{ns}{abs(lat):02d}{ew}{abs(lon):03d}"
+
+
+class TileIndex:
+    """
+    Индекс каталога тайлов .hgt с ключом (floor(lat), floor(lon)).
+    Каталог сканируется один раз, а тайлы открываются (memmap) при первом обращении.
+    """
+
+    def __init__(self, root=None):
+        self.paths = {}
+        self._tiles = {}
+        if root is not None:
+            self.scan(root)
+
+    def scan(self, root):
+        """Рекурсивно добавляет в индекс все тайлы из каталога."""
+        for dirpath, _, filenames in os.walk(root):
+            for name in sorted(filenames):
+                if not name.lower().endswith(".hgt"):
+                    continue
+                try:
+                    key = parse_hgt_name(name)
+                except ValueError:
+                    continue
+                self.paths.setdefault(key, os.path.join(dirpath, name))
+
+    def add(self, path):
+        """Добавляет (или заменяет) тайл и возвращает его ключ."""
+        key = parse_hgt_name(path)
+        self.paths[key] = path
+        self._tiles.pop(key, None)
+        return key
+
+    def __contains__(self, key):
+        return key in self.paths
+
+    def tile(self, key):
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = self._tiles[key] = open_hgt(self.paths[key])
+        return tile
+
+    def preload(self, keys=None):
+        """
+        Читает тайлы keys (по умолчанию все) в память вместо memmap: частые
+        выборки по тем же тайлам (сервис, перетаскивание точек) не ждут диска.
+        """
+        for key in list(self.paths) if keys is None else keys:
+            if key in self.paths:
+                tile = self.tile(key)
+                if isinstance(tile.matrix, np.memmap):
+                    tile.matrix = np.array(tile.matrix, dtype=np.int16)
+
+    def route_keys(self, p1, p2):
+        """Ключи всех тайлов, через которые проходит отрезок p1 -> p2 (есть они в индексе или нет)."""
+        key1 = (math.floor(p1[0]), math.floor(p1[1]))
+        if key1 == (math.floor(p2[0]), math.floor(p2[1])):
+            # Оба конца в одном тайле - отрезок из него не выходит
+            return [key1]
+        t = np.unique(np.concatenate((
+            [0.0, 1.0], _line_crossings(p1[0], p2[0]), _line_crossings(p1[1], p2[1]))))
+        t = np.concatenate(([0.0], (t[:-1] + t[1:]) / 2, [1.0]))
+        lats = p1[0] + t * (p2[0] - p1[0])
+        lons = p1[1] + t * (p2[1] - p1[1])
+        return sorted(set(zip(np.floor(lats).astype(int).tolist(), np.floor(lons).astype(int).tolist())))
+
+    def route_grid(self, p1, p2):
+        """Самая мелкая сетка среди тайлов на трассе (узлы тайлов SRTM лежат на кратных шагу градусах)."""
+        steps = [self.tile(key).step for key in self.route_keys(p1, p2) if key in self.paths]
+        step = min(steps) if steps else 1.0 / 1200
+        return (0.0, step), (0.0, step)
+
+    def missing(self, lats, lons):
+        """Имена тайлов, которые нужны для точек, но отсутствуют в индексе."""
+        keys = set(zip(np.floor(lats).astype(int).tolist(), np.floor(lons).astype(int).tolist()))
+        return sorted(tile_name(*key) for key in keys if key not in self.paths)
+
+    def sample(self, lats, lons, method="nearest", fill_value=np.nan):
+        """
+        Высоты для массивов координат. Каждая точка направляется в свой тайл
+        по floor(lat)/floor(lon), выборка делается одним вызовом на тайл.
+        Точки без тайла получают fill_value.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        elevations = np.full(lats.shape, fill_value, dtype=float)
+        # Ключ тайла кодируется одним целым числом, чтобы группировка была одномерной
+        codes = (np.floor(lats).astype(np.int64) + 90) * 360 + (np.floor(lons).astype(np.int64) + 180)
+        unique_codes = np.unique(codes)
+        for code in unique_codes.tolist():
+            lat, lon = code // 360 - 90, code % 360 - 180
+            if (lat, lon) not in self.paths:
+                continue
+            sel = codes == code if len(unique_codes) > 1 else slice(None)
+            elevations[sel] = self.tile((lat, lon)).sample(lats[sel], lons[sel], method)
+        return elevations
+
+    def mosaic(self, keys):
+        """
+        Склеивает тайлы в одну матрицу для отрисовки. Соседние тайлы SRTM
+        делят крайнюю строку/столбец, поэтому шаг между ними size - 1.
+        Возвращает (matrix, extent).
+        """
+        keys = sorted(set(keys))
+        tiles = [self.tile(key) for key in keys]
+        if len(tiles) == 1:
+            return tiles[0].matrix, tiles[0].extent
+        size = tiles[0].size
+        if any(tile.size != size for tile in tiles):
+            raise ValueError("Нельзя склеить тайлы разного разрешения")
+
+        lat_min = min(tile.lat for tile in tiles)
+        lat_max = max(tile.lat for tile in tiles)
+        lon_min = min(tile.lon for tile in tiles)
+        lon_max = max(tile.lon for tile in tiles)
+        cell = size - 1
+        matrix = np.full(((lat_max - lat_min + 1) * cell + 1, (lon_max - lon_min + 1) * cell + 1),
+                         HGT_VOID, dtype=np.int16)
+        for tile in tiles:
+            row = (lat_max - tile.lat) * cell
+            col = (tile.lon - lon_min) * cell
+            matrix[row:row + size, col:col + size] = tile.matrix
+
+        half = tiles[0].step / 2
+        extent = [lon_min - half, lon_max + 1 + half, lat_min - half, lat_max + 1 + half]
         return matrix, extent
 
 
+def _line_crossings(u1, u2, offset=0.0):
+    """Параметры t в (0, 1), где отрезок u1 -> u2 пересекает линии u = k + offset."""
+    if u1 == u2:
+        return np.empty(0)
+    lo, hi = min(u1, u2), max(u1, u2)
+    k = np.arange(np.floor(lo - offset) + 1, np.ceil(hi - offset))
+    return (k + offset - u1) / (u2 - u1)
+
+
+def route_parameters(p1, p2, grid, method="nearest", max_points=MAX_PROFILE_POINTS):
+    """
+    Доли трассы t (0..1) для выборки, которая проходит каждую ячейку сетки
+    на пути (обход ячеек в духе DDA). grid - ((lat0, dlat), (lon0, dlon)) как
+    у Raster.grid. Для "nearest" берётся по точке внутри каждой ячейки
+    (между пересечениями границ ячеек), для "bilinear" - точки пересечения
+    линий сетки, где билинейная поверхность меняет наклон. Если точек больше
+    max_points, используется равномерный шаг с max_points точками.
+    """
+    (lat0, dlat), (lon0, dlon) = grid
+    offset = 0.5 if method == "nearest" else 0.0
+    t = np.unique(np.concatenate((
+        [0.0, 1.0],
+        _line_crossings((p1[0] - lat0) / dlat, (p2[0] - lat0) / dlat, offset),
+        _line_crossings((p1[1] - lon0) / dlon, (p2[1] - lon0) / dlon, offset),
+    )))
+    if method == "nearest":
+        t = np.concatenate(([0.0], (t[:-1] + t[1:]) / 2, [1.0]))
+    if max_points is not None and t.size > max_points:
+        t = np.linspace(0.0, 1.0, max_points)
+    return t
+
+
+def load_hgt_matrix(path):
+    """Читает файл и возвращает матрицу высот и границы (extent) для отрисовки."""
+    raster = open_raster(path)
+    return raster.matrix, raster.extent
+
+
 def haversine(coord1, coord2):
-    R = 6371e3
-    lat1, lon1 = np.radians(coord1)
-    lat2, lon2 = np.radians(coord2)
-    dlat, dlon = lat2 - lat1, lon2 - lon1
-    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
-    return R * 2 * np.arcsin(np.sqrt(a))
-
-
-def get_elevation_profile(raster_path, p1, p2, num_points=250):
-    """p1, p2 это кортежи (lat, lon)"""
-    with rasterio.open(raster_path) as src:
-        # Создаем массив точек между началом и концом
+    """Расстояние между точками (lat, lon), м; элементы могут быть массивами (см. geodesy.haversine)."""
+    return geodesy.haversine(coord1[0], coord1[1], coord2[0], coord2[1])
+
+
+def get_elevation_profile(source, p1, p2, num_points=250, method="nearest", cache=None,
+                          max_points=MAX_PROFILE_POINTS):
+    """
+    p1, p2 это кортежи (lat, lon).
+    source - уже открытый растр (Raster/HGTTile), TileIndex (трасса может
+    проходить через несколько тайлов) или путь к файлу.
+    num_points=None - адаптивная выборка: по точке на каждую ячейку растра
+    на трассе (не более max_points), шаг профиля при этом неравномерный.
+    cache - profile_cache.ProfileCache: при попадании растр не читается.
+    """
+    if cache is not None:
+        key = cache.key(source, p1, p2, num_points, method, max_points)
+        if key is not None:
+            profile = cache.get(key)
+            timing.count("profile.cache_hit" if profile is not None else "profile.cache_miss")
+            if profile is None:
+                profile = cache.put(key, get_elevation_profile(source, p1, p2, num_points, method,
+                                                               max_points=max_points))
+            return profile
+
+    if isinstance(source, (str, os.PathLike)):
+        source = open_raster(source)
+
+    # Создаем массив точек между началом и концом
+    if num_points is None:
+        with timing.span("profile.route"):
+            grid = source.route_grid(p1, p2) if isinstance(source, TileIndex) else source.grid
+            t = route_parameters(p1, p2, grid, method, max_points)
+        lats = p1[0] + t * (p2[0] - p1[0])
+        lons = p1[1] + t * (p2[1] - p1[1])
+    else:
         lats = np.linspace(p1[0], p2[0], num_points)
         lons = np.linspace(p1[1], p2[1], num_points)
 
-        # В rasterio.sample передаются пары (lon, lat)
-        coords = list(zip(lons, lats))
-        elevations = [val[0] for val in src.sample(coords)]
+    if isinstance(source, TileIndex):
+        missing = source.missing(lats, lons)
+        if missing:
+            raise ValueError("Нет тайлов высот для: " + ", ".join(missing))
+    with timing.span("profile.sample"):
+        elevations = source.sample(lats, lons, method)
+
+    # Расстояния в метрах от первой точки (одним векторным проходом)
+    distances = haversine(p1, (lats, lons))
+    return distances, elevations
+
+
+def get_elevation_profiles(source, starts, ends, num_points=250, method="nearest", cache=None):
+    """
+    Пакетный вариант get_elevation_profile для многих трасс с одинаковым
+    числом точек: starts, ends - массивы (n, 2) координат (lat, lon).
+    Возвращает (dist, elev) формы (n, num_points). Высоты выбираются одним
+    обращением к источнику на весь пакет; точки вне тайлов TileIndex - NaN.
+    С cache найденные профили берутся из кэша, а новые туда добавляются.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = open_raster(source)
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    n = len(starts)
+    dist = np.empty((n, num_points))
+    elev = np.empty((n, num_points))
+
+    todo = np.arange(n)
+    keys = None
+    if cache is not None:
+        keys = [cache.key(source, tuple(p1), tuple(p2), num_points, method) for p1, p2 in zip(starts, ends)]
+        found = np.zeros(n, dtype=bool)
+        for i, key in enumerate(keys):
+            profile = cache.get(key) if key is not None else None
+            if profile is not None:
+                dist[i], elev[i] = profile
+                found[i] = True
+        todo = np.flatnonzero(~found)
 
-        # Расстояния в метрах от первой точки
-        distances = [haversine(p1, (lats[i], lons[i])) for i in range(num_points)]
-        return np.array(distances), np.array(elevations)
+    if todo.size:
+        t = np.linspace(0.0, 1.0, num_points)
+        lat1, lon1 = starts[todo, :1], starts[todo, 1:]
+        lats = lat1 + t * (ends[todo, :1] - lat1)
+        lons = lon1 + t * (ends[todo, 1:] - lon1)
+        elev[todo] = source.sample(lats.ravel(), lons.ravel(), method).reshape(lats.shape)
+        dist[todo] = geodesy.haversine(lat1, lon1, lats, lons)
+        if keys is not None:
+            cache.put_many([(keys[i], (dist[i], elev[i])) for i in todo.tolist() if keys[i] is not None])
+    return dist, elev
 
 
 import numpy as np
@@ -47,14 +428,15 @@ def calculate_earth_curvature(distances):
     Используется формула h = d^2 / (2 * R_eff), где R_eff ~ 8500 км
     (с учетом стандартной атмосферной рефракции k=4/3).
     """
-    R_eff = 6371000 * (4 / 3)  # Эффективный радиус Земли
-    return (distances ** 2) / (2 * R_eff)
+    return (distances ** 2) / (2 * geodesy.EFFECTIVE_EARTH_RADIUS)
 
 
 def get_fresnel_zone(distances, total_dist, frequency_ghz):
     """
     Рассчитывает радиус первой зоны Френеля в каждой точке трассы.
     R = 17.31 * sqrt( (d1 * d2) / (f * D) )
+    Для пакета трасс distances имеет форму (n_links, n_points),
+    а total_dist и frequency_ghz - форму (n_links, 1).
     """
     d1 = distances  # Расстояние от передатчика
     d2 = total_dist - distances  # Расстояние до приемника
@@ -70,8 +452,9 @@ def get_earth_arc(distances):
     Рассчитывает высоту дуги земной поверхности (горб).
     Используем формулу: h = (d * (D - d)) / (2 * R_eff)
     где d - текущее расстояние, D - общая дистанция.
+    Работает и для пакета трасс формы (n_links, n_points).
     """
-    D = distances[-1]
-    R_eff = 6371000 * (4/3)
+    D = distances[..., -1:]
+    R_eff = geodesy.EFFECTIVE_EARTH_RADIUS
     # Эта формула дает 0 в начале и конце трассы и максимум в середине
     return (distances * (D - distances)) / (2 * R_eff)
\ No newline at end of file
@@ -0,0 +1,276 @@
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import app_logic
+import link_analysis
+
+# Поля LinkParams, которые можно задать в строке входного файла
+PARAM_FIELDS = ("h1", "h2", "freq_mhz", "reliability", "intervals", "power", "sensitivity",
+                "feeder_loss", "ant_diam", "ant_type", "surface")
+TEXT_FIELDS = ("ant_type", "surface")
+OUTPUT_FIELDS = ("id", "interval", "distance_m", "H0", "H_g", "h0_rel", "Wp", "P_rx", "margin", "passed",
+                 "T_i", "error")
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def read_rows(path):
+    """
+    Построчное чтение трасс из CSV (с заголовком) или JSONL - файл целиком в память не читается.
+    Вместо строки JSONL, которую не удалось разобрать, выдаётся ValueError:
+    parse_row превращает её в ошибку этой строки, а не всего расчёта.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield ValueError(f"Неверный JSON: {e}")
+
+
+# Допустимые значения текстовых полей LinkParams
+TEXT_VALUES = {"ant_type": link_analysis.ANT_TYPES, "surface": link_analysis.SURFACE_TYPES}
+
+
+def parse_row(row, number):
+    """
+    (id, (lat1, lon1), (lat2, lon2), поля LinkParams) из строки входного файла.
+    Неверная строка (не объект, нет координат, неизвестный тип антенны или
+    поверхности, трасса нулевой длины) - KeyError, TypeError или ValueError.
+    """
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise TypeError(f"строка должна быть объектом, а не {type(row).__name__}")
+    link_id = row.get("id") or str(number)
+    p1 = (float(row["lat1"]), float(row["lon1"]))
+    p2 = (float(row["lat2"]), float(row["lon2"]))
+    if p1 == p2:
+        raise ValueError("трасса нулевой длины")
+    fields = {}
+    for name in PARAM_FIELDS:
+        value = row.get(name)
+        if value not in (None, ""):
+            fields[name] = str(value) if name in TEXT_FIELDS else float(value)
+            if name in TEXT_VALUES and fields[name] not in TEXT_VALUES[name]:
+                raise ValueError(f"неизвестное значение {name}: {fields[name]!r}")
+    return link_id, p1, p2, fields
+
+
+def _number(value):
+    """Число для вывода: бесконечности и NaN записываются как пустое значение."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+# Источник высот рабочего процесса (открывается один раз в инициализаторе пула)
+_source = None
+
+
+def _init_worker(tiles_dir):
+    global _source
+    _source = app_logic.TileIndex(tiles_dir)
+
+
+def _process_chunk(rows, first_number, num_points, method):
+    """Рабочий процесс: расчёт пакета строк по источнику высот процесса."""
+    return analyze_rows(_source, rows, first_number, num_points, method)
+
+
+def analyze_rows(source, rows, first_number=0, num_points=250, method="nearest"):
+    """
+    Разбор строк (словарей с lat1, lon1, lat2, lon2 и полями LinkParams),
+    пакетная выборка профилей и расчёт интервалов. Возвращает записи
+    OUTPUT_FIELDS в порядке строк; ошибки строк попадают в поле error.
+    """
+    records = [None] * len(rows)
+    parsed = []
+    for k, row in enumerate(rows):
+        try:
+            parsed.append((k, *parse_row(row, first_number + k)))
+        except (KeyError, TypeError, ValueError) as e:
+            records[k] = {"id": row.get("id") if isinstance(row, dict) else None,
+                          "error": f"Неверная строка: {e!r}"}
+
+    if parsed:
+        defaults = link_analysis.LinkParams()
+        values = {name: [fields.get(name, getattr(defaults, name)) for *_, fields in parsed]
+                  for name in PARAM_FIELDS}
+        params = link_analysis.LinkParams(**{name: v if name in TEXT_FIELDS else np.array(v)
+                                             for name, v in values.items()})
+        starts = np.array([p1 for _, _, p1, _, _ in parsed])
+        ends = np.array([p2 for _, _, _, p2, _ in parsed])
+        dist, elev = app_logic.get_elevation_profiles(source, starts, ends, num_points, method)
+        batch = link_analysis.analyze_links_batch(dist, elev, params)
+        no_data = np.isnan(elev).any(axis=1)
+
+        for n, (k, link_id, *_) in enumerate(parsed):
+            if no_data[n]:
+                records[k] = {"id": link_id, "error": "Нет тайлов высот для трассы"}
+                continue
+            if batch.interval[n] == link_analysis.CODE_NONE:
+                records[k] = {"id": link_id, "error": "Интервал не определён (вырожденная трасса)"}
+                continue
+            records[k] = {
+                "id": link_id,
+                "interval": link_analysis.INTERVALS[batch.interval[n]],
+                "distance_m": _number(batch.total_dist[n]),
+                "H0": _number(batch.H0[n]),
+                "H_g": _number(batch.H_g[n]),
+                "h0_rel": _number(batch.h0_rel[n]),
+                "Wp": _number(batch.Wp[n]),
+                "P_rx": _number(batch.P_rx[n]),
+                "margin": _number(batch.margin[n]),
+                "passed": bool(batch.passed[n]),
+                "T_i": _number(batch.T_i[n]),
+                "error": None,
+            }
+    return records
+
+
+class _Writer:
+    """Вывод результатов в JSONL или CSV (по расширению файла) с дозаписью."""
+
+    def __init__(self, path, offset):
+        self.csv = path.lower().endswith(".csv")
+        mode = "r+" if offset and os.path.exists(path) else "w"
+        self.file = open(path, mode, newline="", encoding="utf-8")
+        # Всё, что записано после последней контрольной точки, отбрасываем
+        self.file.seek(offset)
+        self.file.truncate()
+        if self.csv:
+            self._csv = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+            if offset == 0:
+                self._csv.writeheader()
+
+    def write(self, records):
+        for record in records:
+            if self.csv:
+                self._csv.writerow({k: "" if v is None else v for k, v in record.items()})
+            else:
+                self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def sync(self):
+        """Сбрасывает данные на диск и возвращает смещение конца файла."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _load_checkpoint(path, identity):
+    """(строк сделано, смещение в выходном файле); контрольная точка другого входного файла не используется."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("input") != identity:
+            return 0, 0
+        return int(state["done"]), int(state["offset"])
+    except (OSError, ValueError, KeyError, AttributeError):
+        return 0, 0
+
+
+def _save_checkpoint(path, done, offset, identity):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"done": done, "offset": offset, "input": identity}, f)
+    os.replace(tmp_path, path)
+
+
+def _remove_checkpoint(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def run_batch(input_path, output_path, tiles_dir=app_logic.MAPS_DIR, workers=None, chunk_size=256,
+              num_points=250, method="nearest", resume=True, progress=None):
+    """
+    Потоковый расчёт трасс из input_path (CSV/JSONL: lat1, lon1, lat2, lon2 и
+    необязательные поля LinkParams) с записью результатов в output_path в том же
+    порядке. Строки обрабатываются пакетами по chunk_size в пуле процессов; в
+    работе одновременно не больше 2 * workers пакетов, поэтому память не зависит
+    от размера входного файла. После каждого записанного пакета обновляется
+    контрольная точка (число строк, смещение в выходном файле и идентичность
+    входного файла); при resume прерванный расчёт того же входного файла
+    продолжается с неё. После завершения расчёта контрольная точка удаляется.
+    Возвращает число обработанных строк.
+    """
+    checkpoint_path = output_path + CHECKPOINT_SUFFIX
+    # JSON хранит кортеж списком - сравниваем в том же виде
+    identity = list(app_logic.file_identity(input_path))
+    done, offset = _load_checkpoint(checkpoint_path, identity) if resume else (0, 0)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+
+    rows = itertools.islice(read_rows(input_path), done, None)
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+    writer = _Writer(output_path, offset)
+    try:
+        if workers == 1:
+            _init_worker(tiles_dir)
+            for chunk in chunks:
+                writer.write(_process_chunk(chunk, done, num_points, method))
+                done += len(chunk)
+                _save_checkpoint(checkpoint_path, done, writer.sync(), identity)
+                if progress is not None:
+                    progress(done)
+            _remove_checkpoint(checkpoint_path)
+            return done
+
+        # spawn: рабочие процессы не наследуют потоки и окна интерфейса
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(tiles_dir,)) as executor:
+            pending = {}
+            ready = {}
+            next_submit = next_write = 0
+            number = done
+            exhausted = False
+            try:
+                while True:
+                    # Пакеты в работе и готовые, но ещё не записанные, ограничены max_in_flight
+                    while not exhausted and next_submit - next_write < max_in_flight:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            exhausted = True
+                            break
+                        future = executor.submit(_process_chunk, chunk, number, num_points, method)
+                        pending[future] = (next_submit, len(chunk))
+                        next_submit += 1
+                        number += len(chunk)
+                    if not pending:
+                        break
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        seq, size = pending.pop(future)
+                        ready[seq] = (future.result(), size)
+                    # Результаты пишутся строго в порядке входного файла
+                    while next_write in ready:
+                        records, size = ready.pop(next_write)
+                        writer.write(records)
+                        done += size
+                        next_write += 1
+                        _save_checkpoint(checkpoint_path, done, writer.sync(), identity)
+                        if progress is not None:
+                            progress(done)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        _remove_checkpoint(checkpoint_path)
+        return done
+    finally:
+        writer.close()
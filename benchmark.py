@@ -0,0 +1,314 @@
+"""
+Бенчмарки расчётного ядра на синтетических тайлах SRTM.
+
+    python benchmark.py                    # сравнить с сохранённой базой
+    python benchmark.py --update-baseline  # записать текущие результаты как базу
+
+Тайлы 1201 и 3601 генерируются детерминированно (хребты, равнины, пустоты).
+Для каждого замера сохраняются время на операцию (лучшее из повторов) и
+пиковая память (tracemalloc). Отдельно в чистом процессе замеряется время
+холодного импорта основных модулей. Перед каждым замером в том же процессе
+выполняется эталонная нагрузка, и с базой сравнивается время в её долях,
+поэтому база переносима между машинами и меньше зависит от их загрузки.
+Чтение тайлов замеряется с диска: перед каждым повтором файл вытесняется из
+страничного кэша ОС. Код возврата 1, если замер хуже базы больше чем на допуск.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import app_logic
+import link_analysis
+import render_cache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, "benchmark_baseline.json")
+# Модули, время холодного импорта которых отслеживается (gui_module - время до появления окна)
+IMPORT_MODULES = ("app_logic", "link_analysis", "gui_module")
+
+
+def make_tile(path, size, seed):
+    """
+    Синтетический тайл: плавные хребты, ровная долина и прямоугольные пустоты
+    (-32768), записанный как .hgt (big-endian int16).
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:1:size * 1j, 0:1:size * 1j]
+    relief = 400 + 300 * np.sin(6 * np.pi * (x + 0.3 * y)) * np.cos(3 * np.pi * y)
+    for _ in range(5):
+        cx, cy, width, height = rng.uniform(0, 1), rng.uniform(0, 1), rng.uniform(0.01, 0.05), rng.uniform(300, 900)
+        # Хребет вдоль случайного направления
+        angle = rng.uniform(0, np.pi)
+        distance = (x - cx) * np.sin(angle) - (y - cy) * np.cos(angle)
+        relief += height * np.exp(-(distance / width) ** 2)
+    relief += rng.normal(0, 3, relief.shape)
+    # Равнина
+    relief[(x > 0.6) & (y > 0.6)] = 120
+    matrix = relief.astype(">i2")
+    for _ in range(3):
+        r, c = rng.integers(0, size - size // 20, 2)
+        matrix[r:r + size // 40, c:c + size // 30] = app_logic.HGT_VOID
+    matrix.tofile(path)
+    return path
+
+
+def make_tiles(directory):
+    """Тайл SRTM3 (1201) N10E010 и соседний SRTM1 (3601) N10E011."""
+    return {
+        1201: make_tile(os.path.join(directory, "N10E010.hgt"), 1201, seed=1201),
+        3601: make_tile(os.path.join(directory, "N10E011.hgt"), 3601, seed=3601),
+    }
+
+
+def calibrate(repeat=5):
+    """Время эталонной нагрузки (цикл Python и numpy), с - лучшее из repeat."""
+    values = np.random.default_rng(0).random(200_000)
+
+    def work():
+        total = 0.0
+        for i in range(100_000):
+            total += i * 0.5
+        np.sort(values)
+        return total + float(np.sqrt(values).sum())
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def evict_from_cache(path):
+    """
+    Вытесняет файл из страничного кэша ОС, чтобы его чтение шло с диска.
+    Файл переписывается заново (у отображённых в память старых страниц другой
+    inode) и, где есть posix_fadvise, его страницы сбрасываются из кэша.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    os.replace(tmp_path, path)
+
+
+def measure(fn, ops, repeat=5, setup=None):
+    """
+    (секунд на операцию - лучшее из repeat, пиковая память в байтах).
+    setup() вызывается перед каждым запуском fn и в замер не входит; сборщик
+    мусора на время замера отключается, как в timeit.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best / ops, peak
+
+
+def measure_import(module, repeat=5):
+    """
+    Холодный импорт модуля в отдельном процессе: (секунд - лучшее из repeat
+    по -X importtime, пиковая память импорта по tracemalloc) или None, если
+    модуль не импортируется (например, нет customtkinter) или -X importtime
+    не дал строки для него.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        done = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=ROOT, capture_output=True, text=True)
+        if done.returncode != 0:
+            return None
+        # Строка вида "import time: self | cumulative | name" для самого модуля
+        for line in done.stderr.splitlines():
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                try:
+                    best = min(best, int(fields[1]) / 1e6)
+                except ValueError:
+                    continue
+    if best == float("inf"):
+        return None
+    code = f"import tracemalloc; tracemalloc.start(); import {module}; print(tracemalloc.get_traced_memory()[1])"
+    done = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    return best, int(done.stdout.strip() or 0)
+
+
+def random_routes(rng, lat, lon, n, span=0.3):
+    starts = np.column_stack((rng.uniform(lat + 0.05, lat + 0.95, n), rng.uniform(lon + 0.05, lon + 0.95, n)))
+    ends = np.clip(starts + rng.uniform(-span, span, (n, 2)), [lat + 0.001, lon + 0.001], [lat + 0.999, lon + 0.999])
+    return starts, ends
+
+
+def benchmarks(tiles):
+    """
+    Словарь имя -> (функция, число операций в одном вызове, повторов[,
+    подготовка перед каждым вызовом]).
+    """
+    rng = np.random.default_rng(0)
+    index = app_logic.TileIndex(os.path.dirname(tiles[1201]))
+    routes = random_routes(rng, 10, 10, 200)
+    routes_3601 = random_routes(rng, 10, 11, 200)
+
+    def load(size, times=1):
+        # Без вытеснения замер показывал бы скорость страничного кэша, а не чтения тайла
+        def run():
+            for _ in range(times):
+                matrix, _ = app_logic.load_hgt_matrix(tiles[size])
+                # memmap читается только при обращении - считаем полное чтение
+                float(np.asarray(matrix).max())
+        return run
+
+    def profiles(starts, ends, **kwargs):
+        def run():
+            for p1, p2 in zip(starts, ends):
+                app_logic.get_elevation_profile(index, tuple(p1), tuple(p2), **kwargs)
+        return run
+
+    lat1, lon1 = rng.uniform(-60, 60, 1_000_000), rng.uniform(-180, 180, 1_000_000)
+    lat2, lon2 = lat1 + rng.uniform(-1, 1, lat1.size), lon1 + rng.uniform(-1, 1, lat1.size)
+
+    dist = np.linspace(0, 1, 250) * rng.uniform(1000, 50000, (2000, 1))
+    dist_1d, elev_1d = app_logic.get_elevation_profile(index, tuple(routes[0][0]), tuple(routes[1][0]))
+    batch_dist, batch_elev = app_logic.get_elevation_profiles(index, *random_routes(rng, 10, 10, 5000))
+    params = link_analysis.LinkParams(h1=30, h2=30)
+
+    tile = app_logic.open_raster(tiles[1201])
+    cell = render_cache.cell_size_m(tile.transform, tile.matrix.shape)
+    hillshade = render_cache.MapStyle(vmin=0, vmax=2000, shading="hillshade")
+
+    def single_links():
+        for _ in range(200):
+            link_analysis.analyze_link((dist_1d, elev_1d), params)
+
+    return {
+        "load_hgt_matrix_1201": (load(1201, 10), 10, 5, lambda: evict_from_cache(tiles[1201])),
+        "load_hgt_matrix_3601": (load(3601), 1, 7, lambda: evict_from_cache(tiles[3601])),
+        "profile_nearest_250": (profiles(*routes), len(routes[0]), 7),
+        "profile_bilinear_250": (profiles(*routes, method="bilinear"), len(routes[0]), 7),
+        "profile_adaptive_3601": (profiles(*routes_3601, num_points=None, method="bilinear"),
+                                  len(routes_3601[0]), 3),
+        "haversine_1e6": (lambda: app_logic.haversine((lat1, lon1), (lat2, lon2)), lat1.size, 5),
+        "fresnel_earth_arc_2000x250": (lambda: (app_logic.get_fresnel_zone(dist, dist[:, -1:], 2.4),
+                                                app_logic.get_earth_arc(dist)), dist.shape[0], 5),
+        "analyze_link": (single_links, 200, 7),
+        "render_hillshade_1201": (lambda: render_cache.render_level(tile.matrix, *cell, hillshade), 1, 5),
+        "analyze_links_batch_5000": (lambda: link_analysis.analyze_links_batch(batch_dist, batch_elev, params),
+                                     batch_dist.shape[0], 3),
+    }
+
+
+def run(selected=None):
+    results = {}
+    for module in IMPORT_MODULES:
+        name = f"import_{module}"
+        if selected and name not in selected:
+            continue
+        reference = calibrate()
+        measured = measure_import(module)
+        if measured is not None:
+            results[name] = _result(measured[0], measured[1], reference)
+    with tempfile.TemporaryDirectory() as directory:
+        tiles = make_tiles(directory)
+        for name, (fn, ops, repeat, *setup) in benchmarks(tiles).items():
+            if selected and name not in selected:
+                continue
+            # Эталон замеряется рядом с замером, чтобы попасть в ту же загрузку машины
+            reference = calibrate()
+            seconds, peak = measure(fn, ops, repeat, *setup)
+            results[name] = _result(seconds, peak, reference)
+    return results
+
+
+def _result(seconds, peak, reference):
+    return {"seconds_per_op": seconds, "relative_time": seconds / reference, "peak_bytes": peak}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """
+    Печатает таблицу и возвращает список имён с регрессией. Время сравнивается
+    в долях эталонной нагрузки (relative_time); в таблице - и абсолютное
+    время текущего запуска.
+    """
+    regressions = []
+    print(f"{'замер':32} {'мкс/оп':>12} {'доля':>12} {'база':>12} {'память, МБ':>11} {'база':>9}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        us = current["seconds_per_op"] * 1e6
+        mb = current["peak_bytes"] / 2 ** 20
+        flag = ""
+        if base is not None and "relative_time" not in base:
+            # База прежнего формата с абсолютным временем - сравнима только память
+            base = {**base, "relative_time": None}
+        if base is not None:
+            slow = base["relative_time"] is not None and \
+                current["relative_time"] > base["relative_time"] * (1 + time_tolerance)
+            fat = current["peak_bytes"] > base["peak_bytes"] * (1 + memory_tolerance) + 2 ** 20
+            if slow or fat:
+                regressions.append(name)
+                flag = "  РЕГРЕССИЯ" + (" (время)" if slow else "") + (" (память)" if fat else "")
+            base_relative = f"{base['relative_time']:12.4g}" if base["relative_time"] is not None else f"{'-':>12}"
+            print(f"{name:32} {us:12.3f} {current['relative_time']:12.4g} {base_relative} {mb:11.2f} "
+                  f"{base['peak_bytes'] / 2 ** 20:9.2f}{flag}")
+        else:
+            print(f"{name:32} {us:12.3f} {current['relative_time']:12.4g} {'-':>12} {mb:11.2f} {'-':>9}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки расчётного ядра на синтетических тайлах")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл базы (JSON)")
+    parser.add_argument("--update-baseline", action="store_true", help="записать результаты как новую базу")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="допустимое замедление (доля)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="допустимый рост памяти (доля)")
+    parser.add_argument("--only", nargs="*", help="запустить только указанные замеры")
+    args = parser.parse_args(argv)
+
+    results = run(args.only)
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"База записана: {args.baseline}")
+        return 0
+    if regressions:
+        print("Регрессии: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import app_logic
+import geodesy
+import link_analysis
+
+
+@dataclass(slots=True)
+class Coverage:
+    """
+    Зона покрытия от одного передатчика.
+    visible - прямая видимость антенны приёмника (LOS не перекрыт рельефом);
+    fresnel_ratio - отношение просвета к радиусу первой зоны Френеля на главном
+    препятствии (>= 1 - открытый интервал, 0..1 - полуоткрытый, < 0 - закрытый,
+    NaN - ячейка не рассчитана или пустота SRTM);
+    distance - расстояние от передатчика, м.
+    Массивы имеют форму окна window исходной матрицы.
+    """
+    visible: np.ndarray
+    fresnel_ratio: np.ndarray
+    distance: np.ndarray
+    window: tuple
+    extent: list
+    transform: tuple
+
+
+def _ray_targets(n_rows, n_cols):
+    """Ячейки периметра окна - концы лучей развёртки."""
+    rows = np.concatenate([np.zeros(n_cols), np.full(n_cols, n_rows - 1),
+                           np.arange(1, n_rows - 1), np.arange(1, n_rows - 1)])
+    cols = np.concatenate([np.arange(n_cols), np.arange(n_cols),
+                           np.zeros(n_rows - 2), np.full(n_rows - 2, n_cols - 1)])
+    return rows.astype(np.intp), cols.astype(np.intp)
+
+
+def sweep_rays(elev, tx_row, tx_col, target_rows, target_cols, z_tx, h_rx, freq_ghz, dx_m, dy_m,
+               store, progress=None):
+    """
+    Радиальная развёртка (R2) по пучку лучей от передатчика к ячейкам target_*.
+    Все лучи продвигаются одновременно на одну ячейку за шаг, и для каждого
+    хранится горизонт - наибольший угол возвышения рельефа на пройденном пути
+    и расстояние до этого (главного) препятствия. Так каждая ячейка
+    проверяется за O(1) без построения отдельного профиля.
+    Результаты каждого шага передаются в store(rows, cols, visible, fresnel_ratio, distance).
+    """
+    d_row = (target_rows - tx_row).astype(float)
+    d_col = (target_cols - tx_col).astype(float)
+    n_steps = np.maximum(np.abs(d_row), np.abs(d_col)).astype(np.intp)
+    # Длинные лучи впереди: активные на шаге k лучи образуют префикс массива
+    order = np.argsort(-n_steps, kind="stable")
+    d_row, d_col, n_steps = d_row[order], d_col[order], n_steps[order]
+    n_steps_desc = n_steps[::-1]
+
+    n_rays = len(n_steps)
+    horizon = np.full(n_rays, -np.inf)
+    horizon_dist = np.zeros(n_rays)
+    max_steps = int(n_steps[0]) if n_rays else 0
+    report_every = max(max_steps // 50, 1)
+
+    for k in range(1, max_steps + 1):
+        active = n_rays - np.searchsorted(n_steps_desc, k, side="left")
+        frac = k / n_steps[:active]
+        rows = np.rint(tx_row + d_row[:active] * frac).astype(np.intp)
+        cols = np.rint(tx_col + d_col[:active] * frac).astype(np.intp)
+
+        dist = np.hypot((rows - tx_row) * dy_m, (cols - tx_col) * dx_m)
+        terrain = elev[rows, cols] - app_logic.calculate_earth_curvature(dist)
+        void = np.isnan(terrain)
+
+        # Луч на приёмную антенну и сравнение с горизонтом
+        slope_rx = (terrain + h_rx - z_tx) / dist
+        ray_horizon = horizon[:active]
+        ray_horizon_dist = horizon_dist[:active]
+        visible_k = slope_rx >= ray_horizon
+
+        # Просвет на главном препятствии относительно радиуса зоны Френеля
+        with np.errstate(divide="ignore", invalid="ignore"):
+            clearance = ray_horizon_dist * (slope_rx - ray_horizon)
+            f_radius = app_logic.get_fresnel_zone(ray_horizon_dist, dist, freq_ghz)
+            ratio = np.where(np.isinf(ray_horizon) | (f_radius <= 0), np.inf, clearance / f_radius)
+        ratio = np.where(void, np.nan, ratio)
+
+        store(rows, cols, visible_k & ~void, ratio, dist)
+
+        # Пустоты SRTM не перекрывают обзор
+        slope_terrain = np.where(void, -np.inf, (terrain - z_tx) / dist)
+        higher = slope_terrain > ray_horizon
+        horizon[:active] = np.where(higher, slope_terrain, ray_horizon)
+        horizon_dist[:active] = np.where(higher, dist, ray_horizon_dist)
+
+        if progress is not None and k % report_every == 0:
+            progress(k / max_steps)
+
+
+class SweepSetup:
+    """Окно растра вокруг передатчика, подготовленное для развёртки."""
+    __slots__ = ("elev", "tx_row", "tx_col", "z_tx", "dx_m", "dy_m", "window", "transform")
+
+    def __init__(self, raster, tx, h_tx, max_distance=None):
+        a, _, left, _, e, top = raster.transform
+        n_rows, n_cols = raster.matrix.shape
+        tx_lat, tx_lon = tx
+        tx_row = int(np.floor((tx_lat - top) / e))
+        tx_col = int(np.floor((tx_lon - left) / a))
+        if not (0 <= tx_row < n_rows and 0 <= tx_col < n_cols):
+            raise ValueError("Передатчик находится вне загруженной карты")
+
+        # Размер ячейки в метрах
+        self.dy_m = abs(e) * geodesy.METERS_PER_DEGREE
+        self.dx_m = abs(a) * geodesy.METERS_PER_DEGREE * np.cos(np.radians(tx_lat))
+
+        row0, row1, col0, col1 = 0, n_rows, 0, n_cols
+        if max_distance is not None:
+            reach_rows = int(np.ceil(max_distance / self.dy_m))
+            reach_cols = int(np.ceil(max_distance / self.dx_m))
+            row0, row1 = max(tx_row - reach_rows, 0), min(tx_row + reach_rows + 1, n_rows)
+            col0, col1 = max(tx_col - reach_cols, 0), min(tx_col + reach_cols + 1, n_cols)
+
+        self.elev = np.asarray(raster.matrix[row0:row1, col0:col1], dtype=float)
+        self.elev[self.elev == app_logic.HGT_VOID] = np.nan
+        self.tx_row, self.tx_col = tx_row - row0, tx_col - col0
+        self.z_tx = self.elev[self.tx_row, self.tx_col] + h_tx
+        if np.isnan(self.z_tx):
+            raise ValueError("Под передатчиком нет данных высот")
+        self.window = (row0, row1, col0, col1)
+        self.transform = (a, 0.0, left + col0 * a, 0.0, e, top + row0 * e)
+
+    @property
+    def extent(self):
+        return app_logic.Raster(self.elev, self.transform).extent
+
+    def distances(self):
+        rows, cols = np.indices(self.elev.shape, sparse=True)
+        return np.hypot((rows - self.tx_row) * self.dy_m, (cols - self.tx_col) * self.dx_m)
+
+
+def compute_coverage(raster, tx, h_tx, h_rx, freq_ghz, max_distance=None, progress=None):
+    """
+    Видимость и просвет по первой зоне Френеля от передатчика tx = (lat, lon)
+    с высотой мачты h_tx до приёмной антенны высотой h_rx над каждой ячейкой растра.
+    max_distance (м) ограничивает окно расчёта вокруг передатчика.
+
+    Просвет оценивается на главном препятствии луча (с наибольшим углом
+    возвышения), а не минимизируется по всем точкам трассы - это обычное
+    приближение развёртки, которое позволяет переиспользовать горизонт луча.
+    """
+    setup = SweepSetup(raster, tx, h_tx, max_distance)
+    visible = np.zeros(setup.elev.shape, dtype=bool)
+    fresnel_ratio = np.full(setup.elev.shape, np.nan, dtype=np.float32)
+    visible[setup.tx_row, setup.tx_col] = True
+    fresnel_ratio[setup.tx_row, setup.tx_col] = np.inf
+
+    def store(rows, cols, visible_k, ratio, dist):
+        visible[rows, cols] = visible_k
+        fresnel_ratio[rows, cols] = ratio
+
+    target_rows, target_cols = _ray_targets(*setup.elev.shape)
+    sweep_rays(setup.elev, setup.tx_row, setup.tx_col, target_rows, target_cols, setup.z_tx, h_rx, freq_ghz,
+               setup.dx_m, setup.dy_m, store, progress)
+    return Coverage(visible=visible, fresnel_ratio=fresnel_ratio, distance=setup.distances(),
+                    window=setup.window, extent=setup.extent, transform=setup.transform)
+
+
+def coverage_rgba(coverage, alpha=0.45):
+    """
+    Цветной слой для наложения на карту: зелёный - открытый интервал,
+    жёлтый - полуоткрытый, красный - закрытый, прозрачный - нет данных.
+    """
+    ratio = coverage.fresnel_ratio
+    rgba = np.zeros(ratio.shape + (4,), dtype=np.uint8)
+    opacity = int(alpha * 255)
+    rgba[ratio >= 1] = (0, 170, 0, opacity)
+    rgba[(ratio >= 0) & (ratio < 1)] = (230, 200, 0, opacity)
+    rgba[ratio < 0] = (200, 0, 0, opacity)
+    return rgba
+
+
+@dataclass(slots=True)
+class PowerMap:
+    """
+    Прогноз мощности на входе приёмника вокруг передатчика.
+    p_rx - растр в дБм, отображённый в память из файла .npy
+    (-inf - закрытый интервал, NaN - нет данных).
+    """
+    p_rx: np.ndarray
+    sensitivity: float
+    window: tuple
+    extent: list
+    transform: tuple
+
+    @property
+    def passed(self):
+        """Ячейки, где мощность не ниже чувствительности приёмника."""
+        with np.errstate(invalid="ignore"):
+            return self.p_rx >= self.sensitivity
+
+
+def link_budget_constants(params):
+    """Не зависящие от ячейки слагаемые бюджета линии из LinkParams."""
+    wavelength = params.wavelength
+    phi = float(link_analysis._lookup_phi(params.surface, wavelength * 100))
+    gain = float(link_analysis.antenna_gain_dbi(params.ant_diam, params.ant_efficiency, wavelength))
+    return {
+        "wavelength": wavelength,
+        "phi": phi,
+        "gain_total": 2 * gain,
+        "p_tx": float(link_analysis.tx_power_dbm(params.power)),
+        "feeder_loss": params.feeder_loss,
+    }
+
+
+def power_from_clearance(ratio, distance, budget):
+    """
+    P_rx (дБм) по относительному просвету на главном препятствии и расстоянию:
+    открытый интервал - интерференционный множитель с Φ поверхности (D = 1),
+    полуоткрытый - потери на препятствии, закрытый - -inf.
+    Формулы те же, что в link_analysis.analyze_links_batch.
+    """
+    with np.errstate(invalid="ignore"):
+        finite_ratio = np.where(np.isfinite(ratio), ratio, 0.0)
+        Wp = np.where(finite_ratio >= 1,
+                      link_analysis.interference_loss_db(finite_ratio, budget["phi"]),
+                      link_analysis.obstacle_loss_db(finite_ratio))
+        # Без препятствий на луче отражённой волны нет
+        Wp = np.where(np.isposinf(ratio), 0.0, Wp)
+        total_loss = link_analysis.free_space_loss_db(distance, budget["wavelength"]) + Wp \
+            + 2 * budget["feeder_loss"]
+        p_rx = budget["p_tx"] + budget["gain_total"] - total_loss
+        p_rx = np.where(ratio < 0, -np.inf, p_rx)
+    return np.where(np.isnan(ratio), np.nan, p_rx).astype(np.float32)
+
+
+def _power_chunk(shm_name, shape, output_path, target_rows, target_cols, sweep_args, budget):
+    """Рабочий процесс: развёртка сектора лучей с записью P_rx прямо в выходной memmap."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # DEM берётся из общей памяти без копирования в процесс
+        elev = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        out = np.load(output_path, mmap_mode="r+")
+
+        def store(rows, cols, visible_k, ratio, dist):
+            out[rows, cols] = power_from_clearance(ratio, dist, budget)
+
+        sweep_rays(elev, *sweep_args[:2], target_rows, target_cols, *sweep_args[2:], store)
+        out.flush()
+        del out, elev
+    finally:
+        shm.close()
+    return len(target_rows)
+
+
+def compute_power_map(raster, tx, params, output_path, max_distance=None, workers=None, progress=None):
+    """
+    Растр прогнозируемой мощности P_rx вокруг передатчика tx = (lat, lon)
+    (мачта params.h1, приёмник params.h2 над каждой ячейкой).
+    Периметр окна делится на угловые секторы, которые обрабатываются в пуле
+    процессов по всем ядрам. DEM лежит в общей памяти, а результат пишется
+    потоково в файл output_path (.npy), отображённый в память.
+    """
+    setup = SweepSetup(raster, tx, params.h1, max_distance)
+    workers = workers or os.cpu_count() or 1
+    budget = link_budget_constants(params)
+
+    out = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float32, shape=setup.elev.shape)
+    out[:] = np.nan
+    out.flush()
+    del out
+
+    target_rows, target_cols = _ray_targets(*setup.elev.shape)
+    sectors = np.array_split(np.arange(len(target_rows)), workers * 4)
+    sweep_args = (setup.tx_row, setup.tx_col, setup.z_tx, params.h2, params.freq_mhz / 1000.0,
+                  setup.dx_m, setup.dy_m)
+
+    shm = shared_memory.SharedMemory(create=True, size=setup.elev.nbytes)
+    try:
+        shared_elev = np.ndarray(setup.elev.shape, dtype=float, buffer=shm.buf)
+        shared_elev[:] = setup.elev
+        del shared_elev
+        # spawn: рабочие процессы не наследуют потоки и окна интерфейса
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(_power_chunk, shm.name, setup.elev.shape, output_path,
+                                       target_rows[sector], target_cols[sector], sweep_args, budget)
+                       for sector in sectors if len(sector)]
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    future.result()
+                    if progress is not None:
+                        progress(done / len(futures))
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return PowerMap(p_rx=np.load(output_path, mmap_mode="r"), sensitivity=params.sensitivity,
+                    window=setup.window, extent=setup.extent, transform=setup.transform)
+
+
+def power_rgba(power_map, alpha=0.5, margin_span=30.0):
+    """
+    Цветной слой карты мощности: ячейки с запасом над чувствительностью - от
+    жёлтого (0 дБ) до зелёного (margin_span дБ), непригодные - красным.
+    """
+    p_rx = np.asarray(power_map.p_rx)
+    rgba = np.zeros(p_rx.shape + (4,), dtype=np.uint8)
+    with np.errstate(invalid="ignore"):
+        margin = p_rx - power_map.sensitivity
+        passed = margin >= 0
+        failed = margin < 0
+    t = np.clip(np.nan_to_num(margin[passed]) / margin_span, 0.0, 1.0)
+    rgba[passed, 0] = (230 * (1 - t)).astype(np.uint8)
+    rgba[passed, 1] = (200 - 30 * t).astype(np.uint8)
+    rgba[passed, 3] = int(alpha * 255)
+    rgba[failed] = (200, 0, 0, int(alpha * 160))
+    return rgba
@@ -0,0 +1,238 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import app_logic
+import geodesy
+
+INDEX_SUFFIX = ".blockmax.npz"
+# Самый мелкий хранимый блок (пикселей по стороне); под ним - сама матрица тайла
+FINEST_FACTOR = 4
+
+# Результаты классификации трасс
+CLEAR, BLOCKED, AMBIGUOUS = 0, 1, 2
+
+
+def _reduce_blocks(matrix, factor):
+    """Максимум и минимум по блокам factor x factor (края дополняются повтором)."""
+    n_rows, n_cols = matrix.shape
+    pad_rows, pad_cols = -n_rows % factor, -n_cols % factor
+    padded = np.pad(np.asarray(matrix), ((0, pad_rows), (0, pad_cols)), mode="edge")
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    return blocks.max(axis=(1, 3)), blocks.min(axis=(1, 3))
+
+
+def build_levels(matrix):
+    """
+    Квадродерево блоков: {factor: (max, min)} для factor = 4, 8, 16, ...
+    до одного блока на весь тайл. Каждый уровень строится из предыдущего
+    (2 x 2 блока), пустоты (-32768) в максимум не попадают, а минимум с ними
+    становится только ниже, поэтому обе оценки остаются верными.
+    """
+    maxima, minima = _reduce_blocks(matrix, FINEST_FACTOR)
+    levels = {FINEST_FACTOR: (maxima, minima)}
+    factor = FINEST_FACTOR
+    while maxima.shape != (1, 1):
+        factor *= 2
+        maxima = _reduce_blocks(maxima, 2)[0]
+        minima = _reduce_blocks(minima, 2)[1]
+        levels[factor] = (maxima, minima)
+    return levels
+
+
+class ElevationIndex:
+    """Оценки высот рельефа тайла по блокам разного размера (от крупных к мелким)."""
+
+    def __init__(self, tile, levels):
+        self.tile = tile
+        self.levels = levels
+
+    def descending(self):
+        """Уровни (factor, max, min) от одного блока на тайл до отдельных пикселей."""
+        for factor in sorted(self.levels, reverse=True):
+            yield (factor, *self.levels[factor])
+        yield 1, self.tile.matrix, self.tile.matrix
+
+
+def load_index(tile):
+    """
+    ElevationIndex для тайла. Уровни кэшируются в файле рядом с тайлом
+    (как пирамиды отображения) и перестраиваются, если тайл изменился.
+    """
+    cache_path = app_logic.sidecar_path(tile.path, INDEX_SUFFIX)
+    identity = np.array(app_logic.file_identity(tile.path)[1:], dtype=np.int64)
+    try:
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached["identity"], identity):
+                return ElevationIndex(tile, {int(f): (cached[f"max_{int(f)}"], cached[f"min_{int(f)}"])
+                                             for f in cached["factors"]})
+    except (OSError, KeyError, ValueError):
+        pass
+
+    levels = build_levels(tile.matrix)
+    try:
+        arrays = {}
+        for f, (maxima, minima) in levels.items():
+            arrays[f"max_{f}"] = maxima
+            arrays[f"min_{f}"] = minima
+        np.savez(cache_path, identity=identity, factors=np.array(sorted(levels)), **arrays)
+    except OSError:
+        # Каталог с тайлами может быть только для чтения - работаем без кэша
+        pass
+    return ElevationIndex(tile, levels)
+
+
+def _split(ta, tb, u1, u2, mid, parent, factor):
+    """
+    Точки деления кусков трасс [ta, tb] линиями сетки factor внутри блока
+    размера parent (по одной оси). Возвращает массив (n, ratio - 1) долей t или NaN.
+    """
+    ratio = parent // factor
+    origin = np.floor(mid / parent) * parent
+    lines = origin[:, None] + factor * np.arange(1, ratio)[None, :]
+    du = (u2 - u1)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (lines - u1[:, None]) / du
+    return np.where((du != 0) & (t > ta[:, None]) & (t < tb[:, None]), t, np.nan)
+
+
+def classify_tile_links(index, starts, ends, h1, h2, freq_mhz, clearance_ratio=1.0):
+    """
+    Быстрая классификация трасс внутри одного тайла без построения профилей.
+    Трасса делится на куски по блокам квадродерева от крупных к мелким; для
+    каждого куска сравниваются оценки рельефа с кривизной Земли и линии LOS:
+    - max(рельеф) <= min(LOS - p * H0) - кусок заведомо свободен;
+    - min(рельеф) > max(LOS) - трасса заведомо закрыта (BLOCKED);
+    неоднозначные куски уточняются на следующем уровне. Трасса CLEAR, если
+    свободны все куски (просвет не меньше p * H0 во всех пройденных ячейках),
+    и AMBIGUOUS, если неоднозначность осталась на уровне пикселей.
+    H0 - радиус зоны Френеля (как в analyze_links_batch).
+    Возвращает (codes, lookups) - коды CLEAR/BLOCKED/AMBIGUOUS и число обращений к блокам.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    n = len(starts)
+    tile = index.tile
+    a, _, left, _, e, top = tile.transform
+    n_rows, n_cols = tile.matrix.shape
+
+    # Пиксельные координаты концов: ячейка (row, col) = floor(y), floor(x)
+    y1, y2 = (starts[:, 0] - top) / e, (ends[:, 0] - top) / e
+    x1, x2 = (starts[:, 1] - left) / a, (ends[:, 1] - left) / a
+    D = geodesy.haversine(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+    ground1 = tile.sample(starts[:, 0], starts[:, 1])
+    ground2 = tile.sample(ends[:, 0], ends[:, 1])
+    los1 = ground1 + np.broadcast_to(np.asarray(h1, dtype=float), (n,))
+    los2 = ground2 + np.broadcast_to(np.asarray(h2, dtype=float), (n,))
+    wavelength = 0.3 / (np.broadcast_to(np.asarray(freq_mhz, dtype=float), (n,)) / 1000.0)
+    R_eff = geodesy.EFFECTIVE_EARTH_RADIUS
+
+    codes = np.full(n, CLEAR, dtype=np.int8)
+    link = np.arange(n)
+    ta = np.zeros(n)
+    tb = np.ones(n)
+    lookups = 0
+    parent = None
+    for factor, maxima, minima in index.descending():
+        if link.size == 0:
+            break
+        if parent is not None:
+            # Делим куски линиями сетки текущего уровня внутри родительского блока
+            tm = (ta + tb) / 2
+            cuts = np.concatenate((
+                _split(ta, tb, y1[link], y2[link], y1[link] + tm * (y2[link] - y1[link]), parent, factor),
+                _split(ta, tb, x1[link], x2[link], x1[link] + tm * (x2[link] - x1[link]), parent, factor),
+            ), axis=1)
+            bounds = np.sort(np.column_stack((ta, np.where(np.isnan(cuts), tb[:, None], cuts), tb)), axis=1)
+            piece_ta, piece_tb = bounds[:, :-1], bounds[:, 1:]
+            keep = piece_tb > piece_ta
+            link = np.broadcast_to(link[:, None], keep.shape)[keep]
+            ta, tb = piece_ta[keep], piece_tb[keep]
+        parent = factor
+
+        tm = (ta + tb) / 2
+        rows = np.clip(np.floor((y1[link] + tm * (y2[link] - y1[link])) / factor).astype(np.intp),
+                       0, maxima.shape[0] - 1)
+        cols = np.clip(np.floor((x1[link] + tm * (x2[link] - x1[link])) / factor).astype(np.intp),
+                       0, maxima.shape[1] - 1)
+        if factor == 1:
+            rows = np.minimum(rows, n_rows - 1)
+            cols = np.minimum(cols, n_cols - 1)
+        lookups += link.size
+        top_terrain = maxima[rows, cols].astype(float)
+        low_terrain = minima[rows, cols].astype(float)
+
+        # Оценки на куске [ta, tb]: дуга и H0 максимальны в точке, ближайшей к середине трассы
+        Dl = D[link]
+        da, db = ta * Dl, tb * Dl
+        dc = np.clip(Dl / 2, da, db)
+        arc_max = dc * (Dl - dc) / (2 * R_eff)
+        arc_min = np.minimum(da * (Dl - da), db * (Dl - db)) / (2 * R_eff)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            H0_max = np.where(Dl > 0, np.sqrt(wavelength[link] * dc * (Dl - dc) / Dl), 0.0)
+        los_a = los1[link] + (los2[link] - los1[link]) * ta
+        los_b = los1[link] + (los2[link] - los1[link]) * tb
+
+        clear = top_terrain + arc_max <= np.minimum(los_a, los_b) - clearance_ratio * H0_max
+        blocked = low_terrain + arc_min > np.maximum(los_a, los_b)
+
+        codes[link[blocked]] = BLOCKED
+        # Куски заведомо закрытых трасс дальше не уточняем
+        alive = ~clear & (codes[link] != BLOCKED)
+        link, ta, tb = link[alive], ta[alive], tb[alive]
+
+    codes[link[codes[link] != BLOCKED]] = AMBIGUOUS
+    return codes, lookups
+
+
+# Загруженные индексы по идентичности файла тайла (давно не использованные вытесняются)
+MAX_LOADED_INDEXES = 32
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def index_for(tile):
+    identity = app_logic.file_identity(tile.path)
+    with _indexes_lock:
+        index = _indexes.get(identity)
+        if index is not None:
+            _indexes.move_to_end(identity)
+            return index
+    # Индекс строится (или читается) без блокировки: другие тайлы не ждут
+    index = load_index(tile)
+    with _indexes_lock:
+        _indexes[identity] = index
+        _indexes.move_to_end(identity)
+        while len(_indexes) > MAX_LOADED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def classify_links(source, starts, ends, h1, h2, freq_mhz, clearance_ratio=1.0):
+    """
+    classify_tile_links для набора трасс по TileIndex или одному тайлу HGTTile.
+    Трассы группируются по тайлу; трассы, пересекающие границу тайлов или
+    выходящие за загруженные тайлы, получают AMBIGUOUS (их решает полный расчёт).
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    n = len(starts)
+    h1 = np.broadcast_to(np.asarray(h1, dtype=float), (n,))
+    h2 = np.broadcast_to(np.asarray(h2, dtype=float), (n,))
+    freq_mhz = np.broadcast_to(np.asarray(freq_mhz, dtype=float), (n,))
+    codes = np.full(n, AMBIGUOUS, dtype=np.int8)
+
+    key1 = np.floor(starts).astype(np.int64)
+    same_tile = np.all(key1 == np.floor(ends).astype(np.int64), axis=1)
+    if isinstance(source, app_logic.TileIndex):
+        tiles = {key: source.tile(key) for key in set(map(tuple, key1[same_tile].tolist())) if key in source}
+    else:
+        tiles = {(source.lat, source.lon): source}
+
+    for key, tile in tiles.items():
+        sel = np.flatnonzero(same_tile & (key1[:, 0] == key[0]) & (key1[:, 1] == key[1]))
+        if sel.size:
+            codes[sel], _ = classify_tile_links(index_for(tile), starts[sel], ends[sel], h1[sel], h2[sel],
+                                                freq_mhz[sel], clearance_ratio)
+    return codes
@@ -0,0 +1,151 @@
+import numpy as np
+
+# Средний радиус сферической Земли, м
+EARTH_RADIUS = 6371e3
+# Коэффициент стандартной атмосферной рефракции и эквивалентный радиус Земли
+K_REFRACTION = 4 / 3
+EFFECTIVE_EARTH_RADIUS = EARTH_RADIUS * K_REFRACTION
+# Метров в градусе дуги большого круга
+METERS_PER_DEGREE = EARTH_RADIUS * np.pi / 180
+
+# Эллипсоид WGS84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+
+def haversine(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS):
+    """
+    Расстояние по большому кругу на сфере, м. Координаты в градусах,
+    скаляры или массивы любой согласованной (broadcast) формы.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    dlat, dlon = lat2 - lat1, lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return radius * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """Начальный азимут на сфере, градусы от севера по часовой стрелке (0..360)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def vincenty_inverse(lat1, lon1, lat2, lon2, tol=1e-12, max_iter=200):
+    """
+    Обратная геодезическая задача на эллипсоиде WGS84 (формулы Винсенти),
+    векторно для массивов координат. Возвращает (distance_m, azimuth1, azimuth2),
+    азимуты в градусах (0..360). Итерации идут только для ещё не сошедшихся
+    точек; для почти антиподальных пар, где метод Винсенти не сходится,
+    расстояние берётся по сфере, а азимуты - NaN.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2)))
+    shape = lat1.shape
+    phi1, phi2 = np.radians(lat1).ravel(), np.radians(lat2).ravel()
+    L = np.radians(lon2 - lon1).ravel()
+    f, a, b = WGS84_F, WGS84_A, WGS84_B
+
+    U1 = np.arctan((1 - f) * np.tan(phi1))
+    U2 = np.arctan((1 - f) * np.tan(phi2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    n = L.size
+    sin_sigma, cos_sigma, sigma = np.zeros(n), np.ones(n), np.zeros(n)
+    cos2_alpha, cos_2sigma_m = np.ones(n), np.zeros(n)
+    sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+    active = np.ones(n, dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(max_iter):
+            idx = np.flatnonzero(active)
+            if idx.size == 0:
+                break
+            sl, cl = np.sin(lam[idx]), np.cos(lam[idx])
+            s1, c1, s2, c2 = sinU1[idx], cosU1[idx], sinU2[idx], cosU2[idx]
+            ss = np.sqrt((c2 * sl) ** 2 + (c1 * s2 - s1 * c2 * cl) ** 2)
+            cs = s1 * s2 + c1 * c2 * cl
+            sg = np.arctan2(ss, cs)
+            sin_alpha = np.where(ss > 0, c1 * c2 * sl / ss, 0.0)
+            c2a = 1 - sin_alpha ** 2
+            # На экваторе cos^2(alpha) = 0, и cos(2 sigma_m) по соглашению равен нулю
+            c2sm = np.where(c2a > 0, cs - 2 * s1 * s2 / c2a, 0.0)
+            C = f / 16 * c2a * (4 + f * (4 - 3 * c2a))
+            lam_new = L[idx] + (1 - C) * f * sin_alpha * (
+                sg + C * ss * (c2sm + C * cs * (-1 + 2 * c2sm ** 2)))
+
+            sin_sigma[idx], cos_sigma[idx], sigma[idx] = ss, cs, sg
+            cos2_alpha[idx], cos_2sigma_m[idx] = c2a, c2sm
+            sin_lam[idx], cos_lam[idx] = sl, cl
+            done = np.abs(lam_new - lam[idx]) <= tol
+            lam[idx] = lam_new
+            active[idx[done]] = False
+
+        u2 = cos2_alpha * (a * a - b * b) / (b * b)
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distance = b * A * (sigma - delta_sigma)
+
+        azimuth1 = np.degrees(np.arctan2(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)) % 360
+        azimuth2 = np.degrees(np.arctan2(cosU1 * sin_lam, -sinU1 * cosU2 + cosU1 * sinU2 * cos_lam)) % 360
+
+    if active.any():
+        distance[active] = haversine(lat1.ravel()[active], lon1.ravel()[active],
+                                     lat2.ravel()[active], lon2.ravel()[active])
+        azimuth1[active] = np.nan
+        azimuth2[active] = np.nan
+    return distance.reshape(shape), azimuth1.reshape(shape), azimuth2.reshape(shape)
+
+
+def intermediate_points(lat1, lon1, lat2, lon2, fractions):
+    """
+    Точки на дуге большого круга между (lat1, lon1) и (lat2, lon2) для долей
+    пути fractions (0..1). Возвращает (lats, lons) в градусах формы fractions.
+    """
+    fractions = np.asarray(fractions, dtype=float)
+    phi1, lam1, phi2, lam2 = (np.radians(float(v)) for v in (lat1, lon1, lat2, lon2))
+    delta = haversine(lat1, lon1, lat2, lon2, radius=1.0)
+    if delta == 0:
+        return np.full(fractions.shape, float(lat1)), np.full(fractions.shape, float(lon1))
+
+    # Сферическая интерполяция единичных векторов
+    wa = np.sin((1 - fractions) * delta) / np.sin(delta)
+    wb = np.sin(fractions * delta) / np.sin(delta)
+    x = wa * np.cos(phi1) * np.cos(lam1) + wb * np.cos(phi2) * np.cos(lam2)
+    y = wa * np.cos(phi1) * np.sin(lam1) + wb * np.cos(phi2) * np.sin(lam2)
+    z = wa * np.sin(phi1) + wb * np.sin(phi2)
+    lats = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    lons = np.degrees(np.arctan2(y, x))
+    return lats, lons
+
+
+def pairwise_distances(lats_a, lons_a, lats_b, lons_b, method="haversine", max_block=1_000_000):
+    """
+    Матрица расстояний (N, M) между наборами точек A и B, м.
+    method: "haversine" (сфера) или "vincenty" (WGS84). Строки считаются
+    блоками не больше max_block элементов, чтобы ограничить временную память.
+    """
+    lats_a, lons_a = np.ravel(lats_a).astype(float), np.ravel(lons_a).astype(float)
+    lats_b, lons_b = np.ravel(lats_b).astype(float), np.ravel(lons_b).astype(float)
+    if method == "haversine":
+        def distance(la1, lo1, la2, lo2):
+            return haversine(la1, lo1, la2, lo2)
+    elif method == "vincenty":
+        def distance(la1, lo1, la2, lo2):
+            return vincenty_inverse(la1, lo1, la2, lo2)[0]
+    else:
+        raise ValueError(f"Неизвестный метод расчёта расстояний: {method}")
+
+    out = np.empty((lats_a.size, lats_b.size))
+    rows = max(1, max_block // max(lats_b.size, 1))
+    for start in range(0, lats_a.size, rows):
+        part = slice(start, start + rows)
+        out[part] = distance(lats_a[part, None], lons_a[part, None], lats_b[None, :], lons_b[None, :])
+    return out
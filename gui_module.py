@@ -1,14 +1,53 @@
 import customtkinter as ctk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import importlib
+import os
+import tempfile
 import tkinter.filedialog as fd
+import time
+import tkinter.messagebox as mb
+from dataclasses import dataclass
 import numpy as np
 import app_logic
+import coverage
+import jobs
+import link_analysis
+import map_pyramid
+import profile_cache
+import render_cache
+import timing
 
 # Устанавливаем глобальную светлую тему
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
+# Модули matplotlib для холстов в окне; импортируются в фоне после появления окна
+MATPLOTLIB_MODULES = ("matplotlib.figure", "matplotlib.backends.backend_tkagg", "profile_plot")
+# Варианты отображения карты -> затенение рельефа (render_cache.SHADINGS)
+MAP_SHADINGS = {"Высоты": "none", "Высоты + отмывка рельефа": "hillshade", "Высоты + уклоны": "slope"}
+# Открытых окон профиля (живых фигур matplotlib); следующее окно заменяет самое старое
+MAX_PROFILE_WINDOWS = 4
+# Точка трассы захватывается для перетаскивания в этом радиусе от курсора, пикселей
+DRAG_RADIUS_PX = 10
+# При перетаскивании точки трасса пересчитывается не чаще одного раза за интервал, мс
+LIVE_PROFILE_INTERVAL_MS = 50
+
+
+@dataclass(slots=True)
+class ProfileWindow:
+    """Окно профиля трассы: подписи левой панели и шаблон графика с холстом."""
+    top: object
+    params_label: object
+    result_label: object
+    plot: object
+    canvas: object
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 
 class RadioApp(ctk.CTk):
     def __init__(self):
@@ -18,11 +57,42 @@ class RadioApp(ctk.CTk):
         self.configure(fg_color="#FFFFFF")
 
         self.hgt_path = None
+        # Индекс тайлов каталога assets/maps: трассы могут пересекать границы тайлов
+        self.tile_index = app_logic.TileIndex(app_logic.MAPS_DIR)
+        self.profile_source = None
+        # Профили трасс: повторный расчёт той же трассы не читает растр
+        self.profile_cache = profile_cache.ProfileCache(path=profile_cache.PROFILE_CACHE_PATH)
         self.points = []
-        self.current_matrix = None
+        # Пирамиды обзорных уровней загруженных растров (по одной на тайл)
+        self.map_pyramids = []
+        # Готовые RGBA-изображения уровней пирамид (render_cache), по одному на тайл
+        self.map_layers = []
+        self.map_images = []
         self.map_extent = None
+        self._levels_pending = False
+        # Слой точек и трассы рисуется поверх сохранённого фона карты (blitting)
+        self.map_background = None
+        self.overlay_artists = {}
+        self.hover_point = None
+        self.coverage_image = None
+        self.power_map_path = None
+        # Файл карты мощности задачи, которая ещё не завершилась
+        self.pending_power_map_path = None
+        self.profile_windows = []
+        # Перетаскивание точки трассы: индекс точки, исходные данные и отложенный пересчёт
+        self.drag_index = None
+        self.drag_params = None
+        self._live_timer = None
+        self._live_dirty = False
+        self._live_submitted = 0.0
 
         self._setup_ui()
+        # Тяжёлые операции выполняются в пуле потоков, результаты возвращаются через after()
+        self.jobs = jobs.JobScheduler(self, on_progress=self.on_job_progress, on_idle=self.on_jobs_idle)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        # Окно показывается сразу, графика догружается, когда цикл событий простаивает
+        self.after_idle(lambda: self.jobs.submit("warm_up", "Подготовка графики...", self._warm_up_plotting,
+                                                 on_done=lambda _: self._ensure_map_canvas()))
 
     def _setup_ui(self):
         self.grid_columnconfigure(1, weight=1)
@@ -56,12 +126,7 @@ class RadioApp(ctk.CTk):
         self.ant_diam_entry = self.create_field(self.ant_frame, "Диаметр антенны d (м):", "0.6")
 
         self.surface_frame = self.create_group("6. Подстилающая поверхность")
-        surface_types = [
-            "Малопересеченная равнина, пойменные луга, солончаки",
-            "Малопересеченная равнина, покрытая лесом",
-            "Среднепересеченная открытая местность",
-            "Среднепересеченная местность, покрытая лесом"
-        ]
+        surface_types = link_analysis.SURFACE_TYPES
         self.surface_var = ctk.StringVar(value=surface_types[0])
         self.surface_menu = ctk.CTkOptionMenu(
             self.surface_frame, values=surface_types, variable=self.surface_var
@@ -69,9 +134,9 @@ class RadioApp(ctk.CTk):
         self.surface_menu.pack(pady=5, padx=10, fill="x")
 
         ctk.CTkLabel(self.ant_frame, text="Конструкция антенны:", text_color="black").pack(pady=(5, 0))
-        self.ant_type_var = ctk.StringVar(value="Однозеркальная (η=0.6)")
+        self.ant_type_var = ctk.StringVar(value=link_analysis.ANT_TYPES[0])
         self.ant_type_menu = ctk.CTkOptionMenu(
-            self.ant_frame, values=["Однозеркальная (η=0.6)", "Двузеркальная (η=0.7)"],
+            self.ant_frame, values=link_analysis.ANT_TYPES,
             variable=self.ant_type_var
         )
         self.ant_type_menu.pack(pady=(0, 10), padx=10, fill="x")
@@ -80,10 +145,31 @@ class RadioApp(ctk.CTk):
         self.btn_load = ctk.CTkButton(self.sidebar, text="Загрузить карту .HGT", command=self.load_file)
         self.btn_load.pack(pady=10, padx=10, fill="x")
 
+        self.shading_var = ctk.StringVar(value=next(iter(MAP_SHADINGS)))
+        self.shading_menu = ctk.CTkOptionMenu(self.sidebar, values=list(MAP_SHADINGS), variable=self.shading_var,
+                                              command=lambda choice: self.restyle_map())
+        self.shading_menu.pack(pady=(0, 10), padx=10, fill="x")
+
         self.btn_plot = ctk.CTkButton(self.sidebar, text="Построить профиль",
                                       command=self.show_profile_window, fg_color="#2c5d2c", hover_color="#1e401e")
         self.btn_plot.pack(pady=10, padx=10, fill="x")
 
+        self.btn_mast = ctk.CTkButton(self.sidebar, text="Подобрать высоту А1",
+                                      command=self.solve_mast_height, fg_color="#2c5d2c", hover_color="#1e401e")
+        self.btn_mast.pack(pady=5, padx=10, fill="x")
+
+        self.btn_sweep = ctk.CTkButton(self.sidebar, text="Перебор параметров",
+                                       command=self.show_sweep_window, fg_color="#2c5d2c", hover_color="#1e401e")
+        self.btn_sweep.pack(pady=5, padx=10, fill="x")
+
+        self.btn_coverage = ctk.CTkButton(self.sidebar, text="Зона покрытия от А1",
+                                          command=self.show_coverage, fg_color="#8a5a00", hover_color="#634000")
+        self.btn_coverage.pack(pady=5, padx=10, fill="x")
+
+        self.btn_power_map = ctk.CTkButton(self.sidebar, text="Карта мощности P_пр от А1",
+                                           command=self.show_power_map, fg_color="#8a5a00", hover_color="#634000")
+        self.btn_power_map.pack(pady=5, padx=10, fill="x")
+
         self.btn_clear = ctk.CTkButton(self.sidebar, text="Сбросить точки",
                                        command=self.clear_points, fg_color="#777777", hover_color="#555555")
         self.btn_clear.pack(pady=5, padx=10, fill="x")
@@ -92,6 +178,45 @@ class RadioApp(ctk.CTk):
         self.plot_frame = ctk.CTkFrame(self, fg_color="#FFFFFF")
         self.plot_frame.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
 
+        # Холст карты создаётся после появления окна (_ensure_map_canvas): matplotlib не грузится при запуске
+        self.fig = self.ax = self.canvas = self.toolbar = None
+        self.map_placeholder = ctk.CTkLabel(self.plot_frame, text="Загрузите карту высот (.hgt)",
+                                            text_color="#777777")
+
+        # Строка состояния фоновых задач
+        self.status_frame = ctk.CTkFrame(self.plot_frame, fg_color="#F2F2F2")
+        self.status_frame.pack(side="bottom", fill="x")
+        self.status_label = ctk.CTkLabel(self.status_frame, text="Готово", anchor="w", text_color="black")
+        self.status_label.pack(side="left", padx=10, fill="x", expand=True)
+        # Итог расчёта трассы при перетаскивании её точек
+        self.route_label = ctk.CTkLabel(self.status_frame, text="", anchor="e", text_color="black")
+        self.route_label.pack(side="left", padx=10)
+        # Замеры этапов последней операции (включаются SRTM_TIMING=1 или клавишей F12)
+        self.timing_label = ctk.CTkLabel(self.status_frame, text="", anchor="e", text_color="#555555")
+        if timing.ENABLED:
+            self.timing_label.pack(side="left", padx=10)
+        self.bind("<F12>", lambda event: self.toggle_timing())
+        self.btn_cancel = ctk.CTkButton(self.status_frame, text="Отменить", width=90, state="disabled",
+                                        command=self.cancel_jobs, fg_color="#777777", hover_color="#555555")
+        self.btn_cancel.pack(side="right", padx=10, pady=5)
+        self.progress_bar = ctk.CTkProgressBar(self.status_frame, width=200)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(side="right", padx=10)
+        self.map_placeholder.pack(fill="both", expand=True)
+
+    def _warm_up_plotting(self, job):
+        """Рабочий поток: импорт matplotlib заранее, пока пользователь заполняет параметры."""
+        for name in MATPLOTLIB_MODULES:
+            importlib.import_module(name)
+
+    def _ensure_map_canvas(self):
+        """Создаёт фигуру и холст карты при первой необходимости (поток Tk)."""
+        if self.canvas is not None:
+            return
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
+
+        self.map_placeholder.destroy()
         self.fig = Figure(figsize=(8, 6), dpi=100, facecolor='#F5F5F5')
         self.ax = self.fig.add_subplot(111)
         self.ax.set_facecolor('#FFFFFF')
@@ -100,11 +225,18 @@ class RadioApp(ctk.CTk):
             spine.set_color('black')
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.plot_frame)
+        # Панель масштабирования и перемещения карты
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self.plot_frame, pack_toolbar=False)
+        self.toolbar.pack(side="bottom", fill="x")
         canvas_widget = self.canvas.get_tk_widget()
         canvas_widget.pack(fill="both", expand=True)
         canvas_widget.configure(bg='#FFFFFF', highlightthickness=0)
 
         self.canvas.mpl_connect('button_press_event', self.on_map_click)
+        self.canvas.mpl_connect('button_release_event', self.on_map_release)
+        self.canvas.mpl_connect('resize_event', lambda event: self.schedule_map_levels())
+        self.canvas.mpl_connect('draw_event', self.on_map_draw)
+        self.canvas.mpl_connect('motion_notify_event', self.on_map_motion)
 
     def create_group(self, title):
         frame = ctk.CTkFrame(self.sidebar, fg_color="#FFFFFF", border_width=1, border_color="#DDDDDD")
@@ -119,86 +251,643 @@ class RadioApp(ctk.CTk):
         entry.pack(pady=(0, 10), padx=10, fill="x")
         return entry
 
+    def on_job_progress(self, job, fraction, text):
+        self.progress_bar.set(fraction)
+        self.status_label.configure(text=text or job.title)
+        self.btn_cancel.configure(state="normal")
+
+    def on_jobs_idle(self):
+        self.progress_bar.set(0)
+        self.status_label.configure(text="Готово")
+        self.btn_cancel.configure(state="disabled")
+
+    def on_job_error(self, title):
+        def handler(error):
+            mb.showerror(title, str(error))
+        return handler
+
+    def toggle_timing(self):
+        timing.configure(enabled=not timing.ENABLED)
+        if timing.ENABLED:
+            self.timing_label.configure(text="Замеры включены")
+            self.timing_label.pack(side="left", padx=10)
+        else:
+            self.timing_label.pack_forget()
+
+    def show_timing(self, trace):
+        """Завершает замер операции и показывает его в строке состояния."""
+        trace.finish()
+        if trace.wall is not None:
+            text = trace.summary()
+            if trace.profile_path:
+                text += f" | профиль: {os.path.basename(trace.profile_path)}"
+            self.timing_label.configure(text=text)
+
+    def cancel_jobs(self):
+        self.jobs.cancel()
+        self._remove_pending_power_map()
+
+    def on_close(self):
+        self.jobs.shutdown()
+        self._remove_power_map_file()
+        self._remove_pending_power_map()
+        self.profile_cache.close()
+        self.destroy()
+
     def load_file(self):
-        path = fd.askopenfilename(filetypes=[("HGT files", "*.hgt")])
-        if path:
-            self.hgt_path = path
-            self.current_matrix, self.map_extent = app_logic.load_hgt_matrix(path)
-            self.points = []
+        paths = fd.askopenfilenames(filetypes=[("HGT files", "*.hgt")])
+        if paths:
+            self.hgt_path = paths[0]
+            try:
+                keys = [self.tile_index.add(path) for path in paths]
+            except ValueError:
+                keys = None
+            trace = timing.Trace("load_file")
+            shading = MAP_SHADINGS[self.shading_var.get()]
+            self.jobs.submit("load", "Загрузка карты...", self._load_rasters, keys, self.hgt_path, shading, trace,
+                             on_done=lambda loaded: self._on_map_loaded(loaded, trace),
+                             on_error=self.on_job_error("Загрузка карты"))
+
+    def _load_rasters(self, job, keys, path, shading, trace):
+        """Рабочий поток: открывает растры, строит (или читает из кэша) пирамиды и их изображения."""
+        with trace.activate():
+            with timing.span("load.open"):
+                if keys is not None:
+                    # Несколько выбранных тайлов показываются мозаикой, каждый своим изображением
+                    rasters = [self.tile_index.tile(key) for key in sorted(set(keys))]
+                    source = self.tile_index
+                else:
+                    # Растр читается один раз и дальше профили берутся из памяти
+                    rasters = [app_logic.open_raster(path)]
+                    source = rasters[0]
+            pyramids = []
+            for i, raster in enumerate(rasters):
+                job.progress(i / len(rasters), f"Подготовка обзора {i + 1}/{len(rasters)}...")
+                with timing.span("load.pyramid"):
+                    pyramids.append(map_pyramid.load_pyramid(raster))
+            layers = self._render_layers(job, pyramids, shading)
+        return source, pyramids, layers
+
+    def _render_layers(self, job, pyramids, shading):
+        """Рабочий поток: RGBA-изображения уровней в общей шкале цветов мозаики (из кэша на диске)."""
+        style = render_cache.style_for(pyramids, shading)
+        layers = []
+        for i, pyramid in enumerate(pyramids):
+            job.progress(i / len(pyramids), f"Отрисовка карты {i + 1}/{len(pyramids)}...")
+            with timing.span("load.render"):
+                layers.append(render_cache.load_layers(pyramid, style, check=job.check))
+        return layers
+
+    def restyle_map(self):
+        """Перерисовка загруженной карты в выбранном варианте затенения без сброса масштаба."""
+        if not self.map_pyramids:
+            return
+        self.jobs.submit("render", "Отрисовка карты...", self._render_layers, list(self.map_pyramids),
+                         MAP_SHADINGS[self.shading_var.get()], on_done=self._on_map_restyled,
+                         on_error=self.on_job_error("Отрисовка карты"))
+
+    def _on_map_restyled(self, layers):
+        if [layer.pyramid for layer in layers] != self.map_pyramids:
+            # Пока шла отрисовка, загрузили другую карту
+            return
+        self.map_layers = layers
+        self.update_map_levels()
+        self.canvas.draw_idle()
+
+    def _on_map_loaded(self, loaded, trace):
+        self.profile_source, self.map_pyramids, self.map_layers = loaded
+        extents = np.array([pyramid.extent for pyramid in self.map_pyramids])
+        self.map_extent = [extents[:, 0].min(), extents[:, 1].max(), extents[:, 2].min(), extents[:, 3].max()]
+        self.points = []
+        self.drag_index = None
+        self.drag_params = None
+        self.route_label.configure(text="")
+        self._ensure_map_canvas()
+        with trace.activate(), timing.span("refresh_map"):
             self.refresh_map()
-            self.btn_load.configure(text="Карта загружена", fg_color="#1f538d")
+        self.btn_load.configure(text="Карта загружена", fg_color="#1f538d")
+        self.show_timing(trace)
+        # Затенение сменили, пока шла загрузка: перерисовка тогда была отброшена
+        if any(layer.style.shading != MAP_SHADINGS[self.shading_var.get()] for layer in self.map_layers):
+            self.restyle_map()
 
     def refresh_map(self):
-        if self.current_matrix is not None:
+        if self.map_pyramids:
+            trace = timing.Trace("refresh_map")
+            with trace.activate():
+                self._refresh_map()
+            self.show_timing(trace)
+
+    def _refresh_map(self):
+        with timing.span("map.clear"):
             self.ax.clear()
-            self.ax.set_facecolor('#FFFFFF')
-            self.ax.tick_params(colors='black')
-            for spine in self.ax.spines.values():
-                spine.set_color('black')
-
-            self.ax.imshow(self.current_matrix, extent=self.map_extent, cmap='terrain', origin='upper')
+        self.coverage_image = None
+        self.ax.set_facecolor('#FFFFFF')
+        self.ax.tick_params(colors='black')
+        for spine in self.ax.spines.values():
+            spine.set_color('black')
 
-            for p in self.points:
-                self.ax.plot(p[1], p[0], 'ro', markersize=7, markeredgecolor='black', markeredgewidth=1)
+        # Тайлы уже отрисованы в общей шкале цветов: imshow получает готовые RGBA-байты
+        self.map_images = [
+            self.ax.imshow(np.zeros((1, 1, 4), dtype=np.uint8), extent=layer.extent, origin='upper')
+            for layer in self.map_layers
+        ]
+        self.ax.set_xlim(self.map_extent[0], self.map_extent[1])
+        self.ax.set_ylim(self.map_extent[2], self.map_extent[3])
+        self.ax.set_autoscale_on(False)
+        with timing.span("map.levels"):
+            self.update_map_levels()
+        # ax.clear() сбрасывает обработчики осей, поэтому подключаем их заново
+        self.ax.callbacks.connect('xlim_changed', lambda ax: self.schedule_map_levels())
+        self.ax.callbacks.connect('ylim_changed', lambda ax: self.schedule_map_levels())
+
+        # Анимированные артисты не попадают в фон и перерисовываются отдельно
+        self.overlay_artists = {
+            "route": self.ax.plot([], [], 'r--', linewidth=2, animated=True)[0],
+            "preview": self.ax.plot([], [], 'r:', linewidth=1.5, alpha=0.7, animated=True)[0],
+            "points": self.ax.plot([], [], 'ro', markersize=7, markeredgecolor='black',
+                                   markeredgewidth=1, animated=True)[0],
+        }
+        with timing.span("map.draw"):
+            self.canvas.draw()
 
-            if len(self.points) == 2:
-                lats, lons = zip(*self.points)
-                self.ax.plot(lons, lats, 'r--', linewidth=2)
+    def on_map_draw(self, event):
+        """После полной перерисовки сохраняет фон карты и накладывает слой точек."""
+        self.map_background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_overlay(blit=False)
 
-            self.canvas.draw()
+    def draw_overlay(self, blit=True):
+        """Обновляет маркеры, линию трассы и предпросмотр без перерисовки рельефа."""
+        if self.map_background is None or not self.overlay_artists:
+            return
+        lats = [p[0] for p in self.points]
+        lons = [p[1] for p in self.points]
+        self.overlay_artists["points"].set_data(lons, lats)
+        if len(self.points) == 2:
+            self.overlay_artists["route"].set_data(lons, lats)
+        else:
+            self.overlay_artists["route"].set_data([], [])
+        if len(self.points) == 1 and self.hover_point is not None:
+            self.overlay_artists["preview"].set_data([lons[0], self.hover_point[1]], [lats[0], self.hover_point[0]])
+        else:
+            self.overlay_artists["preview"].set_data([], [])
+
+        if blit:
+            self.canvas.restore_region(self.map_background)
+        for artist in self.overlay_artists.values():
+            self.ax.draw_artist(artist)
+        if blit:
+            self.canvas.blit(self.fig.bbox)
+
+    def on_map_motion(self, event):
+        """Перетаскивание точки трассы или предпросмотр трассы от первой точки до курсора."""
+        if self.drag_index is not None:
+            if event.inaxes is self.ax:
+                self.points[self.drag_index] = (event.ydata, event.xdata)
+                self.draw_overlay()
+                self.schedule_live_profile()
+            return
+        if len(self.points) != 1 or self.toolbar.mode:
+            return
+        self.hover_point = (event.ydata, event.xdata) if event.inaxes is self.ax else None
+        self.draw_overlay()
+
+    def update_map_levels(self):
+        """Подбирает уровень пирамиды под масштаб и показывает только видимое окно."""
+        bbox = self.ax.get_window_extent()
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+        for layer, image in zip(self.map_layers, self.map_images):
+            selected = layer.select(xlim, ylim, bbox.width, bbox.height)
+            image.set_visible(selected is not None)
+            if selected is not None:
+                window, extent = selected
+                image.set_data(window)
+                image.set_extent(extent)
+
+    def schedule_map_levels(self):
+        """Откладывает смену уровней до простоя: при зуме xlim и ylim меняются подряд."""
+        if not self._levels_pending and self.map_images:
+            self._levels_pending = True
+            self.after_idle(self._apply_map_levels)
+
+    def _apply_map_levels(self):
+        self._levels_pending = False
+        self.update_map_levels()
+        self.canvas.draw_idle()
 
     def on_map_click(self, event):
-        if event.inaxes and self.current_matrix is not None:
+        if self.toolbar.mode:
+            # Клик в режиме масштабирования/перемещения не ставит точку
+            return
+        if event.inaxes and self.map_pyramids:
+            index = self._point_at(event)
+            if index is not None:
+                # Захват точки: дальше она следует за курсором (on_map_motion);
+                # профиль и подбор высоты для прежнего положения точки больше не нужны
+                self.jobs.cancel("profile")
+                self.jobs.cancel("mast")
+                self.drag_index = index
+                self.drag_params = self.read_link_params()
+                return
             if len(self.points) < 2:
+                # Расчёт для прежней трассы больше не нужен
+                self.jobs.cancel("profile")
                 self.points.append((event.ydata, event.xdata))
-                self.refresh_map()
+                self.hover_point = None
+                self.draw_overlay()
+
+    def _point_at(self, event):
+        """Индекс точки трассы в пределах DRAG_RADIUS_PX от курсора или None."""
+        if not self.points:
+            return None
+        xy = self.ax.transData.transform([(lon, lat) for lat, lon in self.points])
+        distance = np.hypot(xy[:, 0] - event.x, xy[:, 1] - event.y)
+        index = int(np.argmin(distance))
+        return index if distance[index] <= DRAG_RADIUS_PX else None
+
+    def on_map_release(self, event):
+        # Последнее положение точки досчитывается уже запланированным пересчётом
+        self.drag_index = None
+        self._end_drag_if_done()
+
+    def _end_drag_if_done(self):
+        """Параметры перетаскивания больше не нужны, когда отпущенная точка досчитана."""
+        if self.drag_index is None and not self._live_dirty and self._live_timer is None \
+                and not self.jobs.running("live_profile"):
+            self.drag_params = None
+
+    def schedule_live_profile(self):
+        """
+        Пересчёт трассы при перетаскивании точки: не чаще LIVE_PROFILE_INTERVAL_MS
+        и не больше одного расчёта одновременно. Промежуточные положения точки,
+        накопившиеся за это время, пропускаются, последнее считается всегда.
+        """
+        if len(self.points) < 2 or self.profile_source is None:
+            return
+        self._live_dirty = True
+        if self._live_timer is not None or self.jobs.running("live_profile"):
+            return
+        wait_ms = LIVE_PROFILE_INTERVAL_MS - (time.monotonic() - self._live_submitted) * 1000
+        self._live_timer = self.after(max(0, int(wait_ms)), self._submit_live_profile)
+
+    def _submit_live_profile(self):
+        self._live_timer = None
+        if not self._live_dirty or len(self.points) < 2:
+            return
+        self._live_dirty = False
+        self._live_submitted = time.monotonic()
+        params = self.drag_params or self.read_link_params()
+        # До 20 кадров в секунду: без прогресса в строке состояния, иначе она мигает
+        self.jobs.submit("live_profile", "Пересчёт трассы...", self._analyze_live_route, self.profile_source,
+                         self.points[0], self.points[1], params,
+                         on_done=lambda result: self._on_live_profile_ready(result, params),
+                         on_error=self._on_live_profile_error, quiet=True)
+
+    def _analyze_live_route(self, job, source, p1, p2, params):
+        """
+        Рабочий поток: профиль и расчёт для текущего положения точек. Тайлы трассы
+        читаются в память один раз, поэтому следующие положения не ждут диска;
+        промежуточные профили не пишутся в кэш профилей.
+        """
+        if isinstance(source, app_logic.TileIndex):
+            source.preload(source.route_keys(p1, p2))
+        profile = app_logic.get_elevation_profile(source, p1, p2, num_points=None, method="bilinear")
+        return link_analysis.analyze_link(profile, params)
+
+    def _on_live_profile_ready(self, result, params):
+        if result.interval == link_analysis.CLOSED:
+            text = f"Интервал закрытый: {result.status}"
+        elif not np.isfinite(result.P_rx):
+            # Вырожденная трасса (точки совпали) - расчёт не выполнялся
+            text = ""
+        else:
+            text = f"P_пр = {result.P_rx:.1f} дБм, запас {result.P_rx - params.sensitivity:.1f} дБ: {result.status}"
+        self.route_label.configure(text=text, text_color="#1e7a1e" if result.passed else "#b22222")
+        # Открытое окно профиля следует за трассой: меняются только данные его графика
+        self.profile_windows = [window for window in self.profile_windows if window.top.winfo_exists()]
+        if self.profile_windows:
+            window = self.profile_windows[-1]
+            self._update_profile_window(window, result, params)
+            window.canvas.draw_idle()
+        if self._live_dirty:
+            self.schedule_live_profile()
+        self._end_drag_if_done()
+
+    def _on_live_profile_error(self, error):
+        # Точка вне загруженных тайлов - не повод для окна с ошибкой посреди перетаскивания
+        self.route_label.configure(text=str(error), text_color="#b22222")
+        if self._live_dirty:
+            self.schedule_live_profile()
+        self._end_drag_if_done()
 
     def clear_points(self):
+        self.jobs.cancel("profile")
+        self.jobs.cancel("mast")
+        self.jobs.cancel("live_profile")
+        if self._live_timer is not None:
+            self.after_cancel(self._live_timer)
+            self._live_timer = None
+        self._live_dirty = False
+        self.drag_index = None
+        self.drag_params = None
+        self.route_label.configure(text="")
+        self.jobs.cancel("coverage")
+        self.jobs.cancel("power_map")
+        self._remove_pending_power_map()
         self.points = []
-        self.refresh_map()
-
-    def show_profile_window(self):
-        if len(self.points) < 2 or self.hgt_path is None:
+        self.hover_point = None
+        if self.coverage_image is not None:
+            self.coverage_image.remove()
+            self.coverage_image = None
+            self.canvas.draw_idle()
+        self.draw_overlay()
+
+    def show_coverage(self):
+        """Зона покрытия: передатчик в точке А1 (высота h1), приёмник высотой h2 над каждой ячейкой."""
+        if not self.points or not self.map_pyramids:
             return
+        params = self.read_link_params()
+        self.jobs.submit("coverage", "Расчёт зоны покрытия...", self._compute_coverage, self.points[0], params,
+                         on_done=self._on_coverage_ready, on_error=self.on_job_error("Зона покрытия"))
 
-        dist, elev = app_logic.get_elevation_profile(self.hgt_path, self.points[0], self.points[1])
-        total_dist = dist[-1]
-        distance = app_logic.haversine(self.points[0], self.points[1])
-
+    def show_power_map(self):
+        """Карта мощности на входе приёмника и пригодности для всех ячеек вокруг А1."""
+        if not self.points or not self.map_pyramids:
+            return
+        params = self.read_link_params()
+        fd_out, output_path = tempfile.mkstemp(prefix="power_map_", suffix=".npy")
+        os.close(fd_out)
+        # Новая задача заменяет прежнюю: её файл больше не нужен
+        self._remove_pending_power_map()
+        self.pending_power_map_path = output_path
+        self.jobs.submit("power_map", "Расчёт карты мощности...", self._compute_power_map, self.points[0], params,
+                         output_path, on_done=self._on_power_map_ready, on_error=self._on_power_map_error)
+
+    def _loaded_raster(self):
+        """Загруженные тайлы одним растром (для расчётов по всей карте)."""
+        if isinstance(self.profile_source, app_logic.TileIndex):
+            keys = [(pyramid.raster.lat, pyramid.raster.lon) for pyramid in self.map_pyramids]
+            return app_logic.Raster.from_extent(*self.tile_index.mosaic(keys))
+        return self.profile_source
+
+    def _compute_coverage(self, job, tx, params):
+        """Рабочий поток: склейка загруженных тайлов и радиальная развёртка."""
+        result = coverage.compute_coverage(self._loaded_raster(), tx, params.h1, params.h2,
+                                           params.freq_mhz / 1000.0,
+                                           progress=lambda fraction: job.progress(fraction))
+        return result, coverage.coverage_rgba(result)
+
+    def _compute_power_map(self, job, tx, params, output_path):
+        """Рабочий поток: параллельный расчёт P_пр по секторам в пуле процессов."""
         try:
-            h1, h2 = float(self.h1_entry.get()), float(self.h2_entry.get())
-            freq_mhz = float(self.freq_entry.get())
-            reliability = float(self.reliability_entry.get())
-            intervals = float(self.intervals_entry.get())
-            power = float(self.power_entry.get())
-            sensitivity = float(self.sensitivity_entry.get())
-            feeder_loss = float(self.feeder_loss_entry.get())
-            ant_diam = float(self.ant_diam_entry.get())
-            ant_type = self.ant_type_var.get()
+            result = coverage.compute_power_map(self._loaded_raster(), tx, params, output_path,
+                                                progress=lambda fraction: job.progress(fraction))
+            rgba = coverage.power_rgba(result)
+            job.check()
+        except BaseException:
+            # Ошибка или отмена: файл результата (десятки МБ) не должен оставаться во временном каталоге
+            _remove_file(output_path)
+            raise
+        return result, rgba, output_path
+
+    def _remove_power_map_file(self):
+        if self.power_map_path is not None:
+            _remove_file(self.power_map_path)
+            self.power_map_path = None
+
+    def _remove_pending_power_map(self):
+        """Удаляет файл незавершённой (отменённой) задачи карты мощности."""
+        if self.pending_power_map_path is not None:
+            _remove_file(self.pending_power_map_path)
+            self.pending_power_map_path = None
+
+    def _on_power_map_error(self, error):
+        self._remove_pending_power_map()
+        mb.showerror("Карта мощности", str(error))
+
+    def _on_power_map_ready(self, computed):
+        result, rgba, output_path = computed
+        self.pending_power_map_path = None
+        self._remove_power_map_file()
+        self.power_map_path = output_path
+        self._show_overlay(rgba, result.extent)
+
+    def _on_coverage_ready(self, computed):
+        result, rgba = computed
+        self._show_overlay(rgba, result.extent)
+
+    def _show_overlay(self, rgba, extent):
+        """Полупрозрачный слой расчёта поверх рельефа (один одновременно)."""
+        if self.coverage_image is not None:
+            self.coverage_image.remove()
+        self.coverage_image = self.ax.imshow(rgba, extent=extent, origin='upper',
+                                             interpolation='nearest', zorder=2)
+        self.canvas.draw_idle()
+
+    def read_link_params(self):
+        """Собирает LinkParams из полей левой панели (при ошибке ввода - значения по умолчанию)."""
+        try:
+            return link_analysis.LinkParams(
+                h1=float(self.h1_entry.get()),
+                h2=float(self.h2_entry.get()),
+                freq_mhz=float(self.freq_entry.get()),
+                reliability=float(self.reliability_entry.get()),
+                intervals=float(self.intervals_entry.get()),
+                power=float(self.power_entry.get()),
+                sensitivity=float(self.sensitivity_entry.get()),
+                feeder_loss=float(self.feeder_loss_entry.get()),
+                ant_diam=float(self.ant_diam_entry.get()),
+                ant_type=self.ant_type_var.get(),
+                surface=self.surface_var.get()
+            )
         except ValueError:
-            h1, h2, freq_mhz = 15, 15, 2400
-            reliability, intervals, power, sensitivity, feeder_loss, ant_diam = 99.9, 1.0, 1.0, -90, 3.0, 0.6
-            ant_type = "Однозеркальная (η=0.6)"
+            return link_analysis.LinkParams(surface=self.surface_var.get())
 
-        freq_ghz = freq_mhz / 1000.0
-        wavelength = 0.3 / freq_ghz  # м
-        wavelength_cm = wavelength * 100  # см
+    def show_profile_window(self):
+        if len(self.points) < 2 or self.profile_source is None:
+            return
 
-        ant_efficiency = 0.6 if "Однозеркальная" in ant_type else 0.7
-        G_linear = (np.pi * ant_diam) ** 2 * ant_efficiency / (wavelength ** 2)
-        G_dBi = 10 * np.log10(G_linear) if G_linear > 0 else -np.inf
+        params = self.read_link_params()
+        trace = timing.Trace("show_profile_window")
+        self.jobs.submit("profile", "Расчёт профиля...", self._analyze_route, self.profile_source,
+                         self.points[0], self.points[1], params, trace,
+                         on_done=lambda result: self._on_profile_ready(result, params, trace),
+                         on_error=self.on_job_error("Профиль трассы"))
+
+    def _analyze_route(self, job, source, p1, p2, params, trace):
+        """Рабочий поток: профиль трассы и расчёт интервала."""
+        with trace.activate():
+            with timing.span("profile"):
+                profile = app_logic.get_elevation_profile(source, p1, p2, num_points=None, method="bilinear",
+                                                        cache=self.profile_cache)
+            job.progress(0.5, "Расчёт интервала...")
+            with timing.span("analysis"):
+                return link_analysis.analyze_link(profile, params)
+
+    def _on_profile_ready(self, result, params, trace):
+        with trace.activate():
+            self.render_profile_window(result, params)
+        self.show_timing(trace)
+
+    def solve_mast_height(self):
+        """Минимальная высота А1 для открытого интервала при текущей высоте А2."""
+        if len(self.points) < 2 or self.profile_source is None:
+            return
 
-        d_km = distance / 1000.0
-        free_space_loss = 122 + 20 * np.log10(d_km / wavelength)
-        refraction_loss = 0.0
+        params = self.read_link_params()
+        self.jobs.submit("mast", "Подбор высоты А1...", self._solve_mast_height, self.profile_source,
+                         self.points[0], self.points[1], params,
+                         on_done=self._on_mast_height_ready, on_error=self.on_job_error("Подбор высоты А1"))
+
+    def _solve_mast_height(self, job, source, p1, p2, params):
+        """Рабочий поток: профиль трассы и решение для h1."""
+        profile = app_logic.get_elevation_profile(source, p1, p2, num_points=None, method="bilinear",
+                                                cache=self.profile_cache)
+        return link_analysis.min_mast_height(profile, params)
+
+    def _on_mast_height_ready(self, solution):
+        # Округляем вверх до 0.1 м, чтобы интервал оставался открытым
+        h1 = np.ceil(solution.h1[0] * 10) / 10
+        self.h1_entry.delete(0, "end")
+        self.h1_entry.insert(0, f"{h1:.1f}")
+        # Строка состояния после задачи сбрасывается в «Готово» - результат в строке трассы
+        self.route_label.configure(
+            text=f"h1 = {h1:.1f} м; препятствие на {solution.limiting_distance[0] / 1000:.2f} км "
+                 f"({solution.limiting_elevation[0]:.0f} м)", text_color="black")
+
+    @staticmethod
+    def _parse_range(text):
+        """'начало:конец:количество' -> равномерная сетка, иначе список через запятую."""
+        if ":" in text:
+            start, stop, num = text.split(":")
+            return np.linspace(float(start), float(stop), int(num))
+        return np.array([float(v) for v in text.replace(";", ",").split(",") if v.strip()])
+
+    def show_sweep_window(self):
+        """Окно перебора частоты, диаметра антенн, высот и мощности для текущей трассы."""
+        if len(self.points) < 2 or self.profile_source is None:
+            return
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
 
-        earth_arc = app_logic.get_earth_arc(dist)
-        elev_curved = elev + earth_arc
+        params = self.read_link_params()
+        top = ctk.CTkToplevel(self)
+        top.title("Перебор параметров трассы")
+        top.geometry("1400x650")
+        top.configure(fg_color="#FFFFFF")
 
-        ground_start, ground_end = elev_curved[0], elev_curved[-1]
-        ant_start, ant_end = ground_start + h1, ground_end + h2
-        los_line = np.linspace(ant_start, ant_end, len(dist))
-        f_radius = app_logic.get_fresnel_zone(dist, total_dist, freq_ghz)
+        left_frame = ctk.CTkFrame(top, width=300, fg_color="#F2F2F2", corner_radius=10)
+        left_frame.pack(side="left", fill="y", padx=10, pady=10)
+        right_frame = ctk.CTkFrame(top, fg_color="#FFFFFF")
+        right_frame.pack(side="left", fill="both", expand=True, padx=(0, 10), pady=10)
+
+        ctk.CTkLabel(left_frame, text="Диапазоны (начало:конец:кол-во\nили значения через запятую)",
+                     text_color="black").pack(pady=(10, 5), padx=10)
+        ranges = {
+            "freq_mhz": self.create_field(left_frame, "Частота f (МГц):", "1000:12000:45"),
+            "ant_diam": self.create_field(left_frame, "Диаметр антенны d (м):", "0.3, 0.6, 1.0, 1.2, 1.8, 2.4"),
+            "h1": self.create_field(left_frame, "Высота А1 (м):", f"{params.h1:g}"),
+            "h2": self.create_field(left_frame, "Высота А2 (м):", f"{params.h2:g}"),
+            "power": self.create_field(left_frame, "Мощность P (Вт):", f"{params.power:g}"),
+        }
+        summary = ctk.CTkLabel(left_frame, text="", justify="left", text_color="black", wraplength=280)
+
+        fig_s = Figure(figsize=(10, 5), dpi=100, facecolor='#FFFFFF')
+        canvas_s = FigureCanvasTkAgg(fig_s, master=right_frame)
+        canvas_s.get_tk_widget().pack(fill="both", expand=True)
+
+        def run():
+            try:
+                values = {name: self._parse_range(entry.get()) for name, entry in ranges.items()}
+            except ValueError:
+                mb.showerror("Перебор параметров", "Неверный формат диапазона")
+                return
+            self.jobs.submit("sweep", "Перебор параметров...", self._sweep_route, self.profile_source,
+                             self.points[0], self.points[1], params, values,
+                             on_done=lambda sweep: self.render_sweep(fig_s, canvas_s, summary, sweep),
+                             on_error=self.on_job_error("Перебор параметров"))
+
+        ctk.CTkButton(left_frame, text="Рассчитать", command=run, fg_color="#2c5d2c",
+                      hover_color="#1e401e").pack(pady=10, padx=10, fill="x")
+        summary.pack(padx=10, pady=5, anchor="nw")
+        run()
+
+    def _sweep_route(self, job, source, p1, p2, params, values):
+        """Рабочий поток: один профиль трассы и векторный перебор параметров."""
+        profile = app_logic.get_elevation_profile(source, p1, p2, num_points=None, method="bilinear",
+                                                cache=self.profile_cache)
+        job.progress(0.5, "Расчёт сетки параметров...")
+        return link_analysis.sweep_link(profile, params, **values)
+
+    def render_sweep(self, fig, canvas, summary, sweep):
+        freq = sweep.values("freq_mhz")
+        ant_diam = sweep.values("ant_diam")
+        # По высотам и мощности берём лучший вариант для каждой пары (f, d)
+        margin = sweep.margin.max(axis=(2, 3, 4))
+
+        fig.clear()
+        ax_curves = fig.add_subplot(121)
+        for j, d in enumerate(ant_diam):
+            ax_curves.plot(freq, margin[:, j], lw=1.5, label=f"d = {d:g} м")
+        ax_curves.axhline(0, color='red', ls='--', lw=1)
+        ax_curves.set_xlabel("Частота, МГц")
+        ax_curves.set_ylabel("Запас P_пр - P_мин, дБ")
+        ax_curves.set_title("Запас по мощности")
+        ax_curves.grid(True, ls=':', alpha=0.6)
+        ax_curves.legend(fontsize=8)
+
+        ax_surface = fig.add_subplot(122)
+        finite = np.isfinite(margin)
+        shown = np.where(finite, margin, np.nan)
+        if finite.any():
+            mesh = ax_surface.pcolormesh(freq, ant_diam, shown.T, cmap='RdYlGn', shading='nearest')
+            fig.colorbar(mesh, ax=ax_surface, label="Запас, дБ")
+            if len(freq) > 1 and len(ant_diam) > 1 and np.nanmin(shown) < 0 < np.nanmax(shown):
+                ax_surface.contour(freq, ant_diam, shown.T, levels=[0], colors='black', linewidths=1.5)
+        ax_surface.set_xlabel("Частота, МГц")
+        ax_surface.set_ylabel("Диаметр антенны, м")
+        ax_surface.set_title("Запас по мощности (лучшие высоты и мощность)")
+        fig.tight_layout()
+        canvas.draw()
+
+        best = sweep.best()
+        text = (f"Вариантов: {sweep.margin.size}\n"
+                f"Пригодных: {np.count_nonzero(sweep.passed)}\n\n"
+                f"Наибольший запас {np.max(sweep.margin):.1f} дБ:\n"
+                f"f = {best['freq_mhz']:g} МГц, d = {best['ant_diam']:g} м\n"
+                f"h1 = {best['h1']:g} м, h2 = {best['h2']:g} м, P = {best['power']:g} Вт")
+        summary.configure(text=text)
+
+    def render_profile_window(self, result, params):
+        """
+        Показывает результат в окне профиля. Открыто не больше MAX_PROFILE_WINDOWS
+        окон: сверх этого переиспользуется самое старое - его шаблон графика
+        (profile_plot.ProfilePlot) обновляется на месте, без новой фигуры.
+        """
+        stopwatch = timing.Stopwatch()
+        self.profile_windows = [window for window in self.profile_windows if window.top.winfo_exists()]
+        if len(self.profile_windows) >= MAX_PROFILE_WINDOWS:
+            window = self.profile_windows.pop(0)
+        else:
+            window = self._create_profile_window()
+        self.profile_windows.append(window)
+        stopwatch.lap("window.widgets")
+
+        self._update_profile_window(window, result, params)
+        # Раскладка легенды (loc='best') и заливок считается при отрисовке
+        with timing.span("plot.draw"):
+            window.canvas.draw()
+        window.top.deiconify()
+        window.top.lift()
+
+    def _update_profile_window(self, window, result, params):
+        window.params_label.configure(text=link_analysis.format_params(params))
+        window.result_label.configure(text=link_analysis.format_result(result, params))
+        window.plot.update(result, params, legend_draggable=True)
+
+    def _create_profile_window(self):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        import profile_plot
 
         # --- Окно с левой панелью и графиком ---
         top = ctk.CTkToplevel(self)
@@ -227,332 +916,26 @@ class RadioApp(ctk.CTk):
 
         # --- Исходные данные ---
         ctk.CTkLabel(left_frame, text="Исходные данные", font=bold_font).pack(pady=(10, 5))
-        left_text = (
-            f"Высота антенны А1: {h1} м\n"
-            f"Высота антенны А2: {h2} м\n"
-            f"Рабочая частота: {freq_mhz} МГц\n"
-            f"Длина волны: {wavelength:.3f} м ({wavelength_cm:.1f} см)\n"
-            f"Надёжность линии: {reliability} %\n"
-            f"Кол-во интервалов M: {int(intervals)}\n"
-            f"Мощность передатчика: {power} Вт\n"
-            f"Чувствительность: {sensitivity} дБм\n"
-            f"Затухание в фидере: {feeder_loss} дБ\n"
-            f"Диаметр антенны: {ant_diam} м\n"
-            f"Тип антенны: {ant_type}\n"
-            f"Подстилающая поверхность: {self.surface_var.get()}"
-        )
-        ctk.CTkLabel(left_frame, text=left_text, justify="left", font=text_font, text_color="black",
-                     wraplength=340).pack(padx=10, pady=5, anchor="nw")
+        params_label = ctk.CTkLabel(left_frame, text="", justify="left", font=text_font,
+                                    text_color="black", wraplength=340)
+        params_label.pack(padx=10, pady=5, anchor="nw")
 
         ctk.CTkLabel(left_frame, text="", height=10).pack()
         ctk.CTkLabel(left_frame, text="Результаты расчёта", font=bold_font).pack(pady=(10, 5))
-        results_label = ctk.CTkLabel(left_frame, text="", justify="left", font=text_font, text_color="black",
-                                     wraplength=340)
-        results_label.pack(padx=10, pady=5, anchor="nw")
+        result_label = ctk.CTkLabel(left_frame, text="", justify="left", font=text_font,
+                                    text_color="black", wraplength=340)
+        result_label.pack(padx=10, pady=5, anchor="nw")
 
         # --- График ---
-        fig_p = Figure(figsize=(8, 5), dpi=100, facecolor='#FFFFFF')
-        ax_p = fig_p.add_subplot(111)
-        ax_p.set_facecolor('#FCFCFC')
-        ax_p.tick_params(colors='black')
-
-        ax_p.fill_between(dist, earth_arc, -100, color='#ADD8E6', alpha=0.3, label='Кривизна Земли')
-        ax_p.fill_between(dist, elev_curved, earth_arc, color='sienna', alpha=0.6, label='Рельеф')
-        ax_p.fill_between(dist, los_line - f_radius, los_line + f_radius, color='yellow', alpha=0.3,
-                          label='Зона Френеля')
-        ax_p.plot(dist, los_line, 'b--', label='Линия LOS', lw=1.5)
-
-        # Мачты – добавлена метка для отображения в легенде
-        ax_p.plot([dist[0], dist[0]], [ground_start, ant_start], color='#444444', lw=3, label='Мачты')
-        ax_p.plot(dist[0], ant_start, 'ko', markersize=6, markeredgecolor='white')
-        ax_p.plot([dist[-1], dist[-1]], [ground_end, ant_end], color='#444444', lw=3)
-        ax_p.plot(dist[-1], ant_end, 'ko', markersize=6, markeredgecolor='white')
-
-        # --- Анализ интервала (полностью сохранён) ---
-        clearances = los_line - elev_curved
-        if np.min(clearances) >= 0:  # LOS не пересекает рельеф -> открытый или полуоткрытый
-            min_clearance_idx = np.argmin(clearances)
-            x0 = dist[min_clearance_idx]
-            y0 = elev_curved[min_clearance_idx]
-            x1, y1 = dist[0], ant_start
-            x2, y2 = dist[-1], ant_end
-            dx = x2 - x1
-            dy = y2 - y1
-            dx2 = dx * dx
-            dy2 = dy * dy
-            if dx2 + dy2 > 0:
-                t = ((x0 - x1) * dx + (y0 - y1) * dy) / (dx2 + dy2)
-                t = max(0, min(1, t))
-                x_proj = x1 + t * dx
-                y_proj = y1 + t * dy
-
-                d1 = x_proj
-                d2 = total_dist - x_proj
-                H0 = np.sqrt((wavelength * d1 * d2) / total_dist)
-                R0 = 6370000.0
-                K = 4 / 3
-                # Геометрический просвет (без учёта рефракции)
-                H_geom = y_proj - y0
-                # Поправка на рефракцию
-                delta_H = (d1 * d2) / (2 * R0) * (1 - 1 / K)
-                H_g = H_geom + delta_H
-
-                if intervals > 0:
-                    T_i = (100 - reliability) / intervals
-                else:
-                    T_i = 0
-
-                # Определяем тип интервала по эффективному просвету H_g
-                if H_g >= H0:
-                    # ========== ОТКРЫТЫЙ ИНТЕРВАЛ ==========
-                    h0_rel = H_g / H0
-                    surface_text = self.surface_var.get()
-
-                    if wavelength_cm <= 30:
-                        phi_table = {
-                            "Малопересеченная равнина, пойменные луга, солончаки": 0.9,
-                            "Малопересеченная равнина, покрытая лесом": 0.7,
-                            "Среднепересеченная открытая местность": 0.5,
-                            "Среднепересеченная местность, покрытая лесом": 0.3
-                        }
-                    else:
-                        phi_table = {
-                            "Малопересеченная равнина, пойменные луга, солончаки": 0.95,
-                            "Малопересеченная равнина, покрытая лесом": 0.9,
-                            "Среднепересеченная открытая местность": 0.7,
-                            "Среднепересеченная местность, покрытая лесом": 0.6
-                        }
-                    phi = phi_table.get(surface_text, 0.8)
-
-                    # Поиск участка отражения (пересечения LOS-H0 с рельефом)
-                    critical_line = los_line - H0
-                    crosses = []
-                    for i in range(len(dist) - 1):
-                        diff1 = elev_curved[i] - critical_line[i]
-                        diff2 = elev_curved[i + 1] - critical_line[i + 1]
-                        if diff1 * diff2 < 0:
-                            x1c, x2c = dist[i], dist[i + 1]
-                            y1c, y2c = elev_curved[i], elev_curved[i + 1]
-                            yc1, yc2 = critical_line[i], critical_line[i + 1]
-                            denom = (y2c - y1c) - (yc2 - yc1)
-                            if abs(denom) > 1e-9:
-                                t_cross = (yc1 - y1c) / denom
-                                x_cross = x1c + t_cross * (x2c - x1c)
-                                crosses.append(x_cross)
-                    l0 = 0
-                    delta_y = 0
-                    left_cross = right_cross = None
-                    if len(crosses) >= 2:
-                        crosses.sort()
-                        left_cross = None
-                        right_cross = None
-                        for xc in crosses:
-                            if xc <= x0 and (left_cross is None or xc > left_cross):
-                                left_cross = xc
-                            if xc >= x0 and (right_cross is None or xc < right_cross):
-                                right_cross = xc
-                        if left_cross is not None and right_cross is not None and left_cross < right_cross:
-                            l0 = right_cross - left_cross
-                            mask = (dist >= left_cross) & (dist <= right_cross)
-                            if np.any(mask):
-                                max_elev = np.max(elev_curved[mask])
-                                y_left_crit = np.interp(left_cross, dist, critical_line)
-                                y_right_crit = np.interp(right_cross, dist, critical_line)
-                                x_max = dist[mask][np.argmax(elev_curved[mask])]
-                                if l0 > 0:
-                                    t_mn = (x_max - left_cross) / l0
-                                    y_mn = y_left_crit + t_mn * (y_right_crit - y_left_crit)
-                                    delta_y = max_elev - y_mn
-                    if l0 > 0 and delta_y > 0:
-                        a = (l0 ** 2) / (8 * delta_y)
-                        a = np.clip(a, 100, 100_000_000)
-                    else:
-                        a = 1e9
-
-                    R = total_dist
-                    R1 = d1
-                    H = H_g
-                    if a > 0 and H0 > 0 and R > 0:
-                        term = (2 * R1 * (R - R1)) / (a * R) * (H / H0)
-                        term = max(0, term)
-                        D = 1.0 / np.sqrt(1 + term)
-                    else:
-                        D = 1.0
-
-                    phi3 = phi * D if D < 0.95 else phi
-
-                    cos_term = np.cos((np.pi / 3) * (h0_rel ** 2))
-                    cos_term = np.clip(cos_term, -1.0, 1.0)
-                    Wp = -10 * np.log10(1 + phi3 ** 2 - 2 * phi3 * cos_term)
-                    if np.isnan(Wp) or Wp > 50:
-                        Wp = 50.0
-
-                    total_loss = free_space_loss + Wp + refraction_loss + 2 * feeder_loss
-                    P_tx_dbm = 10 * np.log10(power * 1000)
-                    P_prm_dbm = P_tx_dbm + G_dBi + G_dBi - total_loss
-                    status = "ПРИГОДЕН" if P_prm_dbm >= sensitivity else "НЕ ПРИГОДЕН"
-
-                    result_text = (
-                        f"d1 = {d1:.0f} м\nd2 = {d2:.0f} м\n"
-                        f"Радиус зоны Френеля H0 = {H0:.2f} м\n"
-                        f"Фактический просвет H(g) = {H_g:.2f} м\n"
-                        f"Относительный просвет h0 = {h0_rel:.3f}\n"
-                        f"Коэфф. перерыва связи T_i = {T_i:.4f} %\n"
-                        f"Тип поверхности: {surface_text}\n"
-                        f"Протяжённость участка отражения l0 = {l0:.0f} м\n"
-                        f"Коэфф. расходимости D = {D:.4f}\n"
-                        f"Коэфф. отражения Φ₃ = {phi3:.4f}\n"
-                        f"Затухание на рельеф Wp = {Wp:.1f} дБ\n"
-                        f"Суммарные потери: {total_loss:.1f} дБ\n"
-                        f"Мощность на входе приёмника: {P_prm_dbm:.1f} дБм\n"
-                        f"Статус интервала: {status}"
-                    )
-                    results_label.configure(text=result_text)
-
-                    # Визуализация для открытого интервала (если есть отражающий участок)
-                    if l0 > 0 and delta_y > 0 and left_cross is not None and right_cross is not None:
-                        y_left_crit = np.interp(left_cross, dist, critical_line)
-                        y_right_crit = np.interp(right_cross, dist, critical_line)
-                        ax_p.plot(left_cross, y_left_crit, 'bo', markersize=6, label='Границы участка отражения')
-                        ax_p.plot(right_cross, y_right_crit, 'bo', markersize=6)
-                        ax_p.plot([left_cross, right_cross], [y_left_crit, y_right_crit], 'g-', linewidth=2,
-                                  label=f'Хорда l₀ = {l0:.0f} м')
-                        mask = (dist >= left_cross) & (dist <= right_cross)
-                        if np.any(mask):
-                            max_idx = np.argmax(elev_curved[mask])
-                            x_max = dist[mask][max_idx]
-                            y_max = elev_curved[mask][max_idx]
-                            y_chord = np.interp(x_max, [left_cross, right_cross], [y_left_crit, y_right_crit])
-                            ax_p.plot([x_max, x_max], [y_chord, y_max], 'r-', linewidth=2,
-                                      label=f'Δy = {delta_y:.1f} м')
-                            ax_p.plot(x_max, y_max, 'ro', markersize=6, label='Вершина отражающего участка')
-                        if a < 5e5:
-                            center_x = (left_cross + right_cross) / 2
-                            chord_half = l0 / 2
-                            if a > chord_half:
-                                alpha = np.arcsin(chord_half / a)
-                                theta = np.linspace(-alpha, alpha, 50)
-                                center_y = y_left_crit + a - np.sqrt(a ** 2 - chord_half ** 2)
-                                x_arc = center_x + a * np.sin(theta)
-                                y_arc = center_y - a * np.cos(theta)
-                                ax_p.plot(x_arc, y_arc, 'm--', linewidth=1.5, alpha=0.7,
-                                          label=f'Радиус a = {a / 1000:.1f} км')
-                                ax_p.plot(center_x, center_y, 'mx', markersize=5)
-
-                else:
-                    # ========== ПОЛУОТКРЫТЫЙ ИНТЕРВАЛ ==========
-                    # Рисуем перпендикуляр и точку
-                    ax_p.plot(x0, y0, 'ro', markersize=8, markeredgecolor='black', zorder=5,
-                              label='Ближайшая точка рельефа')
-                    ax_p.plot([x0, x_proj], [y0, y_proj], 'g-', linewidth=2, label='Перпендикуляр к LOS')
-
-                    critical_line = los_line - H0
-                    # Поиск пересечений
-                    crosses = []
-                    for i in range(len(dist) - 1):
-                        diff1 = elev_curved[i] - critical_line[i]
-                        diff2 = elev_curved[i + 1] - critical_line[i + 1]
-                        if diff1 * diff2 < 0:
-                            x1c, x2c = dist[i], dist[i + 1]
-                            y1c, y2c = elev_curved[i], elev_curved[i + 1]
-                            yc1, yc2 = critical_line[i], critical_line[i + 1]
-                            denom = (y2c - y1c) - (yc2 - yc1)
-                            if abs(denom) > 1e-9:
-                                t_cross = (yc1 - y1c) / denom
-                                x_cross = x1c + t_cross * (x2c - x1c)
-                                crosses.append(x_cross)
-
-                    l = 0
-                    h = 0
-                    if len(crosses) >= 2:
-                        crosses.sort()
-                        left_cross = None
-                        right_cross = None
-                        for xc in crosses:
-                            if xc <= x0 and (left_cross is None or xc > left_cross):
-                                left_cross = xc
-                            if xc >= x0 and (right_cross is None or xc < right_cross):
-                                right_cross = xc
-                        if left_cross is not None and right_cross is not None and left_cross < right_cross:
-                            l = right_cross - left_cross
-                            mask = (dist >= left_cross) & (dist <= right_cross)
-                            if np.any(mask):
-                                max_elev = np.max(elev_curved[mask])
-                                y_left_crit = np.interp(left_cross, dist, critical_line)
-                                y_right_crit = np.interp(right_cross, dist, critical_line)
-                                x_max = dist[mask][np.argmax(elev_curved[mask])]
-                                if l > 0:
-                                    t_mn = (x_max - left_cross) / l
-                                    y_mn = y_left_crit + t_mn * (y_right_crit - y_left_crit)
-                                    h = max_elev - y_mn
-
-                    if l <= 0 or h <= 0:
-                        Wp = 0.0
-                        l = 0
-                        h = 0
-                    else:
-                        p_rel = H_geom / H0 if H0 > 0 else 0
-                        if p_rel < 1:
-                            Wp = 12 * (1 - p_rel) ** 2
-                        else:
-                            Wp = 0.0
-
-                    total_loss = free_space_loss + Wp + refraction_loss + 2 * feeder_loss
-                    P_tx_dbm = 10 * np.log10(power * 1000)
-                    P_prm_dbm = P_tx_dbm + G_dBi + G_dBi - total_loss
-                    status = "ПРИГОДЕН" if P_prm_dbm >= sensitivity else "НЕ ПРИГОДЕН"
-
-                    result_text = (
-                        f"Расстояние от передатчика до препятствия d1 = {d1:.0f}м\n"
-                        f"Расстояние от приемника до препятствия d2 = {d2:.0f}м\n"
-                        f"Радиус зоны Френеля H0 = {H0:.2f} м\n"
-                        f"Геометрический просвет H(geom) = {H_geom:.2f} м\n"
-                        f"Коэфф. перерыва связи T_i = {T_i:.4f} %\n"
-                        f"Протяжённость препятствия l = {l:.0f} м\n"
-                        f"Высота препятствия h = {h:.1f} м\n"
-                        f"Затухание на рельеф Wp = {Wp:.1f} дБ\n"
-                        f"Суммарные потери: {total_loss:.1f} дБ\n"
-                        f"Мощность на входе приёмника: {P_prm_dbm:.1f} дБм\n"
-                        f"Статус интервала: {status}"
-                    )
-                    results_label.configure(text=result_text)
-
-                    # Визуализация для полуоткрытого интервала
-                    ax_p.plot(dist, critical_line, 'k--', linewidth=1.5, alpha=0.7,
-                              label='LOS - H₀ (критический уровень)')
-                    if l > 0 and h > 0 and left_cross is not None and right_cross is not None:
-                        y_left_crit = np.interp(left_cross, dist, critical_line)
-                        y_right_crit = np.interp(right_cross, dist, critical_line)
-                        ax_p.plot(left_cross, y_left_crit, 'bo', markersize=6, label='Точки пересечения')
-                        ax_p.plot(right_cross, y_right_crit, 'bo', markersize=6)
-                        ax_p.plot([left_cross, right_cross], [y_left_crit, y_right_crit], 'g--', linewidth=1.5,
-                                  label='Прямая mn')
-                        ax_p.annotate('', xy=(left_cross, y_left_crit - 5), xytext=(right_cross, y_left_crit - 5),
-                                      arrowprops=dict(arrowstyle='<->', color='blue', lw=1.5))
-                        ax_p.text((left_cross + right_cross) / 2, y_left_crit - 15, f'l = {l:.0f} м',
-                                  ha='center', fontsize=8, color='blue')
-                        y_mn_at_x0 = np.interp(x0, [left_cross, right_cross], [y_left_crit, y_right_crit])
-                        ax_p.plot([x0, x0], [y_mn_at_x0, y0], 'r-', linewidth=2, label=f'h = {h:.1f} м')
-                        ax_p.text(x0 + 5, (y_mn_at_x0 + y0) / 2, f'h = {h:.1f} м', fontsize=8, color='red',
-                                  bbox=dict(facecolor='white', alpha=0.6))
-        else:
-            results_label.configure(text="Интервал закрытый (LOS пересекает рельеф)")
-
-        # --- Оформление графика (изменена только легенда) ---
-        ax_p.set_xlim(0, total_dist)
-        y_min = min(0, np.min(earth_arc))
-        y_max = max(ant_start, ant_end, np.max(elev_curved)) * 1.15
-        ax_p.set_ylim(y_min, y_max)
-        ax_p.set_title(f"Профиль трассы (f = {freq_mhz} МГц)", color='black')
-        ax_p.set_xlabel("Дистанция (м)")
-        ax_p.set_ylabel("Высота (м)")
-
-        # Исправленная легенда: автоматический выбор места, полупрозрачность, возможность перетаскивания
-        ax_p.legend(loc='best', frameon=True, facecolor='white', framealpha=0.7, fontsize=10, draggable=True)
-
-        ax_p.grid(True, alpha=0.3, color='gray')
-
-        # --- Встраивание графика ---
-        canvas_p = FigureCanvasTkAgg(fig_p, master=right_frame)
-        canvas_p.get_tk_widget().pack(fill="both", expand=True)
-        canvas_p.draw()
\ No newline at end of file
+        plot = profile_plot.ProfilePlot()
+        canvas = FigureCanvasTkAgg(plot.fig, master=right_frame)
+        canvas.get_tk_widget().pack(fill="both", expand=True)
+
+        window = ProfileWindow(top, params_label, result_label, plot, canvas)
+        top.protocol("WM_DELETE_WINDOW", lambda: self._close_profile_window(window))
+        return window
+
+    def _close_profile_window(self, window):
+        if window in self.profile_windows:
+            self.profile_windows.remove(window)
+        window.top.destroy()
@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Задача отменена (устарела или отменена пользователем)."""
+
+
+class Job:
+    """
+    Описание фоновой задачи. Функция задачи получает Job первым аргументом и
+    может сообщать прогресс через progress() и проверять отмену через check().
+    """
+
+    def __init__(self, scheduler, key, title, quiet=False):
+        self.key = key
+        self.title = title
+        self.quiet = quiet
+        self.future = None
+        self._scheduler = scheduler
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """Прерывает задачу, если её отменили."""
+        if self.cancelled:
+            raise JobCancelled(self.title)
+
+    def progress(self, fraction, text=None):
+        """Сообщает долю выполнения (0..1); вызывается из рабочего потока."""
+        self.check()
+        self._scheduler._post(self, "progress", (fraction, text))
+
+
+class JobScheduler:
+    """
+    Пул рабочих потоков для тяжёлых операций (чтение тайлов, расчёт профиля).
+    Результаты возвращаются в поток Tk через очередь, которую опрашивает root.after(),
+    поэтому обработчики on_done/on_error/on_progress могут работать с виджетами.
+    Новая задача с тем же ключом отменяет предыдущую (устаревшую). Тихие
+    задачи (quiet=True) не вызывают on_progress и on_idle - для частых
+    фоновых пересчётов, которые не должны мигать строкой состояния.
+    """
+
+    def __init__(self, root, max_workers=None, poll_ms=40, on_progress=None, on_idle=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_progress = on_progress
+        self.on_idle = on_idle
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1),
+                                            thread_name_prefix="radio-job")
+        self._events = queue.SimpleQueue()
+        self._jobs = {}
+        self._handlers = {}
+        self._polling = False
+
+    def submit(self, key, title, fn, *args, on_done=None, on_error=None, quiet=False, **kwargs):
+        """Запускает fn(job, *args, **kwargs) в пуле и возвращает Job."""
+        self.cancel(key)
+        job = Job(self, key, title, quiet)
+        self._jobs[key] = job
+        self._handlers[job] = (on_done, on_error)
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        if not quiet:
+            self._post(job, "progress", (0.0, title))
+        self._ensure_polling()
+        return job
+
+    def cancel(self, key=None):
+        """Отменяет задачу с ключом key или все задачи."""
+        keys = list(self._jobs) if key is None else [key]
+        notify = key is None
+        for k in keys:
+            job = self._jobs.pop(k, None)
+            if job is not None:
+                job.cancel()
+                self._handlers.pop(job, None)
+                notify = notify or not job.quiet
+        if notify:
+            self._notify_idle()
+
+    def _notify_idle(self):
+        """on_idle, если не осталось задач, которые показывают прогресс."""
+        if self.on_idle is not None and all(job.quiet for job in self._jobs.values()):
+            self.on_idle()
+
+    @property
+    def busy(self):
+        return bool(self._jobs)
+
+    def running(self, key):
+        """Есть ли незавершённая задача с ключом key."""
+        return key in self._jobs
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            job.check()
+            result = fn(job, *args, **kwargs)
+            job.check()
+        except JobCancelled:
+            return
+        except Exception as e:
+            self._post(job, "error", e)
+        else:
+            self._post(job, "done", result)
+
+    def _post(self, job, kind, payload):
+        self._events.put((job, kind, payload))
+
+    def _ensure_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                job, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            # События отменённых и заменённых задач не доходят до интерфейса
+            if job.cancelled or self._jobs.get(job.key) is not job:
+                continue
+            if kind == "progress":
+                if self.on_progress is not None and not job.quiet:
+                    self.on_progress(job, *payload)
+                continue
+            on_done, on_error = self._handlers.pop(job, (None, None))
+            del self._jobs[job.key]
+            if kind == "done" and on_done is not None:
+                on_done(payload)
+            elif kind == "error" and on_error is not None:
+                on_error(payload)
+            if not job.quiet:
+                self._notify_idle()
+
+        if self._jobs:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,623 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+import app_logic
+import geodesy
+import timing
+
+SURFACE_TYPES = [
+    "Малопересеченная равнина, пойменные луга, солончаки",
+    "Малопересеченная равнина, покрытая лесом",
+    "Среднепересеченная открытая местность",
+    "Среднепересеченная местность, покрытая лесом"
+]
+ANT_TYPES = ["Однозеркальная (η=0.6)", "Двузеркальная (η=0.7)"]
+
+# Коэффициент отражения Φ для λ <= 30 см и для λ > 30 см
+PHI_TABLE_SHORT = {
+    "Малопересеченная равнина, пойменные луга, солончаки": 0.9,
+    "Малопересеченная равнина, покрытая лесом": 0.7,
+    "Среднепересеченная открытая местность": 0.5,
+    "Среднепересеченная местность, покрытая лесом": 0.3
+}
+PHI_TABLE_LONG = {
+    "Малопересеченная равнина, пойменные луга, солончаки": 0.95,
+    "Малопересеченная равнина, покрытая лесом": 0.9,
+    "Среднепересеченная открытая местность": 0.7,
+    "Среднепересеченная местность, покрытая лесом": 0.6
+}
+PHI_DEFAULT = 0.8
+
+OPEN = "open"
+SEMI_OPEN = "semi_open"
+CLOSED = "closed"
+
+
+@dataclass
+class LinkParams:
+    """Исходные данные расчёта интервала (значения по умолчанию как в интерфейсе)."""
+    h1: float = 15.0
+    h2: float = 15.0
+    freq_mhz: float = 2400.0
+    reliability: float = 99.9
+    intervals: float = 1.0
+    power: float = 1.0
+    sensitivity: float = -90.0
+    feeder_loss: float = 3.0
+    ant_diam: float = 0.6
+    ant_type: str = ANT_TYPES[0]
+    surface: str = SURFACE_TYPES[0]
+
+    @property
+    def wavelength(self):
+        """Длина волны в метрах."""
+        return 0.3 / (self.freq_mhz / 1000.0)
+
+    @property
+    def ant_efficiency(self):
+        return _ant_efficiency(self.ant_type)
+
+
+@dataclass(slots=True)
+class LinkResult:
+    """
+    Результат расчёта интервала. Кроме итоговых величин хранит кривые профиля
+    и характерные точки, чтобы интерфейс и отчёты могли только отрисовывать их.
+    interval: OPEN, SEMI_OPEN, CLOSED или None (вырожденная трасса).
+    """
+    interval: object
+    dist: np.ndarray
+    elev: np.ndarray
+    earth_arc: np.ndarray
+    elev_curved: np.ndarray
+    los_line: np.ndarray
+    f_radius: np.ndarray
+    total_dist: float
+    wavelength: float
+    G_dBi: float
+    free_space_loss: float
+    ant_start: float
+    ant_end: float
+    critical_line: object = None
+    x0: float = 0.0
+    y0: float = 0.0
+    x_proj: float = 0.0
+    y_proj: float = 0.0
+    d1: float = 0.0
+    d2: float = 0.0
+    H0: float = 0.0
+    H_geom: float = 0.0
+    H_g: float = 0.0
+    h0_rel: float = 0.0
+    T_i: float = 0.0
+    # Участок отражения (открытый интервал) или препятствие (полуоткрытый):
+    # протяжённость l0 и высота delta_y над хордой между точками пересечения
+    left_cross: object = None
+    right_cross: object = None
+    l0: float = 0.0
+    delta_y: float = 0.0
+    x_max: float = 0.0
+    y_max: float = 0.0
+    a: float = 1e9
+    D: float = 1.0
+    phi3: float = 0.0
+    Wp: float = 0.0
+    total_loss: float = 0.0
+    P_rx: float = -np.inf
+    passed: bool = False
+
+    @property
+    def ground_start(self):
+        return self.elev_curved[0]
+
+    @property
+    def ground_end(self):
+        return self.elev_curved[-1]
+
+    @property
+    def status(self):
+        return "ПРИГОДЕН" if self.passed else "НЕ ПРИГОДЕН"
+
+
+@dataclass(slots=True)
+class LinkBatchResult:
+    """
+    Результат пакетного расчёта: массивы формы (n_links,) для величин
+    и (n_links, n_points) для кривых профиля. interval - коды CODE_*.
+    Для закрытых интервалов P_rx = -inf, неприменимые величины - NaN.
+    """
+    interval: np.ndarray
+    earth_arc: np.ndarray
+    elev_curved: np.ndarray
+    los_line: np.ndarray
+    f_radius: np.ndarray
+    critical_line: np.ndarray
+    total_dist: np.ndarray
+    wavelength: np.ndarray
+    G_dBi: np.ndarray
+    free_space_loss: np.ndarray
+    ant_start: np.ndarray
+    ant_end: np.ndarray
+    x0: np.ndarray
+    y0: np.ndarray
+    x_proj: np.ndarray
+    y_proj: np.ndarray
+    d1: np.ndarray
+    d2: np.ndarray
+    H0: np.ndarray
+    H_geom: np.ndarray
+    H_g: np.ndarray
+    h0_rel: np.ndarray
+    T_i: np.ndarray
+    left_cross: np.ndarray
+    right_cross: np.ndarray
+    l0: np.ndarray
+    delta_y: np.ndarray
+    x_max: np.ndarray
+    y_max: np.ndarray
+    a: np.ndarray
+    D: np.ndarray
+    phi3: np.ndarray
+    Wp: np.ndarray
+    total_loss: np.ndarray
+    P_rx: np.ndarray
+    margin: np.ndarray
+    passed: np.ndarray
+
+
+# Коды типа интервала в пакетном расчёте: INTERVALS[code] -> OPEN/SEMI_OPEN/CLOSED/None
+CODE_NONE, CODE_OPEN, CODE_SEMI_OPEN, CODE_CLOSED = 0, 1, 2, 3
+INTERVALS = (None, OPEN, SEMI_OPEN, CLOSED)
+
+
+def critical_crossings(dist, elev_curved, critical_line):
+    """
+    Точки пересечения рельефа с линией LOS - H0 для пакета профилей (n_links, n_points).
+    Возвращает массив (n_links, n_points - 1): абсцисса пересечения на отрезке
+    [i, i + 1] или NaN, если знак разности на отрезке не меняется.
+    """
+    diff = elev_curved - critical_line
+    sign_change = diff[:, :-1] * diff[:, 1:] < 0
+    denom = (elev_curved[:, 1:] - elev_curved[:, :-1]) - (critical_line[:, 1:] - critical_line[:, :-1])
+    valid = sign_change & (np.abs(denom) > 1e-9)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_cross = (critical_line[:, :-1] - elev_curved[:, :-1]) / denom
+    x_cross = dist[:, :-1] + t_cross * (dist[:, 1:] - dist[:, :-1])
+    return np.where(valid, x_cross, np.nan)
+
+
+def reflection_segments(dist, elev_curved, critical_line, x0):
+    """
+    Для каждой трассы пакета выбирает ближайшие к x0 слева и справа пересечения
+    рельефа с линией LOS - H0 и вершину рельефа между ними.
+    Возвращает (left_cross, right_cross, l, h, x_max, y_max) - массивы (n_links,);
+    l и h равны нулю, если участок не найден, границы в этом случае NaN.
+    """
+    n_links = dist.shape[0]
+    rows = np.arange(n_links)
+    x0 = np.asarray(x0, dtype=float).reshape(n_links, 1)
+    crosses = critical_crossings(dist, elev_curved, critical_line)
+    enough = np.count_nonzero(~np.isnan(crosses), axis=1) >= 2
+
+    left_idx = np.where(crosses <= x0, crosses, -np.inf).argmax(axis=1)
+    right_idx = np.where(crosses >= x0, crosses, np.inf).argmin(axis=1)
+    left_cross = crosses[rows, left_idx]
+    right_cross = crosses[rows, right_idx]
+    found = enough & (left_cross <= x0[:, 0]) & (right_cross >= x0[:, 0]) & (left_cross < right_cross)
+    left_cross = np.where(found, left_cross, np.nan)
+    right_cross = np.where(found, right_cross, np.nan)
+    l = np.where(found, right_cross - left_cross, 0.0)
+
+    mask = (dist >= left_cross[:, None]) & (dist <= right_cross[:, None])
+    has_points = found & mask.any(axis=1)
+    max_idx = np.where(mask, elev_curved, -np.inf).argmax(axis=1)
+    x_max = np.where(has_points, dist[rows, max_idx], 0.0)
+    y_max = np.where(has_points, elev_curved[rows, max_idx], 0.0)
+
+    # Значения критической линии в точках пересечения (линейная интерполяция на отрезке)
+    def crit_at(idx, x):
+        x_a, x_b = dist[rows, idx], dist[rows, idx + 1]
+        y_a, y_b = critical_line[rows, idx], critical_line[rows, idx + 1]
+        return y_a + (x - x_a) * (y_b - y_a) / (x_b - x_a)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y_left_crit = crit_at(left_idx, left_cross)
+        y_right_crit = crit_at(right_idx, right_cross)
+        t_mn = (x_max - left_cross) / l
+        y_mn = y_left_crit + t_mn * (y_right_crit - y_left_crit)
+    h = np.where(has_points & (l > 0), y_max - y_mn, 0.0)
+    return left_cross, right_cross, l, h, x_max, y_max
+
+
+def _lookup_phi(surface, wavelength_cm):
+    """Коэффициент отражения Φ для типа поверхности (строка или последовательность строк)."""
+    surfaces = [surface] if isinstance(surface, str) else list(surface)
+    short = np.array([PHI_TABLE_SHORT.get(s, PHI_DEFAULT) for s in surfaces])
+    long = np.array([PHI_TABLE_LONG.get(s, PHI_DEFAULT) for s in surfaces])
+    if isinstance(surface, str):
+        short, long = short[0], long[0]
+    return np.where(wavelength_cm <= 30, short, long)
+
+
+def _ant_efficiency(ant_type):
+    if isinstance(ant_type, str):
+        return 0.6 if "Однозеркальная" in ant_type else 0.7
+    return np.array([0.6 if "Однозеркальная" in t else 0.7 for t in ant_type])
+
+
+def antenna_gain_dbi(ant_diam, ant_efficiency, wavelength):
+    """Усиление параболической антенны, дБи."""
+    with np.errstate(divide='ignore'):
+        G_linear = (np.pi * ant_diam) ** 2 * ant_efficiency / (wavelength ** 2)
+        return np.where(G_linear > 0, 10 * np.log10(G_linear), -np.inf)
+
+
+def free_space_loss_db(distance, wavelength):
+    """Потери в свободном пространстве, дБ (distance и wavelength в метрах)."""
+    with np.errstate(divide='ignore'):
+        return 122 + 20 * np.log10(distance / 1000.0 / wavelength)
+
+
+def interference_loss_db(h0_rel, phi3):
+    """Затухание на рельеф Wp открытого интервала (интерференция прямой и отражённой волн)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_term = np.clip(np.cos((np.pi / 3) * (h0_rel ** 2)), -1.0, 1.0)
+        Wp = -10 * np.log10(1 + phi3 ** 2 - 2 * phi3 * cos_term)
+    return np.where(np.isnan(Wp) | (Wp > 50), 50.0, Wp)
+
+
+def obstacle_loss_db(p_rel):
+    """Затухание на рельеф Wp полуоткрытого интервала по относительному просвету p."""
+    return np.where(p_rel < 1, 12 * (1 - p_rel) ** 2, 0.0)
+
+
+def tx_power_dbm(power):
+    """Мощность передатчика из ватт в дБм."""
+    return 10 * np.log10(np.asarray(power, dtype=float) * 1000)
+
+
+def analyze_links_batch(dist, elev, params):
+    """
+    Векторный расчёт интервалов для пакета трасс без циклов по точкам.
+    dist, elev - массивы (n_links, n_points) с одинаковым числом точек.
+    Числовые поля params могут быть скалярами или массивами (n_links,),
+    ant_type и surface - строкой или последовательностью строк.
+    Возвращает LinkBatchResult.
+    """
+    dist = np.atleast_2d(np.asarray(dist, dtype=float))
+    elev = np.atleast_2d(np.asarray(elev, dtype=float))
+    n_links, n_points = dist.shape
+    rows = np.arange(n_links)
+
+    def param(value):
+        return np.broadcast_to(np.asarray(value, dtype=float), (n_links,))
+
+    h1, h2 = param(params.h1), param(params.h2)
+    freq_ghz = param(params.freq_mhz) / 1000.0
+    reliability, intervals = param(params.reliability), param(params.intervals)
+    power, sensitivity = param(params.power), param(params.sensitivity)
+    feeder_loss, ant_diam = param(params.feeder_loss), param(params.ant_diam)
+    ant_efficiency = param(_ant_efficiency(params.ant_type))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_dist = dist[:, -1]
+        wavelength = 0.3 / freq_ghz
+        wavelength_cm = wavelength * 100
+
+        G_dBi = antenna_gain_dbi(ant_diam, ant_efficiency, wavelength)
+        free_space_loss = free_space_loss_db(total_dist, wavelength)
+        refraction_loss = 0.0
+
+        earth_arc = app_logic.get_earth_arc(dist)
+        elev_curved = elev + earth_arc
+        ant_start = elev_curved[:, 0] + h1
+        ant_end = elev_curved[:, -1] + h2
+        # LOS линейна по расстоянию: шаг профиля может быть неравномерным
+        los_line = ant_start[:, None] + (ant_end - ant_start)[:, None] * (dist / total_dist[:, None])
+        f_radius = app_logic.get_fresnel_zone(dist, total_dist[:, None], freq_ghz[:, None])
+
+        # Точка минимального просвета и её проекция на линию LOS
+        clearances = los_line - elev_curved
+        closed = np.min(clearances, axis=1) < 0
+        min_idx = np.argmin(clearances, axis=1)
+        x0 = dist[rows, min_idx]
+        y0 = elev_curved[rows, min_idx]
+        x1, y1 = dist[:, 0], ant_start
+        dx = total_dist - x1
+        dy = ant_end - y1
+        norm = dx * dx + dy * dy
+        valid = ~closed & (norm > 0)
+        t = np.clip(((x0 - x1) * dx + (y0 - y1) * dy) / norm, 0, 1)
+        x_proj = x1 + t * dx
+        y_proj = y1 + t * dy
+
+        d1 = x_proj
+        d2 = total_dist - x_proj
+        H0 = np.sqrt((wavelength * d1 * d2) / total_dist)
+        # Геометрический просвет и поправка на рефракцию
+        H_geom = y_proj - y0
+        H_g = H_geom + (d1 * d2) / (2 * geodesy.EARTH_RADIUS) * (1 - 1 / geodesy.K_REFRACTION)
+        T_i = np.where(intervals > 0, (100 - reliability) / intervals, 0.0)
+
+        critical_line = los_line - H0[:, None]
+        with timing.span("analysis.crossings"):
+            left_cross, right_cross, l0, delta_y, x_max, y_max = reflection_segments(
+                dist, elev_curved, critical_line, x0)
+
+        is_open = valid & (H_g >= H0)
+        is_semi = valid & ~(H_g >= H0)
+
+        # Открытый интервал: интерференционный множитель с учётом расходимости D
+        h0_rel = np.where(is_open, H_g / H0, np.nan)
+        phi = _lookup_phi(params.surface, wavelength_cm)
+        has_segment = (l0 > 0) & (delta_y > 0)
+        a = np.where(has_segment, np.clip(l0 ** 2 / (8 * delta_y), 100, 100_000_000), 1e9)
+        term = np.maximum(0, (2 * d1 * (total_dist - d1)) / (a * total_dist) * (H_g / H0))
+        D = np.where((a > 0) & (H0 > 0) & (total_dist > 0), 1.0 / np.sqrt(1 + term), 1.0)
+        phi3 = np.where(D < 0.95, phi * D, phi)
+        Wp_open = interference_loss_db(h0_rel, phi3)
+
+        # Полуоткрытый интервал: потери на препятствии по относительному просвету
+        p_rel = np.where(H0 > 0, H_geom / H0, 0.0)
+        Wp_semi = np.where(has_segment, obstacle_loss_db(p_rel), 0.0)
+        l0 = np.where(is_semi & ~has_segment, 0.0, l0)
+        delta_y = np.where(is_semi & ~has_segment, 0.0, delta_y)
+
+        Wp = np.where(is_open, Wp_open, np.where(is_semi, Wp_semi, np.nan))
+        total_loss = free_space_loss + Wp + refraction_loss + 2 * feeder_loss
+        P_rx = np.where(valid, tx_power_dbm(power) + G_dBi + G_dBi - total_loss, -np.inf)
+
+    interval = np.full(n_links, CODE_NONE, dtype=np.int8)
+    interval[closed] = CODE_CLOSED
+    interval[is_open] = CODE_OPEN
+    interval[is_semi] = CODE_SEMI_OPEN
+    return LinkBatchResult(
+        interval=interval, earth_arc=earth_arc, elev_curved=elev_curved, los_line=los_line,
+        f_radius=f_radius, critical_line=critical_line, total_dist=total_dist, wavelength=wavelength,
+        G_dBi=G_dBi, free_space_loss=free_space_loss, ant_start=ant_start, ant_end=ant_end,
+        x0=x0, y0=y0, x_proj=x_proj, y_proj=y_proj, d1=d1, d2=d2, H0=H0, H_geom=H_geom, H_g=H_g,
+        h0_rel=h0_rel, T_i=T_i, left_cross=left_cross, right_cross=right_cross, l0=l0,
+        delta_y=delta_y, x_max=x_max, y_max=y_max, a=np.where(is_open, a, 1e9),
+        D=np.where(is_open, D, 1.0), phi3=np.where(is_open, phi3, 0.0), Wp=Wp,
+        total_loss=total_loss, P_rx=P_rx, margin=P_rx - sensitivity, passed=P_rx >= sensitivity
+    )
+
+
+def analyze_link(profile, params):
+    """
+    Расчёт интервала радиорелейной линии по профилю трассы без интерфейса.
+    profile - пара (dist, elev) из app_logic.get_elevation_profile,
+    params - LinkParams. Возвращает LinkResult.
+    """
+    dist, elev = profile
+    dist = np.asarray(dist, dtype=float)
+    elev = np.asarray(elev, dtype=float)
+    batch = analyze_links_batch(dist[None, :], elev[None, :], params)
+
+    result = LinkResult(
+        interval=INTERVALS[batch.interval[0]], dist=dist, elev=elev, earth_arc=batch.earth_arc[0],
+        elev_curved=batch.elev_curved[0], los_line=batch.los_line[0], f_radius=batch.f_radius[0],
+        total_dist=float(batch.total_dist[0]), wavelength=float(batch.wavelength[0]),
+        G_dBi=float(batch.G_dBi[0]), free_space_loss=float(batch.free_space_loss[0]),
+        ant_start=float(batch.ant_start[0]), ant_end=float(batch.ant_end[0])
+    )
+    if result.interval not in (OPEN, SEMI_OPEN):
+        return result
+
+    result.critical_line = batch.critical_line[0]
+    for name in ("x0", "y0", "x_proj", "y_proj", "d1", "d2", "H0", "H_geom", "H_g", "T_i",
+                 "l0", "delta_y", "x_max", "y_max", "a", "D", "phi3", "Wp", "total_loss", "P_rx"):
+        setattr(result, name, float(getattr(batch, name)[0]))
+    if result.interval == OPEN:
+        result.h0_rel = float(batch.h0_rel[0])
+    if not np.isnan(batch.left_cross[0]):
+        result.left_cross = float(batch.left_cross[0])
+        result.right_cross = float(batch.right_cross[0])
+    result.passed = bool(batch.passed[0])
+    return result
+
+
+@dataclass(slots=True)
+class MastSolution:
+    """
+    Минимальные высоты подвеса А1 для заданных высот А2.
+    limiting_* - точка профиля, которая определяет высоту (ограничивающее препятствие).
+    """
+    h1: np.ndarray
+    h2: np.ndarray
+    limiting_index: np.ndarray
+    limiting_distance: np.ndarray
+    limiting_elevation: np.ndarray
+
+
+def min_mast_height(profile, params, h2=None, target_ratio=1.0):
+    """
+    Минимальная высота А1, при которой в каждой точке трассы эффективный просвет
+    H_g (с той же поправкой на рефракцию, что в analyze_links_batch) не меньше
+    target_ratio * H0. h2 - скаляр или массив высот А2 (по умолчанию params.h2);
+    для массива получается фронт пар (h1, h2).
+
+    Линия LOS линейна по h1, поэтому условие в точке с долей трассы t
+    решается явно: h1 >= (y + p * H0 - dH - (y_N + h2) * t) / (1 - t) - y_0,
+    и ответ - максимум по точкам за один векторный проход.
+    Условие проверяется во всех точках, поэтому оно не слабее критерия
+    analyze_link, который смотрит только точку минимального просвета.
+    """
+    dist, elev = profile
+    dist = np.asarray(dist, dtype=float)
+    elev = np.asarray(elev, dtype=float)
+    h2 = np.atleast_1d(np.asarray(params.h2 if h2 is None else h2, dtype=float))
+    total_dist = dist[-1]
+
+    earth_arc = app_logic.get_earth_arc(dist)
+    elev_curved = elev + earth_arc
+    # H0 по той же формуле, что в analyze_links_batch
+    H0 = np.sqrt(params.wavelength * dist * (total_dist - dist) / total_dist)
+    delta_H = (dist * (total_dist - dist)) / (2 * geodesy.EARTH_RADIUS) * (1 - 1 / geodesy.K_REFRACTION)
+
+    # Последняя точка - сама мачта А2, условие в ней от h1 не зависит
+    t = dist[:-1] / total_dist
+    margin = target_ratio * H0[:-1] - delta_H[:-1]
+    ant_end = elev_curved[-1] + h2
+    rows = np.arange(len(h2))
+
+    # Просвет в analyze_links_batch отсчитывается по перпендикуляру к LOS,
+    # т.е. равен вертикальному, умноженному на cos^2 угла наклона линии.
+    # Наклон зависит от h1, поэтому поправку уточняем несколькими итерациями.
+    scale = np.ones(len(h2))
+    for _ in range(3):
+        need = elev_curved[:-1] + margin * scale[:, None]
+        required = (need - ant_end[:, None] * t) / (1 - t) - elev_curved[0]
+        limiting_index = np.argmax(required, axis=1)
+        h1 = np.maximum(required[rows, limiting_index], 0.0)
+        slope = (ant_end - elev_curved[0] - h1) / total_dist
+        scale = 1 + slope * slope
+    return MastSolution(h1=h1, h2=h2, limiting_index=limiting_index,
+                        limiting_distance=dist[limiting_index], limiting_elevation=elev[limiting_index])
+
+
+# Параметры LinkParams, по которым возможен перебор (порядок осей результата)
+SWEEP_AXES = ("freq_mhz", "ant_diam", "h1", "h2", "power")
+
+
+@dataclass(slots=True)
+class LinkSweep:
+    """
+    Результат перебора параметров одной трассы. axes - пары (имя, значения)
+    в порядке SWEEP_AXES; массивы величин имеют форму shape (по оси на параметр).
+    """
+    axes: tuple
+    interval: np.ndarray
+    wavelength: np.ndarray
+    G_dBi: np.ndarray
+    free_space_loss: np.ndarray
+    H0: np.ndarray
+    h0_rel: np.ndarray
+    Wp: np.ndarray
+    P_rx: np.ndarray
+    margin: np.ndarray
+    passed: np.ndarray
+
+    @property
+    def shape(self):
+        return self.margin.shape
+
+    def values(self, name):
+        return dict(self.axes)[name]
+
+    def best(self):
+        """Параметры сочетания с наибольшим запасом по мощности."""
+        index = np.unravel_index(np.argmax(self.margin), self.shape)
+        return {name: values[i] for (name, values), i in zip(self.axes, index)}
+
+
+def sweep_link(profile, params, chunk_size=None, **ranges):
+    """
+    Перебор параметров для одной трассы. ranges - массивы значений для полей
+    из SWEEP_AXES (не заданные берутся из params). Профиль считается один раз;
+    геометрия интервала (H0, h0_rel, Wp) зависит только от частоты и высот и
+    считается пакетом analyze_links_batch по сетке (freq, h1, h2), а усиление
+    антенн и мощность передатчика добавляются через broadcasting.
+    chunk_size - число трасс в одном пакете (по умолчанию ~1e6 точек на пакет).
+    """
+    unknown = set(ranges) - set(SWEEP_AXES)
+    if unknown:
+        raise TypeError(f"Неизвестные параметры перебора: {', '.join(sorted(unknown))}")
+    axes = tuple((name, np.atleast_1d(np.asarray(ranges.get(name, getattr(params, name)), dtype=float)))
+                 for name in SWEEP_AXES)
+    freq, ant_diam, h1, h2, power = (values for _, values in axes)
+
+    dist, elev = profile
+    dist = np.asarray(dist, dtype=float)
+    elev = np.asarray(elev, dtype=float)
+    geo_freq, geo_h1, geo_h2 = (a.ravel() for a in np.meshgrid(freq, h1, h2, indexing='ij'))
+    n_geo = geo_freq.size
+    if chunk_size is None:
+        chunk_size = max(1, 1_000_000 // dist.size)
+
+    interval = np.empty(n_geo, dtype=np.int8)
+    H0, h0_rel, Wp = np.empty(n_geo), np.empty(n_geo), np.empty(n_geo)
+    for start in range(0, n_geo, chunk_size):
+        part = slice(start, min(start + chunk_size, n_geo))
+        n = part.stop - part.start
+        batch = analyze_links_batch(
+            np.broadcast_to(dist, (n, dist.size)), np.broadcast_to(elev, (n, elev.size)),
+            replace(params, freq_mhz=geo_freq[part], h1=geo_h1[part], h2=geo_h2[part]))
+        interval[part], H0[part], h0_rel[part], Wp[part] = batch.interval, batch.H0, batch.h0_rel, batch.Wp
+
+    # Оси: (freq, ant_diam, h1, h2, power)
+    geo_shape = (freq.size, 1, h1.size, h2.size, 1)
+    interval, H0, h0_rel, Wp = (a.reshape(geo_shape) for a in (interval, H0, h0_rel, Wp))
+    wavelength = (0.3 / (freq / 1000.0)).reshape(-1, 1, 1, 1, 1)
+    G_dBi = antenna_gain_dbi(ant_diam.reshape(1, -1, 1, 1, 1), params.ant_efficiency, wavelength)
+    free_space_loss = free_space_loss_db(dist[-1], wavelength)
+    total_loss = free_space_loss + Wp + 2 * params.feeder_loss
+    valid = (interval == CODE_OPEN) | (interval == CODE_SEMI_OPEN)
+    P_rx = np.where(valid, tx_power_dbm(power).reshape(1, 1, 1, 1, -1) + 2 * G_dBi - total_loss, -np.inf)
+
+    shape = tuple(values.size for _, values in axes)
+
+    def full(a):
+        return np.broadcast_to(a, shape)
+
+    margin = P_rx - params.sensitivity
+    return LinkSweep(axes=axes, interval=full(interval), wavelength=full(wavelength), G_dBi=full(G_dBi),
+                     free_space_loss=full(free_space_loss), H0=full(H0), h0_rel=full(h0_rel), Wp=full(Wp),
+                     P_rx=P_rx, margin=margin, passed=margin >= 0)
+
+
+def format_params(params):
+    """Текст блока «Исходные данные»."""
+    wavelength = params.wavelength
+    return (
+        f"Высота антенны А1: {params.h1} м\n"
+        f"Высота антенны А2: {params.h2} м\n"
+        f"Рабочая частота: {params.freq_mhz} МГц\n"
+        f"Длина волны: {wavelength:.3f} м ({wavelength * 100:.1f} см)\n"
+        f"Надёжность линии: {params.reliability} %\n"
+        f"Кол-во интервалов M: {int(params.intervals)}\n"
+        f"Мощность передатчика: {params.power} Вт\n"
+        f"Чувствительность: {params.sensitivity} дБм\n"
+        f"Затухание в фидере: {params.feeder_loss} дБ\n"
+        f"Диаметр антенны: {params.ant_diam} м\n"
+        f"Тип антенны: {params.ant_type}\n"
+        f"Подстилающая поверхность: {params.surface}"
+    )
+
+
+def format_result(result, params):
+    """Текст блока «Результаты расчёта»."""
+    if result.interval == CLOSED:
+        return "Интервал закрытый (LOS пересекает рельеф)"
+    if result.interval == OPEN:
+        return (
+            f"d1 = {result.d1:.0f} м\nd2 = {result.d2:.0f} м\n"
+            f"Радиус зоны Френеля H0 = {result.H0:.2f} м\n"
+            f"Фактический просвет H(g) = {result.H_g:.2f} м\n"
+            f"Относительный просвет h0 = {result.h0_rel:.3f}\n"
+            f"Коэфф. перерыва связи T_i = {result.T_i:.4f} %\n"
+            f"Тип поверхности: {params.surface}\n"
+            f"Протяжённость участка отражения l0 = {result.l0:.0f} м\n"
+            f"Коэфф. расходимости D = {result.D:.4f}\n"
+            f"Коэфф. отражения Φ₃ = {result.phi3:.4f}\n"
+            f"Затухание на рельеф Wp = {result.Wp:.1f} дБ\n"
+            f"Суммарные потери: {result.total_loss:.1f} дБ\n"
+            f"Мощность на входе приёмника: {result.P_rx:.1f} дБм\n"
+            f"Статус интервала: {result.status}"
+        )
+    if result.interval == SEMI_OPEN:
+        return (
+            f"Расстояние от передатчика до препятствия d1 = {result.d1:.0f}м\n"
+            f"Расстояние от приемника до препятствия d2 = {result.d2:.0f}м\n"
+            f"Радиус зоны Френеля H0 = {result.H0:.2f} м\n"
+            f"Геометрический просвет H(geom) = {result.H_geom:.2f} м\n"
+            f"Коэфф. перерыва связи T_i = {result.T_i:.4f} %\n"
+            f"Протяжённость препятствия l = {result.l0:.0f} м\n"
+            f"Высота препятствия h = {result.delta_y:.1f} м\n"
+            f"Затухание на рельеф Wp = {result.Wp:.1f} дБ\n"
+            f"Суммарные потери: {result.total_loss:.1f} дБ\n"
+            f"Мощность на входе приёмника: {result.P_rx:.1f} дБм\n"
+            f"Статус интервала: {result.status}"
+        )
+    return ""
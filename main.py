@@ -1,5 +1,163 @@
-from gui_module import RadioApp
+import argparse
+import sys
+
+
+def run_gui(args):
+    from gui_module import RadioApp
 
-if __name__ == "__main__":
     app = RadioApp()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
+
+
+def run_batch(args):
+    import batch_runner
+
+    def progress(done):
+        print(f"\rОбработано трасс: {done}", end="", file=sys.stderr, flush=True)
+
+    done = batch_runner.run_batch(args.input, args.output, tiles_dir=args.tiles, workers=args.workers,
+                                  chunk_size=args.chunk_size, num_points=args.points, method=args.method,
+                                  resume=not args.restart, progress=progress)
+    print(f"\rОбработано трасс: {done}", file=sys.stderr)
+
+
+def run_report(args):
+    import profile_report
+
+    def progress(done):
+        print(f"\rОтчётов: {done}", end="", file=sys.stderr, flush=True)
+
+    done = profile_report.render_reports(args.input, args.output_dir, tiles_dir=args.tiles, formats=args.format,
+                                         workers=args.workers, num_points=args.points, method=args.method,
+                                         dpi=args.dpi, progress=progress)
+    print(f"\rОтчётов: {done}", file=sys.stderr)
+
+
+def run_relay(args):
+    import json
+
+    import app_logic
+    import batch_runner
+    import link_analysis
+    import relay_planner
+
+    fields = {}
+    for item in args.param:
+        name, _, value = item.partition("=")
+        try:
+            if name not in batch_runner.PARAM_FIELDS:
+                raise ValueError(f"допустимые имена: {', '.join(batch_runner.PARAM_FIELDS)}")
+            fields[name] = value if name in batch_runner.TEXT_FIELDS else float(value)
+        except ValueError as e:
+            sys.exit(f"Неверный параметр {item!r}: {e}")
+    params = link_analysis.LinkParams(**fields)
+
+    try:
+        ids, lats, lons, heights = relay_planner.read_sites(args.sites, default_height=params.h1)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    try:
+        start = ids.index(args.start) if args.start is not None else 0
+        end = ids.index(args.end) if args.end is not None else len(ids) - 1
+    except ValueError as e:
+        sys.exit(f"Площадка не найдена: {e}")
+
+    def progress(fraction):
+        print(f"\rРасчёт интервалов: {fraction:.0%}", end="", file=sys.stderr, flush=True)
+
+    plan, hops = relay_planner.plan_relay_chain(app_logic.TileIndex(args.tiles), lats, lons, start, end, params,
+                                                args.max_distance, heights=heights, num_points=args.points,
+                                                workers=args.workers, max_hops=args.max_hops, progress=progress)
+    print(f"\rПар площадок: {len(hops.start)}, пригодных интервалов: {int(hops.usable.sum())}", file=sys.stderr)
+    result = relay_planner.plan_to_dict(plan, ids, lats, lons)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    if plan is None:
+        print("Цепочка не найдена", file=sys.stderr)
+        return 1
+    print(f"Интервалов в цепочке: {plan.n_hops}, наименьший запас: {plan.bottleneck:.1f} дБ", file=sys.stderr)
+    return 0
+
+
+def run_serve(args):
+    import profile_service
+
+    def ready(server):
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Сервис профилей: http://{host}:{port} (Ctrl+C - остановить)", file=sys.stderr, flush=True)
+
+    profile_service.run(args.tiles, args.host, args.port, workers=args.workers, window=args.window_ms / 1000,
+                        max_batch=args.max_batch, max_pending=args.max_pending, preload=args.preload, ready=ready)
+
+
+def build_parser():
+    import app_logic
+
+    parser = argparse.ArgumentParser(description="Расчёт радиорелейных интервалов по картам SRTM")
+    parser.add_argument("--timing", action="store_true", help="замеры этапов операций в строке состояния")
+    parser.add_argument("--trace", metavar="FILE", help="писать замеры операций в файл JSON Lines")
+    parser.add_argument("--profile-op", metavar="NAME",
+                        help="снять cProfile одной операции (load_file, refresh_map, show_profile_window)")
+    commands = parser.add_subparsers(dest="command")
+
+    gui = commands.add_parser("gui", help="графический интерфейс (по умолчанию)")
+    gui.set_defaults(func=run_gui)
+
+    batch = commands.add_parser("batch", help="пакетный расчёт трасс из CSV/JSONL")
+    batch.add_argument("input", help="входной файл .csv или .jsonl (lat1, lon1, lat2, lon2, ...)")
+    batch.add_argument("output", help="файл результатов .jsonl или .csv")
+    batch.add_argument("--tiles", default=app_logic.MAPS_DIR, help="каталог с тайлами .hgt")
+    batch.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    batch.add_argument("--chunk-size", type=int, default=256, help="трасс в одном пакете")
+    batch.add_argument("--points", type=int, default=250, help="точек профиля на трассу")
+    batch.add_argument("--method", choices=("nearest", "bilinear"), default="nearest")
+    batch.add_argument("--restart", action="store_true", help="начать заново, игнорируя контрольную точку")
+    batch.set_defaults(func=run_batch)
+
+    report = commands.add_parser("report", help="отчёты PNG/PDF (профиль и результаты расчёта) по трассам")
+    report.add_argument("input", help="входной файл .csv или .jsonl (lat1, lon1, lat2, lon2, ...)")
+    report.add_argument("output_dir", help="каталог для отчётов и summary.jsonl")
+    report.add_argument("--tiles", default=app_logic.MAPS_DIR, help="каталог с тайлами .hgt")
+    report.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    report.add_argument("--format", nargs="+", choices=("png", "pdf", "svg"), default=["png", "pdf"])
+    report.add_argument("--points", type=int, default=None,
+                        help="точек профиля на трассу (по умолчанию - по точке на ячейку растра)")
+    report.add_argument("--method", choices=("nearest", "bilinear"), default="bilinear")
+    report.add_argument("--dpi", type=int, default=100)
+    report.set_defaults(func=run_report)
+
+    relay = commands.add_parser("relay", help="цепочка ретрансляторов по списку площадок-кандидатов")
+    relay.add_argument("sites", help="площадки .csv или .jsonl (id, lat, lon, необязательно height)")
+    relay.add_argument("output", help="файл цепочки .json")
+    relay.add_argument("--start", help="id начальной площадки (по умолчанию - первая в файле)")
+    relay.add_argument("--end", help="id конечной площадки (по умолчанию - последняя в файле)")
+    relay.add_argument("--max-distance", type=float, default=50000, help="наибольшая длина интервала, м")
+    relay.add_argument("--max-hops", type=int, default=None, help="наибольшее число интервалов в цепочке")
+    relay.add_argument("--param", nargs="*", default=[], metavar="ИМЯ=ЗНАЧЕНИЕ",
+                       help="исходные данные LinkParams, например freq_mhz=5800 h1=30")
+    relay.add_argument("--tiles", default=app_logic.MAPS_DIR, help="каталог с тайлами .hgt")
+    relay.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    relay.add_argument("--points", type=int, default=250, help="точек профиля на интервал")
+    relay.set_defaults(func=run_relay)
+
+    serve = commands.add_parser("serve", help="локальный HTTP/JSON-сервис профилей и расчёта интервалов")
+    serve.add_argument("--tiles", default=app_logic.MAPS_DIR, help="каталог с тайлами .hgt")
+    serve.add_argument("--host", default="127.0.0.1", help="адрес (по умолчанию только localhost)")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=1, help="потоков расчёта")
+    serve.add_argument("--window-ms", type=float, default=5.0, help="окно сбора запросов в пакет, мс")
+    serve.add_argument("--max-batch", type=int, default=512, help="запросов в одном пакете")
+    serve.add_argument("--max-pending", type=int, default=4096, help="запросов в очереди до ответа 503")
+    serve.add_argument("--preload", action="store_true", help="прочитать все тайлы в память при запуске")
+    serve.set_defaults(func=run_serve)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.timing or args.trace or args.profile_op:
+        import timing
+
+        timing.configure(enabled=True, trace_path=args.trace, profile_operation=args.profile_op)
+    sys.exit(getattr(args, "func", run_gui)(args))
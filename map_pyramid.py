@@ -0,0 +1,128 @@
+import numpy as np
+
+import app_logic
+
+# Коэффициенты уменьшения уровней пирамиды относительно исходной матрицы
+PYRAMID_FACTORS = (2, 4, 8, 16, 32)
+PYRAMID_SUFFIX = ".pyramid.npz"
+
+
+def downsample(matrix, factor=2):
+    """
+    Уменьшает матрицу высот усреднением блоков factor x factor.
+    Пустоты SRTM (HGT_VOID) не участвуют в среднем; блок из одних пустот остаётся пустотой.
+    """
+    n_rows, n_cols = matrix.shape
+    pad_rows, pad_cols = -n_rows % factor, -n_cols % factor
+    data = np.asarray(matrix, dtype=np.float32)
+    if pad_rows or pad_cols:
+        data = np.pad(data, ((0, pad_rows), (0, pad_cols)), mode="edge")
+    data = np.where(data == app_logic.HGT_VOID, np.nan, data)
+    blocks = data.reshape(data.shape[0] // factor, factor, data.shape[1] // factor, factor)
+    valid = np.count_nonzero(~np.isnan(blocks), axis=(1, 3))
+    with np.errstate(invalid="ignore"):
+        mean = np.nansum(blocks, axis=(1, 3)) / valid
+    return np.where(valid > 0, np.round(mean), app_logic.HGT_VOID).astype(np.int16)
+
+
+def build_levels(matrix, factors=PYRAMID_FACTORS):
+    """Строит уровни пирамиды, каждый следующий - из предыдущего (2x)."""
+    levels = {}
+    current, current_factor = matrix, 1
+    for factor in sorted(factors):
+        current = downsample(current, factor // current_factor)
+        current_factor = factor
+        levels[factor] = current
+    return levels
+
+
+class Pyramid:
+    """
+    Многоуровневое представление растра для обзорной карты.
+    Уровень 1 - исходная матрица (memmap), остальные - уменьшенные копии.
+    """
+
+    def __init__(self, raster, levels):
+        self.raster = raster
+        self.levels = {1: raster.matrix, **levels}
+
+    @property
+    def extent(self):
+        return self.raster.extent
+
+    def value_range(self):
+        """Диапазон высот без пустот по самому грубому уровню (для общей шкалы цветов)."""
+        coarse = self.levels[max(self.levels)]
+        valid = coarse[coarse != app_logic.HGT_VOID]
+        if valid.size == 0:
+            return 0.0, 1.0
+        return float(valid.min()), float(valid.max())
+
+    def select(self, xlim, ylim, width_px, height_px):
+        """
+        Выбирает уровень под текущий масштаб и вырезает видимое окно.
+        Возвращает (matrix, extent) или None, если растр вне видимой области.
+        """
+        selected = self.window(xlim, ylim, width_px, height_px)
+        if selected is None:
+            return None
+        factor, rows, cols, extent = selected
+        return self.levels[factor][rows, cols], extent
+
+    def window(self, xlim, ylim, width_px, height_px):
+        """
+        Уровень и видимое окно под текущий масштаб без выборки данных:
+        (factor, срез строк, срез столбцов уровня, extent) или None.
+        """
+        a, _, left, _, e, top = self.raster.transform
+        n_rows, n_cols = self.raster.matrix.shape
+        x_min, x_max = sorted(xlim)
+        y_min, y_max = sorted(ylim)
+
+        # Видимое окно в пикселях исходной матрицы
+        col0 = max(int(np.floor((x_min - left) / a)), 0)
+        col1 = min(int(np.ceil((x_max - left) / a)), n_cols)
+        row0 = max(int(np.floor((y_max - top) / e)), 0)
+        row1 = min(int(np.ceil((y_min - top) / e)), n_rows)
+        if col0 >= col1 or row0 >= row1:
+            return None
+
+        # Самый грубый уровень, в котором на пиксель экрана приходится не меньше одной ячейки
+        cells_per_px = min((col1 - col0) / max(width_px, 1), (row1 - row0) / max(height_px, 1))
+        factor = max((f for f in self.levels if f <= cells_per_px), default=1)
+
+        level = self.levels[factor]
+        lc0, lc1 = col0 // factor, min(-(-col1 // factor), level.shape[1])
+        lr0, lr1 = row0 // factor, min(-(-row1 // factor), level.shape[0])
+        extent = [left + lc0 * factor * a, left + lc1 * factor * a,
+                  top + lr1 * factor * e, top + lr0 * factor * e]
+        return factor, slice(lr0, lr1), slice(lc0, lc1), extent
+
+
+def load_pyramid(raster, factors=PYRAMID_FACTORS):
+    """
+    Возвращает Pyramid для растра. Для тайлов с путём уровни кэшируются в файле
+    рядом с тайлом и перестраиваются, если тайл изменился.
+    """
+    path = getattr(raster, "path", None)
+    if path is None:
+        return Pyramid(raster, build_levels(raster.matrix, factors))
+
+    cache_path = app_logic.sidecar_path(path, PYRAMID_SUFFIX)
+    identity = np.array(app_logic.file_identity(path)[1:], dtype=np.int64)
+    try:
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached["identity"], identity) and \
+                    sorted(int(f) for f in cached["factors"]) == sorted(factors):
+                return Pyramid(raster, {int(f): cached[f"level_{int(f)}"] for f in cached["factors"]})
+    except (OSError, KeyError, ValueError):
+        pass
+
+    levels = build_levels(raster.matrix, factors)
+    try:
+        np.savez(cache_path, identity=identity, factors=np.array(sorted(levels)),
+                 **{f"level_{f}": level for f, level in levels.items()})
+    except OSError:
+        # Каталог с тайлами может быть только для чтения - работаем без кэша
+        pass
+    return Pyramid(raster, levels)
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import app_logic
+
+# Файл кэша профилей между запусками программы
+PROFILE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "srtm_map_project", "profiles.sqlite")
+# Объём данных базы на диске, сверх которого удаляются давно не использованные профили
+PROFILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Шаг квантования координат концов трассы, градусы (~0.1 м)
+COORD_QUANTUM = 1e-6
+
+
+class ProfileCache:
+    """
+    Кэш профилей трасс (dist, elev). В памяти - LRU с ограничением по объёму
+    массивов, на диске (если задан path) - база sqlite, которая переживает
+    перезапуск; база ограничена max_disk_bytes, давно не использованные
+    профили из неё удаляются. Ключ строится из идентичности файлов тайлов (путь, размер,
+    время изменения), квантованных координат концов, числа точек и метода,
+    поэтому изменённый тайл автоматически даёт промах.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, path=None, max_disk_bytes=PROFILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS profiles "
+                                 "(key TEXT PRIMARY KEY, dist BLOB, elev BLOB, used REAL NOT NULL DEFAULT 0)")
+                columns = [row[1] for row in self._db.execute("PRAGMA table_info(profiles)")]
+                if "used" not in columns:
+                    # База прежней версии без метки использования
+                    self._db.execute("ALTER TABLE profiles ADD COLUMN used REAL NOT NULL DEFAULT 0")
+                self._db.execute("CREATE INDEX IF NOT EXISTS profiles_used ON profiles (used)")
+                self._db.commit()
+            except (OSError, sqlite3.Error):
+                # Каталог недоступен для записи - работаем только с памятью
+                self._db = None
+
+    @staticmethod
+    def _source_identity(source, p1, p2):
+        """Идентичность данных, из которых берётся профиль, или None, если кэшировать нельзя."""
+        if isinstance(source, (str, os.PathLike)):
+            return [app_logic.file_identity(source)]
+        if isinstance(source, app_logic.TileIndex):
+            # Тайлы, через которые проходит трасса, определяются без чтения высот
+            return [app_logic.file_identity(source.paths[key])
+                    for key in source.route_keys(p1, p2) if key in source.paths]
+        path = getattr(source, "path", None)
+        if path is None:
+            # Растр в памяти без файла - идентифицировать нечем
+            return None
+        return [app_logic.file_identity(path)]
+
+    def key(self, source, p1, p2, num_points, method, max_points=None):
+        """Ключ кэша для профиля или None, если источник не кэшируется."""
+        try:
+            identity = self._source_identity(source, p1, p2)
+        except OSError:
+            return None
+        if identity is None:
+            return None
+        ends = [int(round(float(v) / COORD_QUANTUM)) for v in (*p1, *p2)]
+        return hashlib.sha1(repr((identity, ends, num_points, max_points, method)).encode()).hexdigest()
+
+    def get(self, key):
+        """Профиль (dist, elev) по ключу или None."""
+        with self._lock:
+            profile = self._entries.get(key)
+            if profile is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return profile
+            row = None
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT dist, elev FROM profiles WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        # Метка использования для вытеснения; попадания в память её не обновляют
+                        self._db.execute("UPDATE profiles SET used = ? WHERE key = ?", (time.time(), key))
+                        self._db.commit()
+                except sqlite3.Error:
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            profile = tuple(np.frombuffer(blob, dtype=np.float64) for blob in row)
+            self._remember(key, profile)
+            return profile
+
+    def put(self, key, profile):
+        return self.put_many([(key, profile)])[0]
+
+    def put_many(self, items):
+        """Добавляет пары (key, profile) одной транзакцией; возвращает сохранённые профили."""
+        stored = []
+        for key, profile in items:
+            dist, elev = (np.array(a, dtype=np.float64) for a in profile)
+            for a in (dist, elev):
+                a.flags.writeable = False
+            stored.append((key, (dist, elev)))
+        with self._lock:
+            for key, profile in stored:
+                self._remember(key, profile)
+            if self._db is not None:
+                now = time.time()
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                                         [(key, dist.tobytes(), elev.tobytes(), now)
+                                          for key, (dist, elev) in stored])
+                    self._prune()
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+        return [profile for _, profile in stored]
+
+    def _prune(self):
+        """
+        Удаляет из базы давно не использованные профили, пока занятые страницы
+        больше max_disk_bytes. Освобождённые страницы база использует повторно,
+        поэтому файл не растёт дальше лимита.
+        """
+        page_size, = self._db.execute("PRAGMA page_size").fetchone()
+        page_count, = self._db.execute("PRAGMA page_count").fetchone()
+        free_count, = self._db.execute("PRAGMA freelist_count").fetchone()
+        used_bytes = (page_count - free_count) * page_size
+        if used_bytes <= self.max_disk_bytes:
+            return
+        count, = self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()
+        if not count:
+            return
+        # Число удаляемых строк - по среднему объёму строки
+        excess = used_bytes - self.max_disk_bytes
+        limit = min(count, -(-excess * count // used_bytes))
+        self._db.execute("DELETE FROM profiles WHERE key IN "
+                         "(SELECT key FROM profiles ORDER BY used LIMIT ?)", (limit,))
+
+    def _remember(self, key, profile):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= sum(a.nbytes for a in old)
+        self._entries[key] = profile
+        self.nbytes += sum(a.nbytes for a in profile)
+        # Вытесняем давно не использованные профили, пока не уложимся в лимит
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= sum(a.nbytes for a in evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM profiles")
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
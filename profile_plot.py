@@ -0,0 +1,220 @@
+"""
+Шаблон графика профиля трассы.
+
+Все художники графика (заливки, линии, маркеры, подписи) создаются один раз,
+а update() только меняет их данные, видимость и подписи легенды. Один
+ProfilePlot переиспользуется окном профиля и генератором отчётов вместо
+построения фигуры заново для каждой трассы.
+"""
+import textwrap
+
+import numpy as np
+from matplotlib.figure import Figure
+
+import link_analysis
+import timing
+
+# Нижняя граница заливки кривизны Земли, м
+EARTH_FILL_BOTTOM = -100
+# Радиус дуги аппроксимации вершины, выше которого дуга не рисуется (практически прямая), м
+MAX_ARC_RADIUS = 5e5
+ARC_POINTS = 50
+# Доля ширины фигуры под текстовую колонку отчёта, символов в строке колонки
+TEXT_WIDTH = 0.3
+TEXT_COLUMNS = 52
+TEXT_FONT_SIZE = 9
+TEXT_LINE_SPACING = 1.4
+
+
+def _fill_verts(x, y1, y2):
+    """Контур заливки между кривыми y1 и y2 (как у fill_between): вперёд по y1, назад по y2."""
+    y1 = np.broadcast_to(y1, x.shape)
+    y2 = np.broadcast_to(y2, x.shape)
+    return [np.concatenate((np.column_stack((x, y1)), np.column_stack((x[::-1], y2[::-1]))))]
+
+
+def _wrap(text):
+    """Перенос длинных строк текста по ширине колонки отчёта."""
+    return "\n".join(textwrap.fill(line, TEXT_COLUMNS, subsequent_indent="  ") for line in text.split("\n"))
+
+
+class ProfilePlot:
+    """
+    График профиля трассы на своей фигуре Figure (без pyplot - подходит и для
+    окна Tk, и для вывода в файл через Agg). with_text добавляет слева колонку
+    с текстами «Исходные данные» и «Результаты расчёта» для отчётов.
+    """
+
+    def __init__(self, with_text=False, figsize=None, dpi=100):
+        if figsize is None:
+            figsize = (14, 6) if with_text else (8, 5)
+        self.fig = Figure(figsize=figsize, dpi=dpi, facecolor='#FFFFFF')
+        self.params_text = self.result_title = self.result_text = None
+        if with_text:
+            self.ax = self.fig.add_axes((TEXT_WIDTH + 0.05, 0.1, 0.95 - TEXT_WIDTH - 0.05, 0.82))
+            self.fig.text(0.02, 0.95, "Исходные данные", fontsize=12, fontweight='bold', va='top')
+            self.params_text = self.fig.text(0.02, 0.9, "", fontsize=TEXT_FONT_SIZE, va='top',
+                                             linespacing=TEXT_LINE_SPACING)
+            self.result_title = self.fig.text(0.02, 0.5, "Результаты расчёта", fontsize=12, fontweight='bold',
+                                              va='top')
+            self.result_text = self.fig.text(0.02, 0.45, "", fontsize=TEXT_FONT_SIZE, va='top',
+                                             linespacing=TEXT_LINE_SPACING)
+            # Высота строки текста в долях высоты фигуры
+            self.text_line = TEXT_FONT_SIZE * TEXT_LINE_SPACING / 72 / figsize[1]
+        else:
+            self.ax = self.fig.add_subplot(111)
+        ax = self.ax
+        ax.set_facecolor('#FCFCFC')
+        ax.tick_params(colors='black')
+        ax.set_xlabel("Дистанция (м)")
+        ax.set_ylabel("Высота (м)")
+        ax.grid(True, alpha=0.3, color='gray')
+
+        # Заглушки данных: реальные значения задаёт update()
+        x = np.zeros(2)
+        self.earth = ax.fill_between(x, x, EARTH_FILL_BOTTOM, color='#ADD8E6', alpha=0.3, label='Кривизна Земли')
+        self.relief = ax.fill_between(x, x, x, color='sienna', alpha=0.6, label='Рельеф')
+        self.fresnel = ax.fill_between(x, x, x, color='yellow', alpha=0.3, label='Зона Френеля')
+        self.los, = ax.plot(x, x, 'b--', label='Линия LOS', lw=1.5)
+
+        self.mast_start, = ax.plot(x, x, color='#444444', lw=3, label='Мачты')
+        self.ant_start, = ax.plot(0, 0, 'ko', markersize=6, markeredgecolor='white')
+        self.mast_end, = ax.plot(x, x, color='#444444', lw=3)
+        self.ant_end, = ax.plot(0, 0, 'ko', markersize=6, markeredgecolor='white')
+
+        # Открытый интервал: участок отражения
+        self.bound_left, = ax.plot(0, 0, 'bo', markersize=6, label='Границы участка отражения')
+        self.bound_right, = ax.plot(0, 0, 'bo', markersize=6)
+        self.chord, = ax.plot(x, x, 'g-', linewidth=2)
+        self.apex_height, = ax.plot(x, x, 'r-', linewidth=2)
+        self.apex, = ax.plot(0, 0, 'ro', markersize=6, label='Вершина отражающего участка')
+        self.arc, = ax.plot(x, x, 'm--', linewidth=1.5, alpha=0.7)
+        self.arc_center, = ax.plot(0, 0, 'mx', markersize=5)
+
+        # Полуоткрытый интервал: препятствие
+        self.nearest, = ax.plot(0, 0, 'ro', markersize=8, markeredgecolor='black', zorder=5,
+                                label='Ближайшая точка рельефа')
+        self.perpendicular, = ax.plot(x, x, 'g-', linewidth=2, label='Перпендикуляр к LOS')
+        self.critical, = ax.plot(x, x, 'k--', linewidth=1.5, alpha=0.7, label='LOS - H₀ (критический уровень)')
+        self.obstacle_left, = ax.plot(0, 0, 'bo', markersize=6, label='Точки пересечения')
+        self.obstacle_right, = ax.plot(0, 0, 'bo', markersize=6)
+        self.mn, = ax.plot(x, x, 'g--', linewidth=1.5, label='Прямая mn')
+        self.width_arrow = ax.annotate('', xy=(0, 0), xytext=(0, 0),
+                                       arrowprops=dict(arrowstyle='<->', color='blue', lw=1.5))
+        self.width_text = ax.text(0, 0, '', ha='center', fontsize=8, color='blue')
+        self.obstacle_height, = ax.plot(x, x, 'r-', linewidth=2)
+        self.height_text = ax.text(0, 0, '', fontsize=8, color='red', bbox=dict(facecolor='white', alpha=0.6))
+
+        # Порядок элементов легенды - порядок создания, как у ax.legend() без аргументов
+        self.legend_order = (self.earth, self.relief, self.fresnel, self.los, self.mast_start,
+                             self.bound_left, self.chord, self.apex_height, self.apex, self.arc,
+                             self.nearest, self.perpendicular, self.critical, self.obstacle_left, self.mn,
+                             self.obstacle_height)
+        self.legend_key = None
+        self.interval_artists = (self.bound_left, self.bound_right, self.chord, self.apex_height, self.apex,
+                                 self.arc, self.arc_center, self.nearest, self.perpendicular, self.critical,
+                                 self.obstacle_left, self.obstacle_right, self.mn, self.width_arrow,
+                                 self.width_text, self.obstacle_height, self.height_text)
+
+    def update(self, result, params, legend_draggable=False):
+        """Перерисовывает шаблон под результат расчёта result (LinkResult) с исходными данными params."""
+        r = result
+        dist = r.dist
+        stopwatch = timing.Stopwatch()
+
+        self.earth.set_verts(_fill_verts(dist, r.earth_arc, EARTH_FILL_BOTTOM))
+        self.relief.set_verts(_fill_verts(dist, r.elev_curved, r.earth_arc))
+        self.fresnel.set_verts(_fill_verts(dist, r.los_line - r.f_radius, r.los_line + r.f_radius))
+        self.los.set_data(dist, r.los_line)
+        stopwatch.lap("plot.fill")
+
+        self.mast_start.set_data([dist[0], dist[0]], [r.ground_start, r.ant_start])
+        self.ant_start.set_data([dist[0]], [r.ant_start])
+        self.mast_end.set_data([dist[-1], dist[-1]], [r.ground_end, r.ant_end])
+        self.ant_end.set_data([dist[-1]], [r.ant_end])
+
+        for artist in self.interval_artists:
+            artist.set_visible(False)
+        has_segment = r.l0 > 0 and r.delta_y > 0 and r.left_cross is not None and r.right_cross is not None
+        if has_segment:
+            y_left_crit = np.interp(r.left_cross, dist, r.critical_line)
+            y_right_crit = np.interp(r.right_cross, dist, r.critical_line)
+            chord_x = [r.left_cross, r.right_cross]
+            chord_y = [y_left_crit, y_right_crit]
+
+        if r.interval == link_analysis.OPEN and has_segment:
+            self._show(self.bound_left, [r.left_cross], [y_left_crit])
+            self._show(self.bound_right, [r.right_cross], [y_right_crit])
+            self._show(self.chord, chord_x, chord_y, label=f'Хорда l₀ = {r.l0:.0f} м')
+            y_chord = np.interp(r.x_max, chord_x, chord_y)
+            self._show(self.apex_height, [r.x_max, r.x_max], [y_chord, r.y_max], label=f'Δy = {r.delta_y:.1f} м')
+            self._show(self.apex, [r.x_max], [r.y_max])
+            a = r.a
+            center_x = (r.left_cross + r.right_cross) / 2
+            chord_half = r.l0 / 2
+            if chord_half < a < MAX_ARC_RADIUS:
+                alpha = np.arcsin(chord_half / a)
+                theta = np.linspace(-alpha, alpha, ARC_POINTS)
+                center_y = y_left_crit + a - np.sqrt(a ** 2 - chord_half ** 2)
+                self._show(self.arc, center_x + a * np.sin(theta), center_y - a * np.cos(theta),
+                           label=f'Радиус a = {a / 1000:.1f} км')
+                self._show(self.arc_center, [center_x], [center_y])
+
+        elif r.interval == link_analysis.SEMI_OPEN:
+            x0, y0 = r.x0, r.y0
+            self._show(self.nearest, [x0], [y0])
+            self._show(self.perpendicular, [x0, r.x_proj], [y0, r.y_proj])
+            self._show(self.critical, dist, r.critical_line)
+            if has_segment:
+                h = r.delta_y
+                self._show(self.obstacle_left, [r.left_cross], [y_left_crit])
+                self._show(self.obstacle_right, [r.right_cross], [y_right_crit])
+                self._show(self.mn, chord_x, chord_y)
+                self.width_arrow.xy = (r.left_cross, y_left_crit - 5)
+                self.width_arrow.set_position((r.right_cross, y_left_crit - 5))
+                self.width_arrow.set_visible(True)
+                self.width_text.set_position(((r.left_cross + r.right_cross) / 2, y_left_crit - 15))
+                self.width_text.set_text(f'l = {r.l0:.0f} м')
+                self.width_text.set_visible(True)
+                y_mn_at_x0 = np.interp(x0, chord_x, chord_y)
+                self._show(self.obstacle_height, [x0, x0], [y_mn_at_x0, y0], label=f'h = {h:.1f} м')
+                self.height_text.set_position((x0 + 5, (y_mn_at_x0 + y0) / 2))
+                self.height_text.set_text(f'h = {h:.1f} м')
+                self.height_text.set_visible(True)
+
+        ax = self.ax
+        ax.set_xlim(0, r.total_dist)
+        y_min = min(0, np.min(r.earth_arc))
+        y_max = max(r.ant_start, r.ant_end, np.max(r.elev_curved)) * 1.15
+        ax.set_ylim(y_min, y_max)
+        ax.set_title(f"Профиль трассы (f = {params.freq_mhz} МГц)", color='black')
+        if self.params_text is not None:
+            params_text = _wrap(link_analysis.format_params(params))
+            self.params_text.set_text(params_text)
+            # Блок результатов - сразу под исходными данными (их длина зависит от переносов)
+            y = 0.9 - (params_text.count("\n") + 1) * self.text_line - 0.04
+            self.result_title.set_y(y)
+            self.result_text.set_y(y - 0.05)
+            self.result_text.set_text(_wrap(link_analysis.format_result(r, params)))
+        stopwatch.lap("plot.artists")
+
+        # Легенда собирается заново, только если изменился набор видимых элементов; при том же
+        # наборе (например, при перетаскивании точек трассы) меняются лишь тексты подписей
+        handles = [artist for artist in self.legend_order if artist.get_visible()]
+        labels = [artist.get_label() for artist in handles]
+        legend_key = (tuple(map(id, handles)), legend_draggable)
+        if legend_key != self.legend_key:
+            self.legend_key = legend_key
+            ax.legend(handles=handles, labels=labels, loc='best', frameon=True, facecolor='white', framealpha=0.7,
+                      fontsize=10, draggable=legend_draggable)
+        else:
+            for text, label in zip(ax.get_legend().get_texts(), labels):
+                text.set_text(label)
+        stopwatch.lap("plot.legend")
+
+    @staticmethod
+    def _show(line, x, y, label=None):
+        line.set_data(x, y)
+        if label is not None:
+            line.set_label(label)
+        line.set_visible(True)
@@ -0,0 +1,163 @@
+"""
+Пакетные отчёты по трассам: график профиля и тексты «Исходные данные» /
+«Результаты расчёта» в PNG/PDF для каждой строки входного файла.
+
+Отрисовка идёт без окон (Agg). Каждый рабочий процесс создаёт один шаблон
+profile_plot.ProfilePlot и для каждой трассы только обновляет данные его
+художников, поэтому стоимость трассы - расчёт и сохранение файла, а не
+построение фигуры.
+"""
+import collections
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import app_logic
+import batch_runner
+import link_analysis
+
+REPORT_FORMATS = ("png", "pdf")
+SUMMARY_NAME = "summary.jsonl"
+# Трасс в одном задании рабочего процесса
+CHUNK_SIZE = 16
+# Длина части имени файла из id трассы
+MAX_NAME_LENGTH = 64
+
+
+def _file_stem(number, link_id):
+    """Имя файла отчёта: номер строки (уникальность) и id без недопустимых символов."""
+    safe_id = re.sub(r"[^\w.-]+", "_", str(link_id)).strip("._")[:MAX_NAME_LENGTH]
+    return f"{number:06d}_{safe_id}" if safe_id else f"{number:06d}"
+
+
+def render_rows(source, plot, rows, output_dir, first_number=0, formats=REPORT_FORMATS, num_points=None,
+                method="bilinear"):
+    """
+    Расчёт трасс rows (словари как у batch_runner) и сохранение отчёта каждой
+    в output_dir в форматах formats через шаблон plot (ProfilePlot с текстами).
+    Профиль выбирается как в окне профиля (по умолчанию - адаптивно, билинейно).
+    Возвращает записи для summary.jsonl в порядке строк.
+    """
+    records = []
+    for k, row in enumerate(rows):
+        number = first_number + k
+        try:
+            link_id, p1, p2, fields = batch_runner.parse_row(row, number)
+        except (KeyError, TypeError, ValueError) as e:
+            records.append({"id": row.get("id") if isinstance(row, dict) else None,
+                            "error": f"Неверная строка: {e!r}"})
+            continue
+
+        try:
+            profile = app_logic.get_elevation_profile(source, p1, p2, num_points, method)
+        except ValueError as e:
+            # Адаптивная выборка сообщает об отсутствующих тайлах исключением
+            records.append({"id": link_id, "error": str(e)})
+            continue
+        if np.isnan(profile[1]).any():
+            records.append({"id": link_id, "error": "Нет тайлов высот для трассы"})
+            continue
+        try:
+            params = link_analysis.LinkParams(**fields)
+            result = link_analysis.analyze_link(profile, params)
+            plot.update(result, params)
+
+            stem = _file_stem(number, link_id)
+            files = []
+            for fmt in formats:
+                name = f"{stem}.{fmt}"
+                plot.fig.savefig(os.path.join(output_dir, name), format=fmt)
+                files.append(name)
+        except Exception as e:
+            # Сбой расчёта или записи одной трассы не прерывает отчёты остальных
+            records.append({"id": link_id, "error": f"Ошибка расчёта/отчёта: {e!r}"})
+            continue
+        records.append({
+            "id": link_id,
+            "interval": result.interval,
+            "P_rx": float(result.P_rx) if math.isfinite(result.P_rx) else None,
+            "passed": bool(result.passed),
+            "files": files,
+            "error": None,
+        })
+    return records
+
+
+# Источник высот и шаблон графика рабочего процесса (создаются в инициализаторе пула)
+_source = None
+_plot = None
+
+
+def _init_worker(tiles_dir, dpi):
+    global _source, _plot
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    import profile_plot
+
+    _source = app_logic.TileIndex(tiles_dir)
+    _plot = profile_plot.ProfilePlot(with_text=True, dpi=dpi)
+    FigureCanvasAgg(_plot.fig)
+
+
+def _render_chunk(rows, output_dir, first_number, formats, num_points, method):
+    """Рабочий процесс: отчёты пакета строк на шаблоне процесса."""
+    return render_rows(_source, _plot, rows, output_dir, first_number, formats, num_points, method)
+
+
+def render_reports(input_path, output_dir, tiles_dir=app_logic.MAPS_DIR, formats=REPORT_FORMATS, workers=None,
+                   num_points=None, method="bilinear", dpi=100, progress=None):
+    """
+    Отчёты по всем трассам input_path (CSV/JSONL как у batch_runner.run_batch)
+    в каталог output_dir и сводка summary.jsonl (id, интервал, P_rx, файлы,
+    ошибка) в порядке входного файла. Пакеты по CHUNK_SIZE трасс рисуются
+    в workers процессах; в работе не больше 2 * workers пакетов, поэтому
+    в памяти ограниченное число фигур и строк. Возвращает число трасс.
+    """
+    formats = tuple(fmt.lower() for fmt in formats)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    rows = batch_runner.read_rows(input_path)
+    chunks = iter(lambda: list(itertools.islice(rows, CHUNK_SIZE)), [])
+    done = 0
+
+    with open(os.path.join(output_dir, SUMMARY_NAME), "w", encoding="utf-8") as summary:
+        def write(records):
+            nonlocal done
+            for record in records:
+                summary.write(json.dumps(record, ensure_ascii=False) + "\n")
+            done += len(records)
+            if progress is not None:
+                progress(done)
+
+        if workers == 1:
+            _init_worker(tiles_dir, dpi)
+            for chunk in chunks:
+                write(_render_chunk(chunk, output_dir, done, formats, num_points, method))
+            return done
+
+        # spawn: рабочие процессы не наследуют потоки и окна интерфейса
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(tiles_dir, dpi)) as executor:
+            in_flight = collections.deque()
+            number = 0
+            try:
+                for chunk in chunks:
+                    in_flight.append(executor.submit(_render_chunk, chunk, output_dir, number, formats,
+                                                     num_points, method))
+                    number += len(chunk)
+                    # Сводка пишется по порядку: ждём самый старый пакет
+                    if len(in_flight) >= 2 * workers:
+                        write(in_flight.popleft().result())
+                while in_flight:
+                    write(in_flight.popleft().result())
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    return done
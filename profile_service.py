@@ -0,0 +1,402 @@
+"""
+Локальный HTTP/JSON-сервис профилей трасс и расчёта интервалов.
+
+Один процесс держит индекс тайлов открытым и обслуживает запросы других
+программ: POST /profile, POST /link (тело - объект или список объектов с
+полями lat1, lon1, lat2, lon2 и, для /link, полями LinkParams), GET /stats,
+GET /health. Запросы, пришедшие в пределах короткого окна, собираются в один
+векторный пакет (get_elevation_profiles / analyze_links_batch).
+"""
+import asyncio
+import bisect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import app_logic
+import batch_runner
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Окно сбора запросов в пакет, с
+BATCH_WINDOW = 0.005
+MAX_BATCH = 512
+# Запросов в очереди и в расчёте, сверх которых сервис отвечает 503
+MAX_PENDING = 4096
+MAX_BODY_BYTES = 4 * 1024 * 1024
+# Верхние границы интервалов гистограммы задержек, мс (последний - бесконечность)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class LatencyHistogram:
+    """Гистограмма задержек ответа с фиксированными интервалами LATENCY_BUCKETS_MS."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.statuses = {}
+
+    def observe(self, seconds, status=200):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile(self, q):
+        """Оценка квантиля сверху - граница интервала, в который он попадает, мс."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "max_ms": self.max,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets_ms": {**{str(b): n for b, n in zip(self.bounds, self.counts)}, "inf": self.counts[-1]},
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+        }
+
+
+class Overloaded(Exception):
+    """Очередь запросов заполнена."""
+
+
+class _Coalescer:
+    """
+    Сборщик запросов одного вида в пакеты. Пакет отправляется в пул потоков,
+    когда набралось max_batch запросов или прошло window с первого из них;
+    пока все потоки заняты, запросы продолжают копиться и уходят одним пакетом
+    сразу после освобождения потока.
+    """
+
+    def __init__(self, run_batch, executor, workers, window, max_batch):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.workers = workers
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []
+        self.running = 0
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+        self._timer = None
+
+    def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Все потоки заняты - пакет уйдёт по завершении текущего
+        while self.pending and self.running < self.workers:
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            self.running += 1
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self.running -= 1
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        if self.pending:
+            self._flush()
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items, "largest": self.largest,
+                "mean_size": self.items / self.batches if self.batches else None,
+                "queued": len(self.pending), "running": self.running}
+
+
+def _coords(item):
+    return (float(item["lat1"]), float(item["lon1"])), (float(item["lat2"]), float(item["lon2"]))
+
+
+def _sampling(item):
+    """
+    (число точек, метод) выборки профиля из запроса; points=null - адаптивная
+    выборка по ячейкам растра. Проверяется до сборки пакета, чтобы неверный
+    запрос не сорвал расчёт чужих запросов того же пакета.
+    """
+    points = item.get("points", 250)
+    try:
+        points = None if points is None else int(points)
+    except OverflowError:
+        # int(float("inf")) - JSON допускает Infinity
+        raise ValueError(f"points должно быть от 2 до {app_logic.MAX_PROFILE_POINTS}") from None
+    method = item.get("method", "nearest")
+    if points is not None and not 2 <= points <= app_logic.MAX_PROFILE_POINTS:
+        raise ValueError(f"points должно быть от 2 до {app_logic.MAX_PROFILE_POINTS}")
+    if method not in ("nearest", "bilinear"):
+        raise ValueError("method должен быть nearest или bilinear")
+    return points, method
+
+
+class ProfileService:
+    """
+    Сервис поверх источника высот source (обычно TileIndex со всеми тайлами
+    каталога). Расчёты выполняются в пуле из workers потоков, запросы к
+    /profile и /link объединяются в пакеты отдельно.
+    """
+
+    def __init__(self, source, workers=1, window=BATCH_WINDOW, max_batch=MAX_BATCH, max_pending=MAX_PENDING):
+        self.source = source
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="profile-service")
+        self.coalescers = {
+            "profile": _Coalescer(self._run_profiles, self.executor, workers, window, max_batch),
+            "link": _Coalescer(self._run_links, self.executor, workers, window, max_batch),
+        }
+        self.histograms = {}
+        self.pending = 0
+        self.rejected = 0
+        self.started = time.time()
+        self.routes = {
+            ("POST", "/profile"): self.profile,
+            ("POST", "/link"): self.link,
+            ("GET", "/stats"): self._stats,
+            ("GET", "/health"): self._health,
+        }
+
+    async def profile(self, body):
+        return await self._submit_all("profile", body)
+
+    async def link(self, body):
+        return await self._submit_all("link", body)
+
+    async def _stats(self, body):
+        return self.stats()
+
+    async def _health(self, body):
+        tiles = len(self.source.paths) if isinstance(self.source, app_logic.TileIndex) else 1
+        return {"status": "ok", "tiles": tiles}
+
+    def _run_profiles(self, items):
+        """Поток пула: профили пакета. Одинаковые трассы выбираются один раз."""
+        results = [None] * len(items)
+        groups = {}
+        for i, item in enumerate(items):
+            try:
+                p1, p2 = _coords(item)
+                groups.setdefault(_sampling(item), []).append((i, p1, p2))
+            except (KeyError, TypeError, ValueError) as e:
+                results[i] = {"error": f"Неверный запрос: {e!r}"}
+
+        for (num_points, method), members in groups.items():
+            if num_points is None:
+                # Адаптивная выборка даёт разное число точек - по одной трассе
+                for i, p1, p2 in members:
+                    try:
+                        dist, elev = app_logic.get_elevation_profile(self.source, p1, p2, None, method)
+                        results[i] = {"dist": dist.tolist(), "elev": elev.tolist()}
+                    except ValueError as e:
+                        results[i] = {"error": str(e)}
+                    except Exception as e:
+                        results[i] = {"error": f"Ошибка расчёта: {e!r}"}
+                continue
+            coords = np.array([(*p1, *p2) for _, p1, p2 in members])
+            try:
+                unique, inverse = np.unique(coords, axis=0, return_inverse=True)
+                dist, elev = app_logic.get_elevation_profiles(self.source, unique[:, :2], unique[:, 2:],
+                                                              num_points, method)
+            except Exception as e:
+                # Сбой одной группы не срывает остальные запросы пакета
+                for i, _, _ in members:
+                    results[i] = {"error": f"Ошибка расчёта: {e!r}"}
+                continue
+            no_data = np.isnan(elev).any(axis=1)
+            for (i, _, _), k in zip(members, inverse.ravel().tolist()):
+                if no_data[k]:
+                    results[i] = {"error": "Нет тайлов высот для трассы"}
+                else:
+                    results[i] = {"dist": dist[k].tolist(), "elev": elev[k].tolist()}
+        return results
+
+    def _run_links(self, items):
+        """Поток пула: расчёт интервалов пакета (как в пакетном режиме batch_runner)."""
+        results = [None] * len(items)
+        groups = {}
+        for i, item in enumerate(items):
+            try:
+                num_points, method = _sampling(item)
+                groups.setdefault((num_points or 250, method), []).append(i)
+            except (TypeError, ValueError) as e:
+                results[i] = {"error": f"Неверный запрос: {e!r}"}
+        for (num_points, method), members in groups.items():
+            try:
+                records = batch_runner.analyze_rows(self.source, [items[i] for i in members], 0, num_points,
+                                                    method)
+            except Exception as e:
+                # Сбой одной группы не срывает остальные запросы пакета
+                records = [{"error": f"Ошибка расчёта: {e!r}"} for _ in members]
+            for i, record in zip(members, records):
+                record["id"] = items[i].get("id")
+                results[i] = record
+        return results
+
+    async def _submit_all(self, kind, body):
+        """Тело - объект (ответ - объект) или список объектов (ответ - список)."""
+        items = body if isinstance(body, list) else [body]
+        if not all(isinstance(item, dict) for item in items):
+            raise ValueError("Ожидается объект JSON или список объектов")
+        if self.pending + len(items) > self.max_pending:
+            self.rejected += len(items)
+            raise Overloaded()
+        self.pending += len(items)
+        coalescer = self.coalescers[kind]
+        try:
+            results = await asyncio.gather(*(coalescer.submit(item) for item in items))
+        finally:
+            self.pending -= len(items)
+        return results if isinstance(body, list) else results[0]
+
+    def stats(self):
+        return {
+            "uptime_s": time.time() - self.started,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "batches": {kind: coalescer.stats() for kind, coalescer in self.coalescers.items()},
+            "endpoints": {path: histogram.as_dict() for path, histogram in self.histograms.items()},
+        }
+
+    async def dispatch(self, method, path, body):
+        """(статус, объект ответа) для запроса; задержка учитывается в гистограмме пути."""
+        start = time.perf_counter()
+        handler = self.routes.get((method, path))
+        if handler is None:
+            known = any(p == path for _, p in self.routes)
+            status, payload = (405, {"error": "Метод не поддерживается"}) if known else \
+                (404, {"error": "Неизвестный путь"})
+        else:
+            try:
+                payload = await handler(json.loads(body) if body else {})
+                status = 200
+            except Overloaded:
+                status, payload = 503, {"error": "Сервис перегружен, повторите запрос позже"}
+            except (ValueError, TypeError) as e:
+                status, payload = 400, {"error": str(e)}
+            except Exception as e:
+                status, payload = 500, {"error": repr(e)}
+        # Неизвестные пути - в общую гистограмму, чтобы их число не росло без ограничений
+        key = path if handler is not None else "other"
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        self.histograms[key].observe(time.perf_counter() - start, status)
+        return status, payload
+
+    async def handle_connection(self, reader, writer):
+        """Соединение HTTP/1.1 с поддержкой keep-alive (по запросу за раз)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._write(writer, 400, {"error": "Неверная строка запроса"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._write(writer, 413, {"error": "Слишком большой запрос"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method.upper(), target.split("?", 1)[0], body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Обслуживает запросы до отмены; ready(server) вызывается после открытия порта."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def preload_tiles(index):
+    """Читает все тайлы индекса в память (без memmap) - первые запросы не ждут диска."""
+    index.preload()
+
+
+def run(tiles_dir=app_logic.MAPS_DIR, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1, window=BATCH_WINDOW,
+        max_batch=MAX_BATCH, max_pending=MAX_PENDING, preload=False, ready=None):
+    """Запускает сервис в текущем потоке (до Ctrl+C)."""
+    index = app_logic.TileIndex(tiles_dir)
+    if preload:
+        preload_tiles(index)
+    service = ProfileService(index, workers=workers, window=window, max_batch=max_batch, max_pending=max_pending)
+    try:
+        asyncio.run(service.serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
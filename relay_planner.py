@@ -0,0 +1,279 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+import app_logic
+import batch_runner
+import elevation_index
+import geodesy
+import link_analysis
+import profile_cache
+
+
+@dataclass(slots=True)
+class HopTable:
+    """Результаты расчёта интервалов между парами площадок (массивы формы (n_hops,))."""
+    start: np.ndarray
+    end: np.ndarray
+    distance: np.ndarray
+    interval: np.ndarray
+    margin: np.ndarray
+
+    @property
+    def usable(self):
+        """Интервалы, пригодные для цепочки: не закрытые и с P_пр не ниже чувствительности."""
+        return ((self.interval == link_analysis.CODE_OPEN) | (self.interval == link_analysis.CODE_SEMI_OPEN)) \
+            & (self.margin >= 0)
+
+
+@dataclass(slots=True)
+class Hop:
+    start: int
+    end: int
+    distance: float
+    interval: str
+    margin: float
+
+
+@dataclass(slots=True)
+class RelayPlan:
+    """
+    Цепочка ретрансляторов: path - индексы площадок от начала до конца,
+    bottleneck - наименьший запас по мощности среди интервалов,
+    T_i - доля допустимой ненадёжности на интервал при M = числу интервалов.
+    """
+    path: list
+    hops: list
+    bottleneck: float
+    T_i: float
+
+    @property
+    def n_hops(self):
+        return len(self.hops)
+
+
+def candidate_pairs(lats, lons, max_distance):
+    """
+    Пары площадок (i < j) не дальше max_distance, м. Отсев по расстоянию
+    делается до анализа профилей, по матрице расстояний целиком.
+    Возвращает (start, end, distance).
+    """
+    distances = geodesy.pairwise_distances(lats, lons, lats, lons)
+    start, end = np.nonzero(np.triu(distances <= max_distance, k=1))
+    return start, end, distances[start, end]
+
+
+def _source_spec(source):
+    """Описание источника высот для рабочих процессов (без передачи самих данных) или None."""
+    if isinstance(source, app_logic.TileIndex):
+        return "index", dict(source.paths)
+    if isinstance(source, (str, os.PathLike)):
+        return "path", os.fspath(source)
+    path = getattr(source, "path", None)
+    return None if path is None else ("path", path)
+
+
+# Открытые источник и кэш в рабочем процессе (переиспользуются между пакетами)
+_worker_state = {}
+
+
+def _worker_resources(spec, cache_path):
+    key = (repr(spec), cache_path)
+    if _worker_state.get("key") != key:
+        kind, value = spec
+        if kind == "index":
+            source = app_logic.TileIndex()
+            source.paths.update(value)
+        else:
+            source = app_logic.open_raster(value)
+        cache = profile_cache.ProfileCache(path=cache_path) if cache_path is not None else None
+        _worker_state.update(key=key, source=source, cache=cache)
+    return _worker_state["source"], _worker_state["cache"]
+
+
+def _evaluate_chunk(source, cache, starts, ends, h1, h2, params, num_points):
+    dist, elev = app_logic.get_elevation_profiles(source, starts, ends, num_points, cache=cache)
+    batch = link_analysis.analyze_links_batch(dist, elev, replace(params, h1=h1, h2=h2))
+    # Трасса выходит за загруженные тайлы - интервал считать нельзя
+    margin = np.where(np.isnan(elev).any(axis=1), -np.inf, batch.margin)
+    return batch.interval, margin
+
+
+def _evaluate_chunk_worker(spec, cache_path, starts, ends, h1, h2, params, num_points):
+    source, cache = _worker_resources(spec, cache_path)
+    return _evaluate_chunk(source, cache, starts, ends, h1, h2, params, num_points)
+
+
+def evaluate_hops(source, lats, lons, pairs, params, heights=None, num_points=250, chunk_size=1024,
+                  workers=None, cache=None, early_out=True, progress=None):
+    """
+    Пакетный расчёт интервалов для пар площадок pairs = (start, end, distance).
+    heights - высоты подвеса антенн на площадках (по умолчанию params.h1 везде).
+    Пары делятся на пакеты по chunk_size трасс: профили каждого пакета
+    выбираются одним обращением к растру и считаются analyze_links_batch.
+    При workers > 1 пакеты обрабатываются в пуле процессов, которые сами
+    открывают тайлы по путям; растр в памяти без файла считается в текущем процессе.
+    cache - ProfileCache; рабочие процессы используют его файл на диске.
+    early_out - сначала отсеять заведомо закрытые интервалы по индексу блоков
+    (elevation_index) без построения профилей; остальные считаются полностью.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    heights = np.broadcast_to(np.asarray(params.h1 if heights is None else heights, dtype=float), lats.shape)
+    start, end, distance = pairs
+    n = len(start)
+    interval = np.full(n, link_analysis.CODE_NONE, dtype=np.int8)
+    margin = np.full(n, -np.inf)
+
+    todo = np.arange(n)
+    if early_out and isinstance(source, (app_logic.TileIndex, app_logic.HGTTile)) and n:
+        codes = elevation_index.classify_links(
+            source, np.column_stack((lats[start], lons[start])), np.column_stack((lats[end], lons[end])),
+            heights[start], heights[end], params.freq_mhz)
+        blocked = codes == elevation_index.BLOCKED
+        interval[blocked] = link_analysis.CODE_CLOSED
+        todo = np.flatnonzero(~blocked)
+
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+
+    def chunk_args(idx):
+        return (np.column_stack((lats[start[idx]], lons[start[idx]])),
+                np.column_stack((lats[end[idx]], lons[end[idx]])),
+                heights[start[idx]], heights[end[idx]], params, num_points)
+
+    workers = workers or os.cpu_count() or 1
+    spec = _source_spec(source)
+    if workers > 1 and spec is not None and len(chunks) > 1:
+        cache_path = cache.path if cache is not None else None
+        # spawn: рабочие процессы не наследуют потоки и окна интерфейса
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {executor.submit(_evaluate_chunk_worker, spec, cache_path, *chunk_args(idx)): idx
+                       for idx in chunks}
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    idx = futures[future]
+                    interval[idx], margin[idx] = future.result()
+                    if progress is not None:
+                        progress(done / len(chunks))
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    else:
+        for done, idx in enumerate(chunks, start=1):
+            interval[idx], margin[idx] = _evaluate_chunk(source, cache, *chunk_args(idx))
+            if progress is not None:
+                progress(done / len(chunks))
+
+    return HopTable(start=np.asarray(start), end=np.asarray(end), distance=np.asarray(distance, dtype=float),
+                    interval=interval, margin=margin)
+
+
+def best_chain(hops, n_sites, start, end, max_hops=None):
+    """
+    Лучшая цепочка от площадки start до end по пригодным интервалам.
+    Критерий лексикографический: меньше интервалов, затем больше наименьший
+    запас по мощности. Метка (число интервалов, -запас) при продлении пути
+    не убывает, поэтому алгоритм Дейкстры находит оптимум.
+    Возвращает (path, bottleneck) или None, если цепочки нет.
+    """
+    usable = hops.usable
+    adjacency = [[] for _ in range(n_sites)]
+    for i, j, m in zip(hops.start[usable].tolist(), hops.end[usable].tolist(), hops.margin[usable].tolist()):
+        adjacency[i].append((j, m))
+        adjacency[j].append((i, m))
+
+    best = {start: (0, -np.inf)}
+    previous = {}
+    queue = [(0, -np.inf, start)]
+    while queue:
+        n_hops, neg_bottleneck, site = heapq.heappop(queue)
+        if best.get(site) != (n_hops, neg_bottleneck):
+            continue
+        if site == end:
+            break
+        if max_hops is not None and n_hops >= max_hops:
+            continue
+        for neighbour, m in adjacency[site]:
+            label = (n_hops + 1, max(neg_bottleneck, -m))
+            if neighbour not in best or label < best[neighbour]:
+                best[neighbour] = label
+                previous[neighbour] = site
+                heapq.heappush(queue, (*label, neighbour))
+
+    if end not in best:
+        return None
+    path = [end]
+    while path[-1] != start:
+        path.append(previous[path[-1]])
+    return path[::-1], -best[end][1]
+
+
+def plan_relay_chain(source, lats, lons, start, end, params, max_distance, heights=None, num_points=250,
+                     workers=None, cache=None, early_out=True, max_hops=None, progress=None):
+    """
+    Цепочка ретрансляторов между площадками start и end (индексы в lats/lons)
+    через кандидатов из того же списка. Возвращает (RelayPlan или None, HopTable).
+    """
+    pairs = candidate_pairs(lats, lons, max_distance)
+    hops = evaluate_hops(source, lats, lons, pairs, params, heights, num_points,
+                         workers=workers, cache=cache, early_out=early_out, progress=progress)
+    found = best_chain(hops, len(lats), start, end, max_hops)
+    if found is None:
+        return None, hops
+    path, bottleneck = found
+
+    # Индекс интервала по неупорядоченной паре площадок
+    lookup = {(min(i, j), max(i, j)): k for k, (i, j) in enumerate(zip(hops.start.tolist(), hops.end.tolist()))}
+    chain = []
+    for i, j in zip(path, path[1:]):
+        k = lookup[(min(i, j), max(i, j))]
+        chain.append(Hop(start=i, end=j, distance=float(hops.distance[k]),
+                         interval=link_analysis.INTERVALS[hops.interval[k]], margin=float(hops.margin[k])))
+    # Допустимая ненадёжность делится поровну между M интервалами цепочки
+    T_i = (100 - params.reliability) / len(chain) if chain else 0.0
+    return RelayPlan(path=path, hops=chain, bottleneck=bottleneck, T_i=T_i), hops
+
+
+def read_sites(path, default_height=None):
+    """
+    Площадки-кандидаты из CSV/JSONL (id, lat, lon и необязательная height -
+    высота подвеса, м; пустая заменяется на default_height).
+    Возвращает (ids, lats, lons, heights или None, если высоты не заданы).
+    """
+    ids, lats, lons, heights = [], [], [], []
+    for number, row in enumerate(batch_runner.read_rows(path)):
+        try:
+            ids.append(str(row.get("id") or number))
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+            height = row.get("height")
+            heights.append(float(height) if height not in (None, "") else np.nan)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Неверная строка {number + 1} файла площадок: {e!r}") from None
+    if len(set(ids)) != len(ids):
+        raise ValueError("Идентификаторы площадок повторяются")
+    heights = np.array(heights)
+    if np.isnan(heights).all():
+        return ids, np.array(lats), np.array(lons), None
+    if default_height is None and np.isnan(heights).any():
+        raise ValueError("Высота подвеса задана не для всех площадок")
+    return ids, np.array(lats), np.array(lons), np.where(np.isnan(heights), default_height or 0.0, heights)
+
+
+def plan_to_dict(plan, ids, lats, lons):
+    """Цепочка в виде словаря для JSON: площадки пути и интервалы с их запасами."""
+    if plan is None:
+        return {"found": False}
+    return {
+        "found": True,
+        "sites": [{"id": ids[i], "lat": float(lats[i]), "lon": float(lons[i])} for i in plan.path],
+        "hops": [{"start": ids[hop.start], "end": ids[hop.end], "distance_m": hop.distance,
+                  "interval": hop.interval, "margin": hop.margin} for hop in plan.hops],
+        "bottleneck": plan.bottleneck,
+        "T_i": plan.T_i,
+    }
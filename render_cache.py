@@ -0,0 +1,231 @@
+import functools
+import hashlib
+import math
+import os
+import tempfile
+from dataclasses import astuple, dataclass
+
+import numpy as np
+
+import app_logic
+import geodesy
+
+# Каталог готовых RGBA-изображений уровней пирамид между запусками программы
+RENDER_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "srtm_map_project", "render")
+RENDER_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# Меняется при изменении алгоритма отрисовки, чтобы старые файлы не использовались
+RENDER_VERSION = 1
+
+LUT_SIZE = 256
+# Строк матрицы за один проход: ограничивает временные массивы на тайлах SRTM1
+BAND_ROWS = 512
+# Уклон, при котором слой уклонов даёт максимальное затемнение, градусы
+SLOPE_FULL_SHADE = 45.0
+
+# Затенение рельефа: без затенения, теневая отмывка, уклоны
+SHADINGS = ("none", "hillshade", "slope")
+
+
+@dataclass(frozen=True, slots=True)
+class MapStyle:
+    """
+    Стиль отрисовки карты высот: шкала цветов vmin..vmax (общая для мозаики),
+    затенение shading и его параметры. Входит в ключ кэша изображений.
+    """
+    vmin: float
+    vmax: float
+    cmap: str = "terrain"
+    shading: str = "none"
+    azimuth: float = 315.0
+    altitude: float = 45.0
+    z_factor: float = 1.0
+    strength: float = 0.6
+
+
+def style_for(pyramids, shading="none", **kwargs):
+    """MapStyle с общей шкалой цветов для всех тайлов мозаики."""
+    ranges = np.array([pyramid.value_range() for pyramid in pyramids])
+    return MapStyle(vmin=float(ranges[:, 0].min()), vmax=float(ranges[:, 1].max()), shading=shading, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def colormap_lut(name):
+    """Таблица цветов (LUT_SIZE, 4) uint8 - те же байты, что даёт imshow с этой шкалой."""
+    from matplotlib import colormaps
+
+    return colormaps[name].resampled(LUT_SIZE)(np.arange(LUT_SIZE), bytes=True)
+
+
+def _lut_index(band, style):
+    """Индексы таблицы цветов как у Normalize(vmin, vmax): ниже шкалы (и пустоты) - первый цвет."""
+    scale = LUT_SIZE / max(style.vmax - style.vmin, 1e-9)
+    index = np.floor((band.astype(np.float32) - style.vmin) * scale)
+    return np.clip(index, 0, LUT_SIZE - 1).astype(np.intp)
+
+
+def _shade(band, cell_y, cell_x, style):
+    """
+    Множитель яркости (rows, cols) для затенения. Градиент считается в метрах
+    (cell_y < 0: строки идут с севера на юг, поэтому gy - производная к северу).
+    hillshade - освещённость склона от источника (azimuth, altitude), нормированная
+    так, что ровная поверхность не меняет цвет; slope - затемнение по крутизне.
+    Пустоты не затеняются.
+    """
+    z = np.where(band == app_logic.HGT_VOID, np.nan, band.astype(np.float32))
+    gy, gx = np.gradient(z, cell_y, cell_x)
+    gx *= style.z_factor
+    gy *= style.z_factor
+    if style.shading == "slope":
+        slope = np.degrees(np.arctan(np.hypot(gx, gy)))
+        factor = 1 - style.strength * np.clip(slope / SLOPE_FULL_SHADE, 0, 1)
+    else:
+        azimuth, altitude = math.radians(style.azimuth), math.radians(style.altitude)
+        lx, ly, lz = math.sin(azimuth) * math.cos(altitude), math.cos(azimuth) * math.cos(altitude), \
+            math.sin(altitude)
+        # Скалярное произведение нормали (-gx, -gy, 1) на направление на источник света
+        light = (lz - gx * lx - gy * ly) / np.sqrt(gx * gx + gy * gy + 1)
+        factor = 1 + style.strength * (np.maximum(light, 0) / lz - 1)
+    return np.nan_to_num(factor, nan=1.0)
+
+
+def render_level(matrix, cell_y, cell_x, style, out=None):
+    """
+    RGBA-изображение (rows, cols, 4) uint8 матрицы высот в стиле style.
+    cell_y, cell_x - шаг сетки в метрах (для затенения). Матрица обрабатывается
+    полосами по BAND_ROWS строк (с перекрытием в строку для градиента), так что
+    временные массивы не зависят от размера тайла. out - готовый массив для
+    результата (например, np.memmap файла кэша).
+    """
+    n_rows, n_cols = matrix.shape
+    rgba = np.empty((n_rows, n_cols, 4), dtype=np.uint8) if out is None else out
+    lut = colormap_lut(style.cmap)
+    shaded = style.shading != "none" and n_rows >= 2 and n_cols >= 2
+    for r0 in range(0, n_rows, BAND_ROWS):
+        r1 = min(r0 + BAND_ROWS, n_rows)
+        rgba[r0:r1] = lut[_lut_index(np.asarray(matrix[r0:r1]), style)]
+        if shaded:
+            lo, hi = max(r0 - 1, 0), min(r1 + 1, n_rows)
+            factor = _shade(np.asarray(matrix[lo:hi]), cell_y, cell_x, style)[r0 - lo:r1 - lo]
+            rgb = rgba[r0:r1, :, :3]
+            rgb[...] = np.clip(rgb * factor[..., None], 0, 255)
+    return rgba
+
+
+def cell_size_m(transform, shape, factor=1):
+    """Шаг сетки уровня factor в метрах (по широте - отрицательный) в середине растра."""
+    a, _, _, _, e, top = transform
+    lat = top + e * shape[0] / 2
+    return (e * factor * geodesy.METERS_PER_DEGREE,
+            a * factor * geodesy.METERS_PER_DEGREE * math.cos(math.radians(lat)))
+
+
+class MapLayers:
+    """Готовые RGBA-изображения уровней пирамиды одного тайла в одном стиле."""
+
+    def __init__(self, pyramid, style, levels):
+        self.pyramid = pyramid
+        self.style = style
+        self.levels = levels
+
+    @property
+    def extent(self):
+        return self.pyramid.extent
+
+    def select(self, xlim, ylim, width_px, height_px):
+        """Как Pyramid.select, но возвращает окно RGBA-изображения: (rgba, extent) или None."""
+        selected = self.pyramid.window(xlim, ylim, width_px, height_px)
+        if selected is None:
+            return None
+        factor, rows, cols, extent = selected
+        return self.levels[factor][rows, cols], extent
+
+
+def _cache_key(path, style, factor):
+    identity = app_logic.file_identity(path)
+    return hashlib.sha1(repr((RENDER_VERSION, identity, astuple(style), factor)).encode("utf-8")).hexdigest()
+
+
+def _prune(cache_dir, max_bytes):
+    """Удаляет давно не использованные изображения, пока каталог больше max_bytes."""
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith(".npy")]
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _cached_level(path, matrix, cell, style, factor, cache_dir):
+    """RGBA уровня из файла кэша (отображается в память) или отрисованный и записанный туда."""
+    cache_path = os.path.join(cache_dir, _cache_key(path, style, factor) + ".npy")
+    shape = matrix.shape + (4,)
+    try:
+        rgba = np.load(cache_path, mmap_mode="r")
+        if rgba.shape == shape and rgba.dtype == np.uint8:
+            # Время изменения - метка использования для вытеснения старых файлов
+            os.utime(cache_path)
+            return rgba
+    except (OSError, ValueError):
+        pass
+
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Своё временное имя у каждого потока и процесса: загрузка и перерисовка карты
+        # могут одновременно писать один и тот же уровень. Суффикс не .npy - _prune
+        # не трогает недописанные файлы
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix="render_", suffix=".tmp")
+        os.close(fd)
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=shape)
+        render_level(matrix, *cell, style, out=out)
+        out.flush()
+        del out
+        os.replace(tmp_path, cache_path)
+        return np.load(cache_path, mmap_mode="r")
+    except OSError:
+        # Каталог кэша недоступен для записи - изображение остаётся в памяти
+        _remove(tmp_path)
+        return render_level(matrix, *cell, style)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+
+def _remove(path):
+    if path is not None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_layers(pyramid, style, cache_dir=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES, check=None):
+    """
+    MapLayers для пирамиды: все уровни отрисовываются один раз и для тайлов
+    с путём хранятся в cache_dir по ключу (идентичность тайла, стиль, уровень),
+    поэтому повторная загрузка и перерисовка карты только читают готовые байты.
+    check() вызывается перед каждым уровнем (например, Job.check для отмены).
+    """
+    path = getattr(pyramid.raster, "path", None)
+    transform = pyramid.raster.transform
+    shape = pyramid.raster.matrix.shape
+    levels = {}
+    for factor, matrix in pyramid.levels.items():
+        if check is not None:
+            check()
+        cell = cell_size_m(transform, shape, factor)
+        if path is None or cache_dir is None:
+            levels[factor] = render_level(matrix, *cell, style)
+        else:
+            levels[factor] = _cached_level(path, matrix, cell, style, factor, cache_dir)
+    if path is not None and cache_dir is not None:
+        _prune(cache_dir, max_bytes)
+    return MapLayers(pyramid, style, levels)
@@ -0,0 +1,232 @@
+"""
+Лёгкие замеры времени этапов горячих операций.
+
+Операция интерфейса (загрузка карты, перерисовка, окно профиля) описывается
+объектом Trace; участки внутри неё отмечаются span(). Пока замеры выключены,
+span() возвращает общий пустой контекст и почти ничего не стоит.
+
+Включение: переменные окружения SRTM_TIMING=1, SRTM_TIMING_TRACE=<файл .jsonl>,
+SRTM_PROFILE=<имя операции> или configure() (флаги main.py).
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+ENABLED = bool(os.environ.get("SRTM_TIMING"))
+# Файл JSON Lines: по строке на завершённую операцию
+TRACE_PATH = os.environ.get("SRTM_TIMING_TRACE") or None
+# Имя операции, следующий запуск которой снимается cProfile
+PROFILE_OPERATION = os.environ.get("SRTM_PROFILE") or None
+
+_NULL = contextlib.nullcontext()
+_lock = threading.Lock()
+_local = threading.local()
+# Накопительные счётчики: имя -> [число, суммарное время, максимум]
+_totals = {}
+
+
+def configure(enabled=None, trace_path=None, profile_operation=None):
+    """Включает/выключает замеры, задаёт файл трассы и операцию для cProfile."""
+    global ENABLED, TRACE_PATH, PROFILE_OPERATION
+    if trace_path is not None or profile_operation is not None:
+        # Трасса или профиль без замеров не имеют смысла
+        enabled = True if enabled is None else enabled
+    if enabled is not None:
+        ENABLED = bool(enabled)
+    if trace_path is not None:
+        TRACE_PATH = trace_path
+    if profile_operation is not None:
+        PROFILE_OPERATION = profile_operation
+
+
+def _record(name, seconds):
+    with _lock:
+        total = _totals.get(name)
+        if total is None:
+            _totals[name] = [1, seconds, seconds]
+        else:
+            total[0] += 1
+            total[1] += seconds
+            total[2] = max(total[2], seconds)
+
+
+def _add(name, seconds):
+    """Участок в накопительные счётчики и в активную Trace потока."""
+    _record(name, seconds)
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """Контекст замера участка name; попадает в счётчики и в активную Trace потока."""
+    return _Span(name) if ENABLED else _NULL
+
+
+class Stopwatch:
+    """
+    Замер последовательных этапов без вложенных блоков: lap(name) записывает
+    время от предыдущего lap() (или создания) как участок name.
+    """
+    __slots__ = ("last",)
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        if not ENABLED:
+            return
+        now = time.perf_counter()
+        _add(name, now - self.last)
+        self.last = now
+
+
+def count(name, n=1):
+    """Увеличивает счётчик события name (без времени), например попадания в кэш."""
+    if ENABLED:
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.count(name, n)
+        with _lock:
+            total = _totals.setdefault(name, [0, 0.0, 0.0])
+            total[0] += n
+
+
+def counters():
+    """Снимок накопительных счётчиков: имя -> (число, суммарное время, максимум), с."""
+    with _lock:
+        return {name: tuple(total) for name, total in _totals.items()}
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+class Trace:
+    """
+    Замер одной операции, которая может выполняться в нескольких потоках
+    (рабочий поток задачи и поток Tk): участки добавляются в ту Trace, которая
+    активна в потоке через activate(). finish() пишет итог в файл трассы.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.enabled = ENABLED
+        self.started = time.time()
+        self.wall_start = time.perf_counter()
+        self.wall = None
+        self.spans = []
+        self.counts = {}
+        self.profiler = None
+        self.profile_path = None
+        self._lock = threading.Lock()
+        if self.enabled and PROFILE_OPERATION == name:
+            _arm_profiler(self)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans.append((name, seconds, threading.current_thread().name))
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Участки span() в этом потоке внутри блока относятся к этой операции."""
+        if not self.enabled:
+            yield self
+            return
+        previous = getattr(_local, "trace", None)
+        _local.trace = self
+        profiling = False
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+                profiling = True
+            except ValueError:
+                # Профилировщик уже работает в другом потоке
+                pass
+        try:
+            yield self
+        finally:
+            if profiling:
+                self.profiler.disable()
+            _local.trace = previous
+
+    def totals(self):
+        """Суммарное время по именам участков в порядке первого появления."""
+        totals = {}
+        with self._lock:
+            for name, seconds, _ in self.spans:
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def finish(self):
+        """Завершает операцию: общее время, запись в файл трассы и сохранение профиля."""
+        if not self.enabled or self.wall is not None:
+            return self
+        self.wall = time.perf_counter() - self.wall_start
+        _record(self.name, self.wall)
+        if self.profiler is not None:
+            try:
+                self.profiler.dump_stats(self.profile_path)
+            except OSError:
+                self.profile_path = None
+        if TRACE_PATH is not None:
+            record = {
+                "operation": self.name,
+                "started": self.started,
+                "wall_ms": self.wall * 1000,
+                "spans": [{"name": name, "ms": seconds * 1000, "thread": thread}
+                          for name, seconds, thread in self.spans],
+                "counts": self.counts,
+                "profile": self.profile_path,
+            }
+            try:
+                with _lock, open(TRACE_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                # Трасса - вспомогательная, ошибка записи не должна ломать операцию
+                pass
+        return self
+
+    def summary(self, limit=6):
+        """Строка для строки состояния: общее время и самые долгие участки, мс."""
+        if self.wall is None:
+            return ""
+        parts = sorted(self.totals().items(), key=lambda item: -item[1])[:limit]
+        text = f"{self.name}: {self.wall * 1000:.0f} мс"
+        if parts:
+            text += " (" + ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in parts) + ")"
+        if self.counts:
+            text += " " + " ".join(f"{name}={n}" for name, n in self.counts.items())
+        return text
+
+
+def _arm_profiler(trace):
+    """Профиль снимается один раз: следующие операции с тем же именем не профилируются."""
+    global PROFILE_OPERATION
+    import cProfile
+
+    PROFILE_OPERATION = None
+    trace.profiler = cProfile.Profile()
+    trace.profile_path = os.path.abspath(f"{trace.name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")